@@ -0,0 +1,364 @@
+"""Benchmarks for the conversion and ingestion hot paths, run on synthetic SPX-sized and small-cap chains."""
+
+# Standard libraries
+import argparse
+import csv
+from datetime import datetime, timedelta
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+# External dependencies
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+import numpy as np
+from pymongo import MongoClient
+
+# Application-specific imports
+from chain_analytics import chain_summary
+from chain_json import JSON_DECODERS, JsonDecoder
+from hod_chain import HOD_COLUMNS, hod_document, tos_to_columns, tos_to_hod
+from option_greeks import GREEK_COLUMNS, GreeksModel
+from options_data_downloader import OptionsDataDownloader, hod_data_to_csv
+
+# Constants
+BENCHMARK_DATE = "20200102"
+CHAIN_SIZES = {
+    # name: (number of chains, expirations per chain, strikes per expiration)
+    "spx": (2, 40, 150),
+    "small_cap": (200, 6, 12),
+}
+REGRESSION_TOLERANCE = 0.1
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+RSS_UNITS_PER_MB = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+
+def make_synthetic_tos_chain(symbol: str, expirations: int, strikes: int, seed: int = 0) -> Dict:
+    """Builds a ToS chain response with the same shape and value ranges as a real one."""
+    rng = random.Random(seed)
+    underlying_price = round(rng.uniform(5, 3500), 2)
+    strike_step = max(0.5, round(underlying_price / strikes / 2, 1))
+    first_strike = max(strike_step, underlying_price - strike_step * strikes / 2)
+    strike_prices = [round(first_strike + strike_step * i, 1) for i in range(strikes)]
+    tos_data = {
+        "symbol": symbol,
+        "status": "SUCCESS",
+        "underlying": None,
+        "underlyingPrice": underlying_price,
+        "numberOfContracts": 2 * expirations * strikes,
+        "callExpDateMap": {},
+        "putExpDateMap": {},
+    }
+    for option_type, put_call in [("callExpDateMap", "CALL"), ("putExpDateMap", "PUT")]:
+        for expiration_num in range(expirations):
+            days_to_expiration = 7 * expiration_num + 1
+            expiration = datetime.strptime(BENCHMARK_DATE, "%Y%m%d") + timedelta(days=days_to_expiration)
+            tos_data[option_type][expiration.strftime("%Y-%m-%d") + ":" + str(days_to_expiration)] = {
+                str(strike): [make_synthetic_contract(rng, put_call, expiration, strike, underlying_price)]
+                for strike in strike_prices
+            }
+    return tos_data
+
+
+def make_synthetic_contract(
+    rng: random.Random, put_call: str, expiration: datetime, strike: float, underlying_price: float
+) -> Dict:
+    bid = round(rng.uniform(0, underlying_price / 10), 2)
+    return {
+        "putCall": put_call,
+        "symbol": expiration.strftime("%m%d%y") + put_call[0] + str(strike),
+        "exchangeName": "OPR",
+        "bid": bid,
+        "ask": round(bid + rng.uniform(0.01, 1), 2),
+        "last": round(bid + rng.uniform(0, 0.5), 2),
+        "totalVolume": rng.randint(0, 5000),
+        "openInterest": rng.randint(0, 50000),
+        "volatility": rng.choice([None, round(rng.uniform(5, 150), 3)]),
+        "delta": round(rng.uniform(-1, 1), 3),
+        "gamma": round(rng.uniform(0, 0.2), 3),
+        "theta": rng.choice([None, round(rng.uniform(-2, 0), 3)]),
+        "vega": round(rng.uniform(0, 1), 3),
+        "strikePrice": strike,
+    }
+
+
+def make_synthetic_chains(size: str) -> List[Dict]:
+    number_of_chains, expirations, strikes = CHAIN_SIZES[size]
+    # Pickle file names are split on "_", so the synthetic symbols must not contain one
+    prefix = size.replace("_", "").upper()
+    return [make_synthetic_tos_chain(prefix + str(i), expirations, strikes, i) for i in range(number_of_chains)]
+
+
+def write_synthetic_pickles(folder: str, chains: List[Dict]):
+    for tos_data in chains:
+        with open(os.path.join(folder, tos_data["symbol"] + "_" + BENCHMARK_DATE + "_data.pkl"), "wb") as p_data:
+            pickle.dump(tos_data, p_data)
+
+
+def write_synthetic_l2_csv(csv_path: str, chains: List[Dict]):
+    with open(csv_path, "w", newline="") as csv_file:
+        csv_writer = csv.DictWriter(csv_file, HOD_COLUMNS)
+        csv_writer.writeheader()
+        for tos_data in chains:
+            csv_writer.writerows(tos_to_hod(tos_data, BENCHMARK_DATE)["chain"])
+
+
+def get_benchmark_db(mongo_uri: str = None):
+    if mongo_uri:
+        client = MongoClient(mongo_uri)
+        client.drop_database("options_benchmark")
+        return client.options_benchmark
+    if mongomock is None:
+        return None
+    return mongomock.MongoClient().options
+
+
+def run_stage(stage_name: str, size: str, mongo_uri: str = None) -> Dict:
+    """Prepares and measures one stage; measureRssMb is how much the peak RSS grew while measuring."""
+    make_stage, _ = STAGES[stage_name]
+    with tempfile.TemporaryDirectory() as work_dir:
+        downloader = OptionsDataDownloader()
+        downloader.db_handle = get_benchmark_db(mongo_uri)
+        # mongomock rejects the upserts of current pymongo versions, so only a real mongod gets the derived writes
+        downloader.derived_writes = bool(mongo_uri)
+        prepare, measure = make_stage(size)(work_dir, downloader)
+        prepare()
+        prepared_rss_mb = peak_rss_mb()
+        start = time.perf_counter()
+        contracts = measure()
+        seconds = time.perf_counter() - start
+    rss_mb = peak_rss_mb()
+    return {
+        "contracts": contracts,
+        "seconds": seconds,
+        "contractsPerSecond": contracts / seconds if seconds else 0.0,
+        "peakRssMb": rss_mb,
+        "measureRssMb": rss_mb - prepared_rss_mb,
+    }
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RSS_UNITS_PER_MB
+
+
+def convert_stage(size: str) -> Callable:
+    def stage(work_dir, downloader):  # pylint: disable=unused-argument
+        chains = []
+
+        def prepare():
+            chains.extend(make_synthetic_chains(size))
+
+        def measure():
+            return sum(len(tos_to_columns(tos_data, BENCHMARK_DATE)) for tos_data in chains)
+
+        return prepare, measure
+
+    return stage
+
+
+def decode_stage(decoder_name: str) -> Callable:
+    def make_stage(size: str) -> Callable:
+        def stage(work_dir, downloader):  # pylint: disable=unused-argument
+            bodies = []
+            decoder = JsonDecoder(decoder_name)
+
+            def prepare():
+                bodies.extend(json.dumps(tos_data).encode() for tos_data in make_synthetic_chains(size))
+
+            def measure():
+                return sum(len(tos_to_columns(decoder.decode(body), BENCHMARK_DATE)) for body in bodies)
+
+            return prepare, measure
+
+        return stage
+
+    return make_stage
+
+
+def greeks_stage(size: str) -> Callable:
+    def stage(work_dir, downloader):  # pylint: disable=unused-argument
+        chains = []
+        model = GreeksModel()
+
+        def prepare():
+            for tos_data in make_synthetic_chains(size):
+                chain_columns = tos_to_columns(tos_data, BENCHMARK_DATE)
+                for name in GREEK_COLUMNS:
+                    chain_columns.columns[name][:] = np.nan
+                chains.append(chain_columns)
+
+        def measure():
+            for chain_columns in chains:
+                model.fill_chain(chain_columns)
+            return sum(len(chain_columns) for chain_columns in chains)
+
+        return prepare, measure
+
+    return stage
+
+
+def analytics_stage(size: str) -> Callable:
+    def stage(work_dir, downloader):  # pylint: disable=unused-argument
+        documents = []
+
+        def prepare():
+            for tos_data in make_synthetic_chains(size):
+                documents.append(hod_document(tos_to_columns(tos_data, BENCHMARK_DATE)))
+
+        def measure():
+            for document in documents:
+                chain_summary(document)
+            return sum(len(document["chain"]) for document in documents)
+
+        return prepare, measure
+
+    return stage
+
+
+def hod_rows_stage(size: str) -> Callable:
+    def stage(work_dir, downloader):  # pylint: disable=unused-argument
+        chains = []
+
+        def prepare():
+            chains.extend(make_synthetic_chains(size))
+
+        def measure():
+            return sum(len(tos_to_hod(tos_data, BENCHMARK_DATE)["chain"]) for tos_data in chains)
+
+        return prepare, measure
+
+    return stage
+
+
+def hod_csv_stage(size: str) -> Callable:
+    def stage(work_dir, downloader):  # pylint: disable=unused-argument
+        hod_data = []
+
+        def prepare():
+            hod_data.extend(tos_to_hod(tos_data, BENCHMARK_DATE) for tos_data in make_synthetic_chains(size))
+
+        def measure():
+            hod_data_to_csv(hod_data, BENCHMARK_DATE, os.path.join(work_dir, "options.csv"))
+            return sum(len(i["chain"]) for i in hod_data)
+
+        return prepare, measure
+
+    return stage
+
+
+def pickle_to_db_stage(size: str) -> Callable:
+    def stage(work_dir, downloader):
+        folder = os.path.join(work_dir, BENCHMARK_DATE)
+
+        def prepare():
+            os.mkdir(folder)
+            write_synthetic_pickles(folder, make_synthetic_chains(size))
+
+        def measure():
+            downloader.pickle_to_db(folder, csv_path=os.path.join(work_dir, "options.csv"))
+            return sum(len(i["chain"]) for i in downloader.db_handle.options_data.find({}, {"chain.Strike": 1}))
+
+        return prepare, measure
+
+    return stage
+
+
+def csv_to_db_stage(size: str) -> Callable:
+    def stage(work_dir, downloader):
+        csv_path = os.path.join(work_dir, "L2_options_" + BENCHMARK_DATE + ".csv")
+
+        def prepare():
+            write_synthetic_l2_csv(csv_path, make_synthetic_chains(size))
+
+        def measure():
+            downloader.csv_to_db(csv_path)
+            return sum(len(i["chain"]) for i in downloader.db_handle.options_data.find({}, {"chain.Strike": 1}))
+
+        return prepare, measure
+
+    return stage
+
+
+STAGES = {
+    "tos_to_columns": (convert_stage, False),
+    "json_to_columns": (decode_stage("json"), False),
+    "tos_to_hod": (hod_rows_stage, False),
+    "fill_greeks": (greeks_stage, False),
+    "chain_summary": (analytics_stage, False),
+    "hod_data_to_csv": (hod_csv_stage, False),
+    "pickle_to_db": (pickle_to_db_stage, True),
+    "csv_to_db": (csv_to_db_stage, True),
+}
+if "orjson" in JSON_DECODERS:
+    STAGES["orjson_to_columns"] = (decode_stage("orjson"), False)
+
+
+def run_benchmarks(stages: List[str], sizes: List[str], mongo_uri: str = None) -> Dict:
+    results = {}
+    for stage_name in stages:
+        _, needs_db = STAGES[stage_name]
+        if needs_db and mongomock is None and not mongo_uri:
+            logging.warning("Skipping %s: install mongomock or pass --mongo-uri", stage_name)
+            continue
+        for size in sizes:
+            # A fresh process per stage keeps the peak RSS of one stage out of the next one's numbers
+            with multiprocessing.Pool(1) as pool:
+                result = pool.apply(run_stage, (stage_name, size, mongo_uri))
+            results[stage_name + "/" + size] = result
+            logging.info(
+                "%-26s %9.0f contracts/s %8.1f MB peak RSS, %8.1f MB while measuring",
+                stage_name + "/" + size,
+                result["contractsPerSecond"],
+                result["peakRssMb"],
+                result["measureRssMb"],
+            )
+    return results
+
+
+def compare_to_baseline(results: Dict, baseline: Dict, tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]["contractsPerSecond"]
+        if result["contractsPerSecond"] < expected * (1 - tolerance):
+            measured = str(round(result["contractsPerSecond"]))
+            regressions.append(name + ": " + measured + " contracts/s, baseline " + str(round(expected)))
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stages", nargs="+", choices=sorted(STAGES), default=list(STAGES))
+    parser.add_argument("--sizes", nargs="+", choices=sorted(CHAIN_SIZES), default=list(CHAIN_SIZES))
+    parser.add_argument("--mongo-uri", help="use a scratch database on this mongod instead of mongomock")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="fail if contracts/s drops more than 10%% below this JSON file")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger("root").handlers = []
+    results = run_benchmarks(args.stages, args.sizes, args.mongo_uri)
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_to_baseline(results, json.load(baseline_file))
+        for regression in regressions:
+            logging.error("Regression in %s", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
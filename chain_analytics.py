@@ -0,0 +1,200 @@
+"""Daily chain summaries computed at ingest: ATM IV term structure, 25-delta skew, IV surface, put/call ratios."""
+
+# Standard libraries
+from datetime import datetime
+import itertools
+import logging
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+# External dependencies
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+# Application-specific imports
+from chain_query import bound_condition, document_match
+from hod_chain import HOD_SCHEMA_VERSION, ChainColumns
+from run_metrics import METRICS
+
+# Constants
+ANALYTICS_COLLECTION = "options_analytics"
+ANALYTICS_BATCH_SIZE = 500
+ANALYTICS_COLUMNS = ["UnderlyingPrice", "Strike", "IV", "Delta", "Volume", "OpenInterest"]
+# Chain columns a summary needs from a day archive
+ARCHIVE_COLUMNS = ["Type", "Expiration"] + ANALYTICS_COLUMNS[1:]
+SKEW_DELTA = 0.25
+# Strike / underlying price and calendar days of the IV surface grid
+SURFACE_MONEYNESS = [0.8, 0.9, 0.95, 1.0, 1.05, 1.1, 1.2]
+SURFACE_DAYS = [7, 30, 60, 90, 180, 365]
+DAYS_PER_YEAR = 365.0
+SUMMARY_DIGITS = 4
+
+
+class ChainAnalytics:
+    """Keeps options_analytics, one summary per symbol and day, in step with the chains written to options_data."""
+
+    def __init__(self, collection, batch_size: int = ANALYTICS_BATCH_SIZE):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.updated = 0
+
+    def create_indexes(self):
+        self.collection.create_index([("symbol", ASCENDING), ("dataDate", ASCENDING)], unique=True)
+
+    def add_documents(self, documents: Iterable[Dict]) -> int:
+        updates = (
+            summary_update(document)
+            for document in documents
+            if document.get("schemaVersion") == HOD_SCHEMA_VERSION and document["chain"]
+        )
+        added = 0
+        batch = list(itertools.islice(updates, self.batch_size))
+        while batch:
+            # Summaries are upserted, so replaying a day replaces its summary instead of failing
+            result = self.collection.bulk_write(batch, ordered=False)
+            self.updated = self.updated + result.upserted_count + result.modified_count
+            added = added + len(batch)
+            METRICS.increment("analytics_summaries_written", len(batch))
+            batch = list(itertools.islice(updates, self.batch_size))
+        return added
+
+    def summaries(
+        self, symbols: Union[str, List[str]] = None, dates: Tuple = None, fields: List[str] = None
+    ) -> Iterator[Dict]:
+        match = {}
+        if symbols:
+            match["symbol"] = symbols if isinstance(symbols, str) else {"$in": list(symbols)}
+        if dates and any(dates):
+            match["dataDate"] = bound_condition(*dates)
+        projection = dict({"_id": 0, "symbol": 1, "dataDate": 1}, **{name: 1 for name in fields or []})
+        return self.collection.find(match, projection if fields else {"_id": 0}).sort(
+            [("symbol", ASCENDING), ("dataDate", ASCENDING)]
+        )
+
+    def rebuild(self, source, dates: Tuple = None) -> int:
+        rebuilt = self.add_documents(source.find(document_match(None, dates), {"_id": 0}))
+        logging.info("Rebuilt the analytics of %s documents", rebuilt)
+        return rebuilt
+
+
+def summary_update(document: Dict) -> UpdateOne:
+    with METRICS.timer("analytics_seconds"):
+        summary = chain_summary(document)
+    return UpdateOne({"symbol": summary["symbol"], "dataDate": summary["dataDate"]}, {"$set": summary}, upsert=True)
+
+
+def chain_summary(document: Dict) -> Dict:
+    rows = document["chain"]
+    columns = {name: np.array([row.get(name) for row in rows], dtype=np.float64) for name in ANALYTICS_COLUMNS}
+    columns["IsCall"] = np.array([row.get("Type") == "call" for row in rows], dtype=bool)
+    columns["Expiration"] = np.array([row.get("Expiration") for row in rows], dtype="datetime64[D]")
+    summary = columns_summary(document["symbol"], document["dataDate"], columns)
+    return flag_profile(summary, document.get("fetchProfile"))
+
+
+def chain_columns_summary(chain_columns: ChainColumns) -> Dict:
+    columns = {name: np.asarray(chain_columns.columns[name], dtype=np.float64) for name in ANALYTICS_COLUMNS[1:]}
+    columns["UnderlyingPrice"] = np.full(len(columns["Strike"]), chain_columns.underlying_price, dtype=np.float64)
+    columns["IsCall"] = np.array([i == "call" for i in chain_columns.columns["Type"]], dtype=bool)
+    columns["Expiration"] = chain_columns.columns["Expiration"]
+    summary = columns_summary(chain_columns.symbol, chain_columns.data_date, columns)
+    return flag_profile(summary, chain_columns.fetch_profile)
+
+
+def flag_profile(summary: Dict, fetch_profile: str) -> Dict:
+    # Totals, ratios and the far strikes of a narrowed chain cover only part of it
+    if fetch_profile:
+        summary["fetchProfile"] = fetch_profile
+    return summary
+
+
+def columns_summary(symbol: str, data_date: str, columns: Dict[str, np.ndarray]) -> Dict:
+    day = np.datetime64(datetime.strptime(data_date, "%Y%m%d"), "D")
+    days = (columns["Expiration"] - day).astype(np.float64)
+    spot = columns["UnderlyingPrice"][~np.isnan(columns["UnderlyingPrice"])]
+    spot = spot[0] if spot.size else np.nan
+    summary = {"symbol": symbol, "dataDate": data_date, "underlyingPrice": compact(spot)}
+    summary.update(activity_summary(columns, "Volume"))
+    summary.update(activity_summary(columns, "OpenInterest"))
+    expirations = []
+    smiles = []
+    for expiration_days in np.unique(days[days > 0]):
+        contracts = {name: values[days == expiration_days] for name, values in columns.items()}
+        smile = otm_smile(contracts, spot)
+        smiles.append((expiration_days / DAYS_PER_YEAR, interpolate(np.array(SURFACE_MONEYNESS) * spot, *smile)))
+        expirations.append(expiration_summary(contracts, smile, spot, int(expiration_days)))
+    summary["expirations"] = expirations
+    summary["surface"] = {
+        "moneyness": SURFACE_MONEYNESS,
+        "days": SURFACE_DAYS,
+        "iv": [[compact(i) for i in row] for row in iv_surface(smiles).tolist()],
+    }
+    return summary
+
+
+def activity_summary(columns: Dict[str, np.ndarray], name: str) -> Dict:
+    calls = float(np.nansum(columns[name][columns["IsCall"]]))
+    puts = float(np.nansum(columns[name][~columns["IsCall"]]))
+    return {
+        name[0].lower() + name[1:]: {"call": calls, "put": puts, "total": calls + puts},
+        "putCall" + name + "Ratio": compact(puts / calls) if calls > 0 else None,
+    }
+
+
+def expiration_summary(contracts: Dict[str, np.ndarray], smile: Tuple, spot: float, days: int) -> Dict:
+    calls, puts = contracts["IsCall"], ~contracts["IsCall"]
+    call_iv = delta_interpolated_iv(contracts, calls, SKEW_DELTA)
+    put_iv = delta_interpolated_iv(contracts, puts, -SKEW_DELTA)
+    return {
+        "days": days,
+        "atmIV": compact(interpolate(np.array([spot]), *smile)[0]),
+        "callIV25": compact(call_iv),
+        "putIV25": compact(put_iv),
+        "skew25": compact(put_iv - call_iv),
+        "volume": float(np.nansum(contracts["Volume"])),
+        "openInterest": float(np.nansum(contracts["OpenInterest"])),
+    }
+
+
+def otm_smile(contracts: Dict[str, np.ndarray], spot: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Out-of-the-money options are the liquid side of every strike: puts below the spot, calls from it up
+    strike, iv = contracts["Strike"], contracts["IV"]
+    with np.errstate(invalid="ignore"):
+        otm = np.where(contracts["IsCall"], strike >= spot, strike < spot) & (iv > 0)
+    order = np.argsort(strike[otm], kind="stable")
+    strikes, first = np.unique(strike[otm][order], return_index=True)
+    return strikes, iv[otm][order][first]
+
+
+def delta_interpolated_iv(contracts: Dict[str, np.ndarray], side: np.ndarray, delta: float) -> float:
+    with np.errstate(invalid="ignore"):
+        usable = side & (contracts["IV"] > 0) & (np.abs(contracts["Delta"]) > 0) & (np.abs(contracts["Delta"]) < 1)
+    order = np.argsort(contracts["Delta"][usable], kind="stable")
+    deltas, first = np.unique(contracts["Delta"][usable][order], return_index=True)
+    return float(interpolate(np.array([delta]), deltas, contracts["IV"][usable][order][first])[0])
+
+
+def iv_surface(smiles: List[Tuple[float, np.ndarray]]) -> np.ndarray:
+    """Interpolates each moneyness linearly in total variance between the expirations around the grid days."""
+    surface = np.full((len(SURFACE_DAYS), len(SURFACE_MONEYNESS)), np.nan)
+    if not smiles:
+        return surface
+    years = np.array([i[0] for i in smiles])
+    variance = np.array([i[1] for i in smiles]) ** 2 * years[:, np.newaxis]
+    grid_years = np.array(SURFACE_DAYS) / DAYS_PER_YEAR
+    for column in range(len(SURFACE_MONEYNESS)):
+        known = ~np.isnan(variance[:, column])
+        surface[:, column] = interpolate(grid_years, years[known], variance[known, column])
+    with np.errstate(invalid="ignore"):
+        return np.sqrt(surface / grid_years[:, np.newaxis])
+
+
+def interpolate(x: np.ndarray, xp: np.ndarray, fp: np.ndarray) -> np.ndarray:
+    # Unlike np.interp, points outside the known range stay unknown instead of taking the nearest value
+    if xp.size == 0:
+        return np.full(x.shape, np.nan)
+    with np.errstate(invalid="ignore"):
+        return np.where((x >= xp[0]) & (x <= xp[-1]), np.interp(x, xp, fp), np.nan)
+
+
+def compact(value: float):
+    return None if np.isnan(value) else round(float(value), SUMMARY_DIGITS)
@@ -0,0 +1,129 @@
+"""Single-file, columnar day archive of option chains with memory-mapped reads by symbol and column."""
+
+# Standard libraries
+import json
+import os
+import struct
+import zlib
+from typing import Dict, Iterator, List
+
+# External dependencies
+import numpy as np
+
+# Application-specific imports
+from hod_chain import ChainColumns
+
+# Constants
+ARCHIVE_MAGIC = b"HODARC01"
+ARCHIVE_SUFFIX = ".chains"
+ARCHIVE_ALIGNMENT = 64
+ARCHIVE_VERSION = 1
+STRING_COLUMN_DTYPE = "utf8"
+
+
+class ChainArchiveWriter:
+    """Writes one day of ChainColumns to a single archive file, one row group per symbol."""
+
+    def __init__(self, path: str, data_date: str, compress: bool = False):
+        self.path = path
+        self.index = {
+            "version": ARCHIVE_VERSION,
+            "dataDate": data_date,
+            "codec": "zlib" if compress else "none",
+            "symbols": {},
+        }
+        self.archive_file = open(path + ".tmp", "wb")  # pylint: disable=consider-using-with
+        self.archive_file.write(ARCHIVE_MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.archive_file.close()
+            os.remove(self.path + ".tmp")
+
+    def add(self, chain_columns: ChainColumns):
+        if chain_columns.symbol in self.index["symbols"]:
+            raise ValueError(chain_columns.symbol + " is already in " + self.path)
+        row_group = {"underlyingPrice": chain_columns.underlying_price, "rows": len(chain_columns), "columns": {}}
+        if chain_columns.fetch_profile:
+            row_group["fetchProfile"] = chain_columns.fetch_profile
+        for name, column in chain_columns.columns.items():
+            if isinstance(column, list):
+                encoded = [i.encode() for i in column]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(i) for i in encoded], out=offsets[1:])
+                row_group["columns"][name] = self.write_chunk(b"".join(encoded), STRING_COLUMN_DTYPE)
+                row_group["columns"][name + ".offsets"] = self.write_chunk(offsets.tobytes(), offsets.dtype.str)
+            else:
+                data = np.ascontiguousarray(column).tobytes()
+                row_group["columns"][name] = self.write_chunk(data, column.dtype.str)
+        self.index["symbols"][chain_columns.symbol] = row_group
+
+    def write_chunk(self, data: bytes, dtype: str) -> List:
+        if self.index["codec"] == "zlib":
+            data = zlib.compress(data)
+        padding = -self.archive_file.tell() % ARCHIVE_ALIGNMENT
+        self.archive_file.write(b"\0" * padding)
+        offset = self.archive_file.tell()
+        self.archive_file.write(data)
+        return [offset, len(data), dtype]
+
+    def close(self):
+        index = json.dumps(self.index).encode()
+        self.archive_file.write(index)
+        self.archive_file.write(struct.pack("<Q", len(index)))
+        self.archive_file.write(ARCHIVE_MAGIC)
+        self.archive_file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+class ChainArchive:
+    """Read-only view of a day archive; uncompressed columns are zero-copy slices of a memory map."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        magic_size = len(ARCHIVE_MAGIC)
+        magics = [self.buffer[:magic_size].tobytes(), self.buffer[-magic_size:].tobytes()]
+        if magics != [ARCHIVE_MAGIC, ARCHIVE_MAGIC]:
+            raise ValueError(path + " is not a chain archive")
+        index_end = len(self.buffer) - magic_size - 8
+        (index_size,) = struct.unpack("<Q", self.buffer[index_end : index_end + 8].tobytes())
+        self.index = json.loads(self.buffer[index_end - index_size : index_end].tobytes())
+        self.data_date = self.index["dataDate"]
+
+    def symbols(self) -> List[str]:
+        return list(self.index["symbols"])
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.index["symbols"]
+
+    def read_column(self, symbol: str, name: str):
+        columns = self.index["symbols"][symbol]["columns"]
+        offset, size, dtype = columns[name]
+        chunk = self.buffer[offset : offset + size]
+        if self.index["codec"] == "zlib":
+            chunk = np.frombuffer(zlib.decompress(chunk), dtype=np.uint8)
+        if dtype != STRING_COLUMN_DTYPE:
+            return chunk.view(dtype)
+        offsets = self.read_column(symbol, name + ".offsets").tolist()
+        data = chunk.tobytes()
+        return [data[start:stop].decode() for start, stop in zip(offsets[:-1], offsets[1:])]
+
+    def read_chain(self, symbol: str, names: List[str] = None) -> ChainColumns:
+        row_group = self.index["symbols"][symbol]
+        names = names if names else [i for i in row_group["columns"] if not i.endswith(".offsets")]
+        columns = {name: self.read_column(symbol, name) for name in names}
+        fetch_profile = row_group.get("fetchProfile")
+        return ChainColumns(symbol, self.data_date, row_group["underlyingPrice"], columns, fetch_profile)
+
+    def iterate_chains(self, names: List[str] = None) -> Iterator[ChainColumns]:
+        for symbol in self.index["symbols"]:
+            yield self.read_chain(symbol, names)
+
+    def row_counts(self) -> Dict[str, int]:
+        return {symbol: row_group["rows"] for symbol, row_group in self.index["symbols"].items()}
@@ -0,0 +1,51 @@
+"""Decoding of broker JSON responses, through orjson when it is installed."""
+
+# Standard libraries
+import json
+import time
+from typing import Dict
+
+# External dependencies
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Application-specific imports
+from run_metrics import METRICS
+
+# Constants
+JSON_DECODERS = {"json": json.loads}
+if orjson is not None:
+    JSON_DECODERS["orjson"] = orjson.loads
+DEFAULT_JSON_DECODER = "orjson" if orjson is not None else "json"
+
+
+class JsonDecoder:
+    """Parses response bodies straight from bytes; every decoder raises a json.JSONDecodeError subclass."""
+
+    def __init__(self, name: str = DEFAULT_JSON_DECODER):
+        self.name = None
+        self.loads = None
+        self.use(name)
+
+    def use(self, name: str):
+        if name not in JSON_DECODERS:
+            raise ValueError("Unknown JSON decoder " + name + ", available: " + ", ".join(sorted(JSON_DECODERS)))
+        self.name = name
+        self.loads = JSON_DECODERS[name]
+
+    def decode(self, content: bytes) -> Dict:
+        start = time.perf_counter()
+        try:
+            data = self.loads(content)
+        except json.JSONDecodeError:
+            if self.loads is json.loads:
+                raise
+            # orjson rejects the bare NaN/Infinity literals the stdlib accepts, so those bodies get a second try
+            data = json.loads(content)
+        METRICS.observe("decode_seconds", time.perf_counter() - start)
+        return data
+
+
+JSON_DECODER = JsonDecoder()
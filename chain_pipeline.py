@@ -0,0 +1,130 @@
+"""Pipelined fetch -> convert -> store of option chains through bounded queues."""
+
+# Standard libraries
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List, Set
+
+# External dependencies
+
+# Application-specific imports
+from chain_archive import ChainArchiveWriter
+from hod_chain import hod_document, tos_to_columns
+
+# Constants
+PIPELINE_QUEUE_SIZE = 64
+QUEUED = "queued"
+FAILED = "failed"
+
+
+class ChainPipeline:  # pylint: disable=too-many-instance-attributes
+    """Sends each fetched chain through conversion and into a batched DB writer as soon as it arrives."""
+
+    def __init__(
+        self,
+        fetch_chain: Callable[[str], Dict],
+        inserter,
+        stored_symbols: Set[str],
+        data_date: str,
+        archive_writer: ChainArchiveWriter = None,
+    ):
+        self.fetch_chain = fetch_chain
+        self.inserter = inserter
+        self.stored_symbols = stored_symbols
+        self.data_date = data_date
+        self.archive_writer = archive_writer
+        # Symbols on their way to the DB are QUEUED; FAILED ones can be fetched again
+        self.states = {}
+        self.chain_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+        self.document_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+        self.threads = [
+            threading.Thread(target=self.convert, daemon=True),
+            threading.Thread(target=self.store, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fetch(self, symbols: List[str], workers: int = 1) -> List[str]:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(executor.map(self.fetch_symbol, symbols))
+        return [symbol for symbol, succeeded in zip(symbols, results) if not succeeded]
+
+    def fetch_symbol(self, symbol: str) -> bool:
+        if symbol in self.stored_symbols or self.states.get(symbol) == QUEUED:
+            logging.info("%s already stored, skipping", symbol)
+            return True
+        data = self.fetch_chain(symbol)
+        if not data:
+            return False
+        # Converting here lets a malformed chain count as a failed fetch, which the scheduler retries
+        try:
+            chain_columns = tos_to_columns(data, self.data_date)
+        except (KeyError, TypeError, ValueError) as error:
+            logging.error("Failed to convert %s: %s", symbol, error)
+            return False
+        self.states[symbol] = QUEUED
+        self.chain_queue.put((symbol, chain_columns))
+        return True
+
+    def convert(self):
+        symbol, chain_columns = self.chain_queue.get()
+        while symbol is not None:
+            try:
+                if self.archive_writer:
+                    self.archive_writer.add(chain_columns)
+                self.document_queue.put((symbol, hod_document(chain_columns)))
+            except Exception:  # pylint: disable=broad-except
+                # Whatever fails, this thread has to keep draining the queue or the fetchers block on it
+                logging.exception("Failed to convert %s", symbol)
+                self.states[symbol] = FAILED
+            symbol, chain_columns = self.chain_queue.get()
+        self.document_queue.put((None, None))
+
+    def store(self):
+        pending = []
+        symbol, document = self.document_queue.get()
+        while symbol is not None:
+            pending.append(symbol)
+            self.write(pending, functools.partial(self.inserter.add, document))
+            symbol, document = self.document_queue.get()
+        self.write(pending, self.inserter.flush)
+
+    def write(self, pending: List[str], write_function: Callable):
+        try:
+            write_function()
+        except Exception:  # pylint: disable=broad-except
+            # The buffered batch is gone with the failed write, so all of its symbols need another fetch
+            logging.exception("Failed to store the documents of %s", pending)
+            for symbol in pending:
+                self.states[symbol] = FAILED
+            pending.clear()
+            return
+        # An empty buffer means the batch holding the pending documents has been written
+        if not self.inserter.documents:
+            for symbol in pending:
+                self.stored_symbols.add(symbol)
+                del self.states[symbol]
+            pending.clear()
+
+    def failed_symbols(self) -> List[str]:
+        return sorted(symbol for symbol, state in self.states.items() if state == FAILED)
+
+    def close(self):
+        self.chain_queue.put((None, None))
+        for thread in self.threads:
+            thread.join()
+        if self.archive_writer:
+            self.archive_writer.close()
+        logging.info("Stored %s new documents, %s already in DB", self.inserter.inserted, self.inserter.duplicates)
+        failed_symbols = self.failed_symbols()
+        if failed_symbols:
+            logging.error("Could not store %s symbols: %s", len(failed_symbols), failed_symbols)
@@ -0,0 +1,96 @@
+"""Reads of options_data with the row filtering and projection pushed into Mongo."""
+
+# Standard libraries
+from typing import Dict, Iterator, List, Tuple, Union
+
+# External dependencies
+from pymongo import ASCENDING
+
+# Application-specific imports
+from hod_chain import HOD_SCHEMA_VERSION
+
+
+class ChainQuery:
+    """Looks up contracts by symbol, date range and row conditions; only the matching rows leave the server."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def create_indexes(self):
+        self.collection.create_index([("symbol", ASCENDING), ("dataDate", ASCENDING)])
+        self.collection.create_index([("chain.OptionSymbol", ASCENDING), ("dataDate", ASCENDING)])
+
+    def chains(
+        self,
+        symbols: Union[str, List[str]] = None,
+        dates: Tuple = None,
+        row_filter: Dict = None,
+        fields: List[str] = None,
+    ) -> Iterator[Dict]:
+        return self.collection.aggregate(query_pipeline(symbols, dates, row_filter, fields), allowDiskUse=True)
+
+    def contract_history(self, option_symbol: str, dates: Tuple = None, fields: List[str] = None) -> List[Dict]:
+        return [
+            dict(row, dataDate=document["dataDate"])
+            for document in self.chains(None, dates, {"OptionSymbol": option_symbol}, fields)
+            for row in document["chain"]
+        ]
+
+
+def query_pipeline(
+    symbols: Union[str, List[str]] = None, dates: Tuple = None, row_filter: Dict = None, fields: List[str] = None
+) -> List[Dict]:
+    match = document_match(symbols, dates)
+    rows = "$chain"
+    if row_filter:
+        match["chain"] = {"$elemMatch": {name: value_condition(value) for name, value in row_filter.items()}}
+        rows = {"$filter": {"input": "$chain", "as": "row", "cond": {"$and": row_expressions(row_filter)}}}
+    if fields:
+        rows = {"$map": {"input": rows, "as": "row", "in": {name: "$$row." + name for name in fields}}}
+    return [
+        {"$match": match},
+        {"$sort": {"dataDate": ASCENDING, "symbol": ASCENDING}},
+        {"$project": {"_id": 0, "symbol": 1, "dataDate": 1, "chain": rows}},
+        {"$match": {"chain.0": {"$exists": True}}},
+    ]
+
+
+def document_match(symbols: Union[str, List[str]] = None, dates: Tuple = None) -> Dict:
+    # Stringified documents would compare strikes and dates as strings, so only typed ones are searched
+    match = {"schemaVersion": HOD_SCHEMA_VERSION}
+    if symbols:
+        match["symbol"] = symbols if isinstance(symbols, str) else {"$in": list(symbols)}
+    start_date, end_date = dates if dates else (None, None)
+    if start_date or end_date:
+        match["dataDate"] = bound_condition(start_date, end_date)
+    return match
+
+
+def bound_condition(low, high) -> Dict:
+    condition = {}
+    if low is not None:
+        condition["$gte"] = low
+    if high is not None:
+        condition["$lte"] = high
+    return condition
+
+
+def value_condition(value):
+    if isinstance(value, tuple):
+        return bound_condition(*value)
+    if isinstance(value, list):
+        return {"$in": value}
+    return value
+
+
+def row_expressions(row_filter: Dict) -> List[Dict]:
+    expressions = []
+    for name, value in row_filter.items():
+        column = "$$row." + name
+        if isinstance(value, tuple):
+            expressions.extend({operator: [column, bound]} for operator, bound in bound_condition(*value).items())
+        elif isinstance(value, list):
+            expressions.append({"$in": [column, value]})
+        else:
+            expressions.append({"$eq": [column, value]})
+    return expressions
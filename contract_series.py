@@ -0,0 +1,99 @@
+"""Per-contract time series derived from options_data: one document per OptionSymbol with one entry per day."""
+
+# Standard libraries
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+# External dependencies
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Application-specific imports
+from chain_query import document_match
+from hod_chain import HOD_COLUMNS, HOD_SCHEMA_VERSION
+from run_metrics import METRICS
+
+# Constants
+CONTRACTS_COLLECTION = "options_contracts"
+CONTRACT_BATCH_SIZE = 1000
+CONTRACT_COLUMNS = ["Type", "Strike", "Expiration"]
+# Underlying price plus the quote, volume and Greek columns, i.e. everything of a row that changes from day to day
+SERIES_COLUMNS = ["UnderlyingPrice"] + HOD_COLUMNS[HOD_COLUMNS.index("Last") : HOD_COLUMNS.index("AKA")]
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+
+class ContractSeries:
+    """Keeps options_contracts in step with the chain documents written to options_data."""
+
+    def __init__(self, collection, batch_size: int = CONTRACT_BATCH_SIZE):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.updated = 0
+        self.duplicates = 0
+
+    def create_indexes(self):
+        self.collection.create_index([("symbol", ASCENDING), ("Expiration", ASCENDING)])
+
+    def add_documents(self, documents: Iterable[Dict]) -> int:
+        updates = []
+        added = 0
+        for document in documents:
+            if document.get("schemaVersion") != HOD_SCHEMA_VERSION:
+                continue
+            added = added + 1
+            for row in document["chain"]:
+                if not row.get("OptionSymbol"):
+                    continue
+                update_filter, update = contract_update(
+                    document["symbol"], document["dataDate"], row, document.get("fetchProfile")
+                )
+                updates.append(UpdateOne(update_filter, update, upsert=True))
+                if len(updates) >= self.batch_size:
+                    self.write(updates)
+                    updates = []
+        if updates:
+            self.write(updates)
+        return added
+
+    def write(self, updates: List[UpdateOne]):
+        updated_before, duplicates_before = self.updated, self.duplicates
+        try:
+            with METRICS.timer("contract_series_seconds"):
+                result = self.collection.bulk_write(updates, ordered=False)
+            self.updated = self.updated + result.upserted_count + result.modified_count
+        except BulkWriteError as error:
+            # A duplicate key means the contract already has that day, which makes replaying a day harmless
+            self.updated = self.updated + error.details["nUpserted"] + error.details["nModified"]
+            other_errors = [i for i in error.details["writeErrors"] if i["code"] != DUPLICATE_KEY_ERROR_CODE]
+            self.duplicates = self.duplicates + len(error.details["writeErrors"]) - len(other_errors)
+            if other_errors:
+                logging.error("Failed to update %s contracts: %s", len(other_errors), other_errors)
+                raise
+        finally:
+            METRICS.increment("contract_days_added", self.updated - updated_before)
+            METRICS.increment("contract_days_duplicate", self.duplicates - duplicates_before)
+
+    def history(self, option_symbol: str) -> Dict:
+        return self.collection.find_one({"_id": option_symbol})
+
+    def rebuild(self, source, dates: Tuple = None) -> int:
+        # Going through the days in order means every $push lands at the end of the series
+        documents = source.find(document_match(None, dates), {"_id": 0}).sort("dataDate", ASCENDING)
+        rebuilt = self.add_documents(documents)
+        logging.info("Rebuilt the contract series of %s documents, %s contract days added", rebuilt, self.updated)
+        return rebuilt
+
+
+def contract_update(symbol: str, data_date: str, row: Dict, fetch_profile: str = None) -> Tuple[Dict, Dict]:
+    point = {"dataDate": data_date}
+    point.update((name, row.get(name)) for name in SERIES_COLUMNS)
+    if fetch_profile:
+        # The contract's own values are complete, but the day only has it if it was within the narrowed query
+        point["fetchProfile"] = fetch_profile
+    contract = {"symbol": symbol}
+    contract.update((name, row.get(name)) for name in CONTRACT_COLUMNS)
+    # The $ne turns a second write of the same day into an upsert on an existing _id, i.e. a duplicate key error
+    return (
+        {"_id": row["OptionSymbol"], "days.dataDate": {"$ne": data_date}},
+        {"$setOnInsert": contract, "$push": {"days": {"$each": [point], "$sort": {"dataDate": ASCENDING}}}},
+    )
@@ -0,0 +1,107 @@
+"""Per-symbol fetch profiles from recent DB history: full chains, narrowed queries, or fewer fetches."""
+
+# Standard libraries
+from datetime import datetime, timedelta
+import logging
+from typing import Dict, List, Set, Tuple
+import zlib
+
+# External dependencies
+
+# Application-specific imports
+from hod_chain import HOD_SCHEMA_VERSION
+from run_metrics import METRICS
+
+# Constants
+ACTIVITY_LOOKBACK_DAYS = 10
+FULL_FETCH = "full"
+NARROW_FETCH = "narrow"
+SKIP_FETCH = "skip"
+LOW_ACTIVITY_VOLUME = 10
+NARROW_STRIKE_COUNT = 20
+NARROW_DAYS_TO_EXPIRATION = 120
+QUIET_REFETCH_DAYS = 5
+
+
+def query_symbol_activity(collection, lookback_days: int = ACTIVITY_LOOKBACK_DAYS) -> Dict[str, Dict]:
+    since = (datetime.now() - timedelta(days=lookback_days)).strftime("%Y%m%d")
+    activity = collection.aggregate(
+        [
+            # Stringified documents would sum to zero volume, so only typed ones count as history; narrowed chains
+            # leave out contracts, and would keep a symbol narrowed for good, so only full ones do
+            {
+                "$match": {
+                    "dataDate": {"$gte": since},
+                    "schemaVersion": HOD_SCHEMA_VERSION,
+                    "fetchProfile": {"$exists": False},
+                }
+            },
+            {"$sort": {"dataDate": -1}},
+            {
+                "$project": {
+                    "symbol": 1,
+                    "dataDate": 1,
+                    "contracts": {"$size": "$chain"},
+                    "volume": {"$sum": "$chain.Volume"},
+                    "openInterest": {"$sum": "$chain.OpenInterest"},
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$symbol",
+                    "days": {"$sum": 1},
+                    "lastDate": {"$first": "$dataDate"},
+                    "contracts": {"$first": "$contracts"},
+                    "volume": {"$first": "$volume"},
+                    "maxContracts": {"$max": "$contracts"},
+                    "maxVolume": {"$max": "$volume"},
+                    "openInterest": {"$addToSet": "$openInterest"},
+                }
+            },
+        ],
+        allowDiskUse=True,
+    )
+    return {i["_id"]: i for i in activity}
+
+
+def rank_by_activity(activity: Dict[str, Dict]) -> List[str]:
+    return sorted(activity, key=lambda i: (-activity[i]["volume"], -activity[i]["contracts"], i))
+
+
+def classify_symbol(symbol: str, stats: Dict, today: datetime) -> str:
+    if not stats:
+        return FULL_FETCH
+    empty = stats["maxContracts"] == 0
+    static = stats["maxVolume"] == 0 and stats["days"] > 1 and len(stats["openInterest"]) == 1
+    if empty or static:
+        # Spread the quiet symbols over the week instead of refetching all of them on the same day
+        due = (today.toordinal() + zlib.crc32(symbol.encode())) % QUIET_REFETCH_DAYS == 0
+        return FULL_FETCH if due else SKIP_FETCH
+    if stats["maxVolume"] < LOW_ACTIVITY_VOLUME:
+        return NARROW_FETCH
+    return FULL_FETCH
+
+
+def narrow_params(today: datetime) -> Dict:
+    return {
+        "includeQuotes": "FALSE",
+        "strikeCount": NARROW_STRIKE_COUNT,
+        "toDate": (today + timedelta(days=NARROW_DAYS_TO_EXPIRATION)).strftime("%Y-%m-%d"),
+    }
+
+
+def plan_fetches(
+    symbols: List[str], activity: Dict[str, Dict], today: datetime
+) -> Tuple[Dict[str, Dict], Set[str]]:
+    fetch_params, skipped = {}, set()
+    params = narrow_params(today)
+    for symbol in symbols:
+        profile = classify_symbol(symbol, activity.get(symbol), today)
+        if profile == NARROW_FETCH:
+            fetch_params[symbol] = params
+        elif profile == SKIP_FETCH:
+            skipped.add(symbol)
+    METRICS.increment("symbols_narrowed", len(fetch_params))
+    METRICS.increment("symbols_skipped", len(skipped))
+    logging.info("Narrowing the query of %s symbols and skipping %s quiet ones", len(fetch_params), len(skipped))
+    return fetch_params, skipped
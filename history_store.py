@@ -0,0 +1,266 @@
+"""Memory-mapped symbol x day panels of the daily chain summaries, scanned for all symbols at once."""
+
+# Standard libraries
+import json
+import multiprocessing
+import os
+import shutil
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# External dependencies
+import numpy as np
+
+# Application-specific imports
+from chain_analytics import ARCHIVE_COLUMNS, chain_columns_summary
+from chain_archive import ChainArchive
+from chain_query import bound_condition
+from run_metrics import METRICS
+
+# Constants
+HISTORY_VERSION = 1
+HISTORY_INDEX = "index.json"
+HISTORY_METRICS = [
+    "underlyingPrice",
+    "callVolume",
+    "putVolume",
+    "volume",
+    "callOpenInterest",
+    "putOpenInterest",
+    "openInterest",
+    "atmIV30",
+]
+# Summary fields that feed the panels, i.e. the projection used when reading options_analytics
+SUMMARY_FIELDS = ["symbol", "dataDate", "underlyingPrice", "volume", "openInterest", "surface", "fetchProfile"]
+ATM_IV_DAYS = 30
+SCAN_WINDOW = 20
+SCAN_ROWS_PER_WORKER = 1000
+
+
+class HistoryStoreWriter:
+    """Fills the panels of a history store from daily chain summaries, then swaps it in place of the old one."""
+
+    def __init__(self, path: str, symbols: Iterable[str], dates: Iterable[str]):
+        self.path = path
+        self.index = {"version": HISTORY_VERSION, "symbols": sorted(set(symbols)), "dates": sorted(set(dates))}
+        self.index["metrics"] = HISTORY_METRICS
+        self.rows = {symbol: row for row, symbol in enumerate(self.index["symbols"])}
+        self.columns = {data_date: column for column, data_date in enumerate(self.index["dates"])}
+        shutil.rmtree(path + ".tmp", ignore_errors=True)
+        os.makedirs(path + ".tmp")
+        shape = (len(self.rows), len(self.columns))
+        self.panels = {}
+        for name in HISTORY_METRICS:
+            panel_path = os.path.join(path + ".tmp", name + ".npy")
+            self.panels[name] = np.lib.format.open_memmap(panel_path, mode="w+", dtype=np.float64, shape=shape)
+            self.panels[name][:] = np.nan
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.panels = {}
+            shutil.rmtree(self.path + ".tmp", ignore_errors=True)
+
+    def add(self, summary: Dict):
+        if summary.get("fetchProfile"):
+            # A narrowed chain's totals would read as a drop in activity, so its day stays unknown
+            METRICS.increment("history_narrowed_skipped")
+            return
+        row, column = self.rows[summary["symbol"]], self.columns[summary["dataDate"]]
+        for name, value in summary_metrics(summary).items():
+            self.panels[name][row, column] = value
+
+    def close(self):
+        for panel in self.panels.values():
+            panel.flush()
+        self.panels = {}
+        with open(os.path.join(self.path + ".tmp", HISTORY_INDEX), "w") as index_file:
+            json.dump(self.index, index_file)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.path + ".tmp", self.path)
+
+
+class HistoryStore:
+    """Read-only history store; panels are memory maps, so workers share the page cache instead of copies."""
+
+    def __init__(self, path: str, processes: int = 1):
+        self.path = path
+        self.processes = processes
+        with open(os.path.join(path, HISTORY_INDEX)) as index_file:
+            self.index = json.load(index_file)
+        if self.index["version"] != HISTORY_VERSION:
+            raise ValueError(path + " is a version " + str(self.index["version"]) + " history store")
+        self.symbols = self.index["symbols"]
+        self.dates = self.index["dates"]
+
+    def panel(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+
+    def scan(self, name: str, window: int = SCAN_WINDOW, dates: Tuple = None, filters: Dict = None) -> List[Dict]:
+        """Scores every symbol on every day of the range, the last day by default, best scores first per day.
+
+        filters maps metrics, or "score", to (low, high) bounds that a hit must fall within.
+        """
+        first, last = self.date_range(dates)
+        if first >= last:
+            return []
+        with METRICS.timer("scan_seconds"):
+            values = {"score": self.scores(name, window, (first, last))}
+            for metric in filters or {}:
+                if metric != "score":
+                    values[metric] = self.panel(metric)[:, first:last]
+            rows, days = np.nonzero(select(values, filters))
+        scores = values["score"][rows, days]
+        order = np.lexsort((-scores, days)).tolist()
+        METRICS.increment("scan_hits", len(order))
+        return [
+            {"symbol": self.symbols[rows[i]], "dataDate": self.dates[first + days[i]], "score": float(scores[i])}
+            for i in order
+        ]
+
+    def date_range(self, dates: Tuple = None) -> Tuple[int, int]:
+        start_date, end_date = dates if dates else (None, None)
+        first = int(np.searchsorted(self.dates, start_date, "left")) if start_date else len(self.dates) - 1
+        last = int(np.searchsorted(self.dates, end_date, "right")) if end_date else len(self.dates)
+        return first, last
+
+    def scores(self, name: str, window: int, columns: Tuple[int, int]) -> np.ndarray:
+        # Rolling windows look back, so the workers also read the days just before the range
+        history = (max(0, columns[0] - window), columns[1])
+        chunks = [
+            (self.path, name, window, (start, min(start + SCAN_ROWS_PER_WORKER, len(self.symbols))), history)
+            for start in range(0, len(self.symbols), SCAN_ROWS_PER_WORKER)
+        ]
+        if self.processes > 1 and len(chunks) > 1:
+            with multiprocessing.Pool(min(self.processes, len(chunks))) as pool:
+                scores = pool.starmap(scan_chunk, chunks)
+        else:
+            scores = [scan_chunk(*chunk) for chunk in chunks]
+        return np.concatenate(scores)[:, columns[0] - history[0] :]
+
+
+def summary_metrics(summary: Dict) -> Dict[str, float]:
+    surface = summary["surface"]
+    metrics = {
+        "underlyingPrice": summary["underlyingPrice"],
+        "atmIV30": surface["iv"][surface["days"].index(ATM_IV_DAYS)][surface["moneyness"].index(1.0)],
+    }
+    for name in ["volume", "openInterest"]:
+        metrics["call" + name[0].upper() + name[1:]] = summary[name]["call"]
+        metrics["put" + name[0].upper() + name[1:]] = summary[name]["put"]
+        metrics[name] = summary[name]["total"]
+    return {name: np.nan if value is None else value for name, value in metrics.items()}
+
+
+def summaries_to_history_store(path: str, collection, dates: Tuple = None) -> int:
+    """Builds the store from options_analytics, which holds a few kilobytes per symbol and day."""
+    match = {"dataDate": bound_condition(*dates)} if dates and any(dates) else {}
+    symbols, data_dates = collection.distinct("symbol", match), collection.distinct("dataDate", match)
+    added = 0
+    with HistoryStoreWriter(path, symbols, data_dates) as writer:
+        for summary in collection.find(match, {name: 1 for name in SUMMARY_FIELDS}):
+            writer.add(summary)
+            added = added + 1
+    return added
+
+
+def archive_summaries(archive_path: str) -> List[Dict]:
+    archive = ChainArchive(archive_path)
+    return [chain_columns_summary(chain_columns) for chain_columns in archive.iterate_chains(ARCHIVE_COLUMNS)]
+
+
+def archives_to_history_store(path: str, archive_paths: List[str], processes: int = None) -> int:
+    """Summarizes the day archives in worker processes, one day per task."""
+    archives = [ChainArchive(i) for i in archive_paths]
+    symbols = {symbol for archive in archives for symbol in archive.symbols()}
+    added = 0
+    with HistoryStoreWriter(path, symbols, [i.data_date for i in archives]) as writer:
+        with multiprocessing.Pool(processes if processes else os.cpu_count()) as pool:
+            for summaries in pool.imap_unordered(archive_summaries, archive_paths):
+                for summary in summaries:
+                    writer.add(summary)
+                added = added + len(summaries)
+    return added
+
+
+def scan_chunk(path: str, name: str, window: int, rows: Tuple[int, int], columns: Tuple[int, int]) -> np.ndarray:
+    store = HistoryStore(path)
+    scan_function, metrics = SCANS[name]
+    panels = {}
+    for metric in metrics:
+        panels[metric] = np.array(store.panel(metric)[rows[0] : rows[1], columns[0] : columns[1]])
+    return scan_function(panels, window)
+
+
+def select(values: Dict[str, np.ndarray], filters: Dict = None) -> np.ndarray:
+    selected = ~np.isnan(values["score"])
+    for metric, (low, high) in (filters or {}).items():
+        selected &= within(values[metric], low, high)
+    return selected
+
+
+def within(values: np.ndarray, low, high) -> np.ndarray:
+    selected = np.ones(values.shape, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if low is not None:
+            selected &= values >= low
+        if high is not None:
+            selected &= values <= high
+    return selected
+
+
+def shift(values: np.ndarray, days: int = 1) -> np.ndarray:
+    shifted = np.full(values.shape, np.nan)
+    shifted[:, days:] = values[:, :-days]
+    return shifted
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of the known values of the trailing window ending on each day, NaN until the window is full."""
+    known = ~np.isnan(values)
+    sums = np.cumsum(np.where(known, values, 0), axis=1)
+    counts = np.cumsum(known, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+    mean[:, : window - 1] = np.nan
+    return mean
+
+
+def rolling_extreme(values: np.ndarray, window: int, function: Callable) -> np.ndarray:
+    # fmin/fmax skip NaN, so a missing day does not blank the whole window
+    extreme = np.full(values.shape, np.nan)
+    if values.shape[1] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=1)
+        extreme[:, window - 1 :] = function.reduce(windows, axis=-1)
+    return extreme
+
+
+def unusual_volume(panels: Dict[str, np.ndarray], window: int) -> np.ndarray:
+    # Today's volume over the average of the window before it
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return panels["volume"] / shift(rolling_mean(panels["volume"], window))
+
+
+def iv_rank(panels: Dict[str, np.ndarray], window: int) -> np.ndarray:
+    iv = panels["atmIV30"]
+    low, high = rolling_extreme(iv, window, np.fmin), rolling_extreme(iv, window, np.fmax)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100 * (iv - low) / (high - low)
+
+
+def open_interest_change(panels: Dict[str, np.ndarray], window: int) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return panels["openInterest"] / shift(panels["openInterest"], window) - 1
+
+
+# Scan name: (function of the panels and window, metrics it reads)
+SCANS = {
+    "unusual_volume": (unusual_volume, ["volume"]),
+    "iv_rank": (iv_rank, ["atmIV30"]),
+    "oi_change": (open_interest_change, ["openInterest"]),
+}
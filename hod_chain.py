@@ -0,0 +1,263 @@
+"""Historical options data (HoD) chain format: conversion from ToS option chains and the typed document schema."""
+
+# Standard libraries
+import csv
+from datetime import datetime
+import gzip
+import io
+import logging
+import math
+from typing import Dict, List, Tuple
+
+# External dependencies
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Application-specific imports
+from run_metrics import METRICS
+
+# Constants
+HOD_SCHEMA_VERSION = 2
+HOD_COLUMNS = [
+    "UnderlyingSymbol",
+    "UnderlyingPrice",
+    "Exchange",
+    "OptionSymbol",
+    "OptionExt",
+    "Type",
+    "Expiration",
+    "DataDate",
+    "Strike",
+    "Last",
+    "Bid",
+    "Ask",
+    "Volume",
+    "OpenInterest",
+    "IV",
+    "Delta",
+    "Gamma",
+    "Theta",
+    "Vega",
+    "AKA",
+]
+ROUNDED_HOD_COLUMNS = {"IV", "Theta", "Vega"}
+HOD_FLOAT_COLUMNS = {"UnderlyingPrice", "Strike", "Last", "Bid", "Ask", "IV", "Delta", "Gamma", "Theta", "Vega"}
+HOD_INT_COLUMNS = {"Volume", "OpenInterest"}
+HOD_DATE_COLUMNS = {"Expiration", "DataDate"}
+
+
+class ChainColumns:
+    """Option chain stored as a struct of arrays, one element per contract, with per-chain values kept once."""
+
+    def __init__(
+        self, symbol: str, data_date: str, underlying_price: float, columns: Dict, fetch_profile: str = None
+    ):
+        self.symbol = symbol
+        self.data_date = data_date
+        self.underlying_price = underlying_price
+        self.columns = columns
+        # Set when the chain comes from a narrowed query and so lacks some of the contracts
+        self.fetch_profile = fetch_profile
+
+    def __len__(self) -> int:
+        return len(self.columns["OptionSymbol"])
+
+    def take(self, indices: np.ndarray) -> "ChainColumns":
+        columns = {}
+        for name, column in self.columns.items():
+            columns[name] = [column[i] for i in indices.tolist()] if isinstance(column, list) else column[indices]
+        return ChainColumns(self.symbol, self.data_date, self.underlying_price, columns, self.fetch_profile)
+
+    def to_rows(self) -> List[Dict]:
+        number_of_contracts = len(self)
+        expirations = {i: hod_format_date(i) for i in set(self.columns["Expiration"].tolist())}
+        values = {
+            "UnderlyingSymbol": [self.symbol] * number_of_contracts,
+            "UnderlyingPrice": [str(self.underlying_price)] * number_of_contracts,
+            "OptionExt": [""] * number_of_contracts,
+            "Expiration": [expirations[i] for i in self.columns["Expiration"].tolist()],
+            "DataDate": [hod_format_date(self.data_date)] * number_of_contracts,
+            "AKA": self.columns["OptionSymbol"],
+        }
+        for name, column in self.columns.items():
+            if name in values:
+                continue
+            if isinstance(column, list):
+                values[name] = column
+            elif name in ROUNDED_HOD_COLUMNS:
+                values[name] = ["NaN" if math.isnan(i) else str(round(i, 2)) for i in column.tolist()]
+            else:
+                values[name] = ["NaN" if math.isnan(i) else str(i) for i in column.tolist()]
+        return [dict(zip(HOD_COLUMNS, row)) for row in zip(*[values[name] for name in HOD_COLUMNS])]
+
+    def to_typed_rows(self) -> List[Dict]:
+        number_of_contracts = len(self)
+        expirations = {i: datetime(i.year, i.month, i.day) for i in set(self.columns["Expiration"].tolist())}
+        values = {
+            "UnderlyingSymbol": [self.symbol] * number_of_contracts,
+            "UnderlyingPrice": [parse_hod_float(self.underlying_price)] * number_of_contracts,
+            "OptionExt": [""] * number_of_contracts,
+            "Expiration": [expirations[i] for i in self.columns["Expiration"].tolist()],
+            "DataDate": [datetime.strptime(self.data_date, "%Y%m%d")] * number_of_contracts,
+            "AKA": self.columns["OptionSymbol"],
+        }
+        for name, column in self.columns.items():
+            if name in values:
+                continue
+            if isinstance(column, list) or name in HOD_INT_COLUMNS:
+                values[name] = column if isinstance(column, list) else column.tolist()
+            elif name in ROUNDED_HOD_COLUMNS:
+                values[name] = [None if math.isnan(i) else round(i, 2) for i in column.tolist()]
+            else:
+                values[name] = [None if math.isnan(i) else i for i in column.tolist()]
+        return [dict(zip(HOD_COLUMNS, row)) for row in zip(*[values[name] for name in HOD_COLUMNS])]
+
+
+class HodCsvWriter:
+    """Writes HoD chain rows with a header to a CSV file, gzip or zstd compressed when the path ends in .gz/.zst."""
+
+    def __init__(self, path: str, columns: List[str] = None):
+        self.path = path
+        self.csv_file = open_hod_csv(path)
+        self.csv_writer = csv.DictWriter(self.csv_file, columns if columns else HOD_COLUMNS, extrasaction="ignore")
+        self.csv_writer.writeheader()
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, hod_data: dict):
+        self.csv_writer.writerows(hod_data["chain"])
+        self.rows = self.rows + len(hod_data["chain"])
+
+    def close(self):
+        self.csv_file.close()
+
+
+def open_hod_csv(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", newline="")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("The zstandard package is needed to write " + path)
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, "wb")), newline="")
+    return open(path, "w", newline="")
+
+
+def tos_to_columns(tos_data: dict, date_str: str) -> ChainColumns:
+    with METRICS.timer("convert_seconds"):
+        chain_columns = convert_tos_to_columns(tos_data, date_str)
+    METRICS.increment("contracts_converted", len(chain_columns))
+    return chain_columns
+
+
+def convert_tos_to_columns(tos_data: dict, date_str: str) -> ChainColumns:
+    if tos_data["symbol"].startswith("$") and tos_data["symbol"].endswith(".X"):
+        symbol = tos_data["symbol"][1:-2]
+    else:
+        symbol = tos_data["symbol"]
+    logging.debug("Found %s contracts in ToS for %s", tos_data["numberOfContracts"], symbol)
+    underlying_price = tos_data["underlying"]["last"] if tos_data["underlying"] else tos_data["underlyingPrice"]
+    entries, types, expirations, strikes = flatten_tos_chain(tos_data)
+    columns = {
+        "Exchange": [entry["exchangeName"] for entry in entries],
+        "OptionSymbol": [entry["symbol"] for entry in entries],
+        "Type": types,
+        "Expiration": np.array(expirations, dtype="datetime64[D]"),
+        "Strike": np.array(strikes, dtype=np.float64),
+        "Last": float_column(entries, "last"),
+        "Bid": float_column(entries, "bid"),
+        "Ask": float_column(entries, "ask"),
+        "Volume": np.array([entry["totalVolume"] for entry in entries], dtype=np.int64),
+        "OpenInterest": np.array([entry["openInterest"] for entry in entries], dtype=np.int64),
+        "IV": float_column(entries, "volatility") / 100,
+        "Delta": float_column(entries, "delta"),
+        "Gamma": float_column(entries, "gamma"),
+        "Theta": float_column(entries, "theta") * 100,
+        "Vega": float_column(entries, "vega") * 100,
+    }
+    return ChainColumns(symbol, date_str, underlying_price, columns, tos_data.get("fetchProfile"))
+
+
+def flatten_tos_chain(tos_data: dict) -> Tuple[List[Dict], List[str], List, List[str]]:
+    entries, types, expirations, strikes = [], [], [], []
+    for option_type in ["callExpDateMap", "putExpDateMap"]:
+        option_type_name = "call" if option_type == "callExpDateMap" else "put"
+        for expiration_str, expiration_row in tos_data[option_type].items():
+            expiration = np.datetime64(expiration_str.split(":")[0], "D")
+            for strike, strike_list in expiration_row.items():
+                entries.extend(strike_list)
+                types.extend([option_type_name] * len(strike_list))
+                expirations.extend([expiration] * len(strike_list))
+                strikes.extend([strike] * len(strike_list))
+    return entries, types, expirations, strikes
+
+
+def float_column(entries: List[Dict], key: str) -> np.ndarray:
+    return np.array([entry[key] for entry in entries], dtype=np.float64)
+
+
+def hod_format_date(date) -> str:
+    date_str = str(date).replace("-", "")
+    return "/".join([date_str[4:6], date_str[6:8], date_str[0:4]])
+
+
+def tos_to_hod(tos_data: dict, date_str: str) -> dict:
+    return hod_document(tos_to_columns(tos_data, date_str), typed=False)
+
+
+def hod_document(chain_columns: ChainColumns, typed: bool = True) -> dict:
+    hod_data = {}
+    hod_data["symbol"] = chain_columns.symbol
+    hod_data["dataDate"] = chain_columns.data_date
+    if chain_columns.fetch_profile:
+        hod_data["fetchProfile"] = chain_columns.fetch_profile
+    if typed:
+        hod_data["schemaVersion"] = HOD_SCHEMA_VERSION
+        hod_data["chain"] = chain_columns.to_typed_rows()
+    else:
+        hod_data["chain"] = chain_columns.to_rows()
+    return hod_data
+
+
+def typed_hod_row(row: Dict) -> Dict:
+    typed_row = {}
+    for name, value in row.items():
+        if name in HOD_FLOAT_COLUMNS:
+            typed_row[name] = parse_hod_float(value)
+        elif name in HOD_INT_COLUMNS:
+            typed_row[name] = parse_hod_int(value)
+        elif name in HOD_DATE_COLUMNS:
+            typed_row[name] = parse_hod_date(value)
+        else:
+            typed_row[name] = value
+    return typed_row
+
+
+def parse_hod_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def parse_hod_int(value):
+    value = parse_hod_float(value)
+    return None if value is None else int(value)
+
+
+def parse_hod_date(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        return datetime.strptime(value, "%m/%d/%Y")
+    except ValueError:
+        return None
@@ -0,0 +1,123 @@
+"""Intraday chain snapshots that store only the contracts whose quotes changed since the previous snapshot."""
+
+# Standard libraries
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import functools
+import logging
+import threading
+from typing import Callable, Dict, List
+
+# External dependencies
+import numpy as np
+from pymongo.errors import PyMongoError
+
+# Application-specific imports
+from hod_chain import ChainColumns, hod_document, tos_to_columns
+from run_metrics import METRICS
+
+# Constants
+INTRADAY_COLLECTION = "options_intraday"
+INTRADAY_INTERVAL = 300
+INTRADAY_MARKET_OPEN = (9, 30)
+INTRADAY_MARKET_CLOSE = (16, 0)
+DELTA_COLUMNS = ["Bid", "Ask", "Last", "Volume", "OpenInterest"]
+
+
+class ChainQuotes:
+    """Quote columns of the last stored snapshot of one chain, indexed by option symbol."""
+
+    def __init__(self, chain_columns: ChainColumns):
+        self.data_date = chain_columns.data_date
+        self.index = {option_symbol: i for i, option_symbol in enumerate(chain_columns.columns["OptionSymbol"])}
+        self.values = quote_matrix(chain_columns)
+
+    def changed_rows(self, chain_columns: ChainColumns) -> np.ndarray:
+        if not self.index:
+            return np.arange(len(chain_columns))
+        option_symbols = chain_columns.columns["OptionSymbol"]
+        previous_rows = np.array([self.index.get(i, -1) for i in option_symbols], dtype=np.int64)
+        values = quote_matrix(chain_columns)
+        previous_values = self.values[previous_rows]
+        unchanged = (values == previous_values) | (np.isnan(values) & np.isnan(previous_values))
+        return np.flatnonzero((previous_rows < 0) | ~unchanged.all(axis=1))
+
+    def removed(self, chain_columns: ChainColumns) -> List[str]:
+        return sorted(set(self.index) - set(chain_columns.columns["OptionSymbol"]))
+
+
+class IntradayCapture:
+    """Takes repeated snapshots of a set of chains; the first one of the day per symbol is stored in full."""
+
+    def __init__(self, fetch_chain: Callable[[str], Dict], inserter):
+        self.fetch_chain = fetch_chain
+        self.inserter = inserter
+        self.quotes = {}
+        # Quotes of the current snapshot, kept apart from the stored ones until all of its documents are written
+        self.pending = {}
+        self.write_failed = False
+        self.lock = threading.Lock()
+
+    def snapshot(self, symbols: List[str], workers: int = 1, timestamp: datetime = None) -> List[str]:
+        timestamp = (timestamp if timestamp else datetime.now()).replace(microsecond=0)
+        self.pending, self.write_failed = {}, False
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(executor.map(lambda symbol: self.capture_symbol(symbol, timestamp), symbols))
+        self.write(self.inserter.flush)
+        if self.write_failed:
+            # Which documents were lost is unknown, so the next snapshot diffs against the last fully stored one
+            unstored = set(self.pending)
+        else:
+            self.quotes.update(self.pending)
+            unstored = set()
+        return [symbol for symbol, succeeded in zip(symbols, results) if not succeeded or symbol in unstored]
+
+    def capture_symbol(self, symbol: str, timestamp: datetime) -> bool:
+        data = self.fetch_chain(symbol)
+        if not data:
+            return False
+        try:
+            chain_columns = tos_to_columns(data, timestamp.strftime("%Y%m%d"))
+        except (KeyError, TypeError, ValueError) as error:
+            logging.error("Failed to convert %s: %s", symbol, error)
+            return False
+        document = self.delta_document(chain_columns, timestamp)
+        if document:
+            with self.lock:
+                self.pending[symbol] = ChainQuotes(chain_columns)
+                self.write(functools.partial(self.inserter.add, document))
+        return True
+
+    def write(self, write_function: Callable):
+        try:
+            write_function()
+        except PyMongoError as error:
+            logging.error("Failed to store a batch of snapshots: %s", error)
+            self.write_failed = True
+
+    def delta_document(self, chain_columns: ChainColumns, timestamp: datetime) -> Dict:
+        with self.lock:
+            previous = self.quotes.get(chain_columns.symbol)
+        full = previous is None or previous.data_date != chain_columns.data_date
+        if full:
+            changed, removed = np.arange(len(chain_columns)), []
+        else:
+            changed, removed = previous.changed_rows(chain_columns), previous.removed(chain_columns)
+        METRICS.increment("intraday_contracts_seen", len(chain_columns))
+        METRICS.increment("intraday_contracts_changed", changed.size)
+        if changed.size == 0 and not removed:
+            return {}
+        document = hod_document(chain_columns.take(changed))
+        document["timestamp"] = timestamp
+        document["underlyingPrice"] = chain_columns.underlying_price
+        document["full"] = full
+        document["removed"] = removed
+        return document
+
+
+def quote_matrix(chain_columns: ChainColumns) -> np.ndarray:
+    return np.stack([chain_columns.columns[name].astype(np.float64) for name in DELTA_COLUMNS], axis=1)
+
+
+def is_market_open(now: datetime) -> bool:
+    return now.weekday() < 5 and INTRADAY_MARKET_OPEN <= (now.hour, now.minute) < INTRADAY_MARKET_CLOSE
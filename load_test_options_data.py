@@ -0,0 +1,96 @@
+"""Load test of get_todays_data against the mock broker, reporting symbols/minute and retry behaviour."""
+
+# Standard libraries
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# External dependencies
+
+# Application-specific imports
+from benchmark_options_data import get_benchmark_db
+from mock_broker_server import CHAINS_PATH, SYMBOLS_PATH, MockBrokerServer, add_fault_arguments, faults_from_args
+from options_data_downloader import OptionsDataDownloader
+from run_metrics import METRICS
+from symbol_universe import CBOE_MINIMUM_SYMBOLS, SymbolUniverse
+
+# Constants
+REPORTED_COUNTERS = [
+    "fetch_requests",
+    "fetch_retries",
+    "fetch_rate_limited",
+    "fetch_invalid_json",
+    "fetch_connection_errors",
+    "retry_budget_exhausted",
+    "symbols_fetched",
+    "symbols_failed",
+    "mandatory_symbols_missing",
+]
+
+
+def run_load_test(downloader: OptionsDataDownloader, server: MockBrokerServer, pipelined: bool = False) -> Dict:
+    downloader.api_url = server.url + CHAINS_PATH
+    downloader.symbol_universe = SymbolUniverse(server.url + SYMBOLS_PATH)
+    os.environ.setdefault("TOS_API_KEY", "load-test")
+    with tempfile.TemporaryDirectory() as work_dir:
+        start = time.perf_counter()
+        downloader.get_todays_data(work_dir + "/", pipelined, archive=pipelined)
+        seconds = time.perf_counter() - start
+    report = METRICS.report()
+    fetch_seconds = report["histograms"].get("fetch_seconds", {})
+    return {
+        "seconds": seconds,
+        "symbolsPerMinute": 60 * report["counters"].get("symbols_fetched", 0) / seconds,
+        "counters": {name: report["counters"].get(name, 0) for name in REPORTED_COUNTERS},
+        "fetchSeconds": {name: fetch_seconds.get(name, 0.0) for name in ["p50", "p90", "p99", "max"]},
+        "server": dict(server.stats),
+    }
+
+
+def universe_size(value: str) -> int:
+    # get_cboe_symbols rejects shorter lists as a broken download, which would fail the whole run
+    size = int(value)
+    if size < CBOE_MINIMUM_SYMBOLS:
+        raise argparse.ArgumentTypeError("must be at least " + str(CBOE_MINIMUM_SYMBOLS))
+    return size
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests-per-minute", type=int, default=6000, help="client-side rate limit")
+    parser.add_argument("--universe-size", type=universe_size, default=9100, help="symbols in the mock CBOE list")
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--mongo-uri", help="use a scratch database on this mongod instead of mongomock")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    downloader = OptionsDataDownloader(args.workers, args.requests_per_minute)
+    downloader.db_handle = get_benchmark_db(args.mongo_uri)
+    downloader.derived_writes = bool(args.mongo_uri)
+    if downloader.db_handle is None:
+        logging.error("Install mongomock or pass --mongo-uri")
+        return 1
+    server = MockBrokerServer(faults=faults_from_args(args), replay_dir=args.replay_dir)
+    server.universe_size = args.universe_size
+    server.start()
+    try:
+        results = run_load_test(downloader, server, args.pipelined)
+    finally:
+        server.shutdown()
+        server.server_close()
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
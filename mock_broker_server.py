@@ -0,0 +1,199 @@
+"""Local stand-in for the ToS option chain API and the CBOE symbol list, with injectable faults."""
+
+# Standard libraries
+import argparse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import pickle
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+import zlib
+
+# External dependencies
+
+# Application-specific imports
+from benchmark_options_data import make_synthetic_tos_chain
+
+# Constants
+CHAINS_PATH = "/v1/marketdata/chains"
+SYMBOLS_PATH = "/symboldir"
+DEFAULT_FAULTS = {
+    # Seconds added to every chain response, and the +/- range it is jittered by
+    "latency": 0.0,
+    "latency_jitter": 0.0,
+    # Fractions of chain requests answered with a 429, a truncated JSON body or a TCP reset
+    "rate_limited": 0.0,
+    "malformed": 0.0,
+    "reset": 0.0,
+    # Chain requests allowed per sliding minute before answering 429, 0 for no limit
+    "requests_per_minute": 0,
+    "retry_after": 1,
+}
+DEFAULT_UNIVERSE_SIZE = 9100
+
+
+class MockBrokerServer(ThreadingHTTPServer):
+    """Serves recorded or synthetic chains and counts what it sent back."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, faults: Dict = None, replay_dir: str = None, chain_size: tuple = (8, 20)):
+        super().__init__(("127.0.0.1", port), MockBrokerHandler)
+        self.faults = dict(DEFAULT_FAULTS, **(faults if faults else {}))
+        self.chain_size = chain_size
+        self.universe_size = DEFAULT_UNIVERSE_SIZE
+        self.chains = load_replay_dir(replay_dir) if replay_dir else {}
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.stats = {}
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:" + str(self.server_address[1])
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def count(self, outcome: str):
+        with self.lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + 1
+
+    def get_chain(self, symbol: str) -> bytes:
+        with self.lock:
+            if symbol not in self.chains:
+                if symbol.startswith("$"):
+                    chain = {"symbol": symbol, "status": "FAILED"}
+                else:
+                    expirations, strikes = self.chain_size
+                    chain = make_synthetic_tos_chain(symbol, expirations, strikes, zlib.crc32(symbol.encode()))
+                self.chains[symbol] = json.dumps(chain).encode()
+            return self.chains[symbol]
+
+    def seconds_until_allowed(self) -> float:
+        limit = self.faults["requests_per_minute"]
+        if not limit:
+            return 0.0
+        now = time.monotonic()
+        with self.lock:
+            while self.window and self.window[0] <= now - 60:
+                self.window.popleft()
+            if len(self.window) >= limit:
+                return self.window[0] + 60 - now
+            self.window.append(now)
+        return 0.0
+
+    def symbols_csv(self) -> bytes:
+        rows = ['"Company Name","Stock Symbol","DPM Name","Post/Station"']
+        for i in range(self.universe_size):
+            rows.append('"Synthetic ' + str(i) + '","SYM' + str(i) + '","DPM","1/1"')
+        return ("\n".join(rows) + "\n").encode()
+
+
+class MockBrokerHandler(BaseHTTPRequestHandler):
+    """Answers one request, drawing the fault (if any) from the server's configured rates."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        if url.path == SYMBOLS_PATH:
+            self.send_body(200, self.server.symbols_csv(), "text/csv")
+        elif url.path == CHAINS_PATH:
+            self.send_chain(parse_qs(url.query).get("symbol", [""])[0])
+        else:
+            self.send_body(404, b'{"error":"Not Found"}')
+
+    def send_chain(self, symbol: str):
+        faults = self.server.faults
+        retry_after = self.server.seconds_until_allowed()
+        if retry_after or random.random() < faults["rate_limited"]:
+            self.server.count("rate_limited")
+            retry_after = retry_after if retry_after else faults["retry_after"]
+            headers = {"Retry-After": str(round(retry_after, 3))}
+            self.send_body(429, b'{"error":"Too Many Requests"}', headers=headers)
+            return
+        latency = faults["latency"] + random.uniform(-faults["latency_jitter"], faults["latency_jitter"])
+        time.sleep(max(0.0, latency))
+        if random.random() < faults["reset"]:
+            self.server.count("reset")
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.close_connection = True
+            return
+        body = self.server.get_chain(symbol)
+        if random.random() < faults["malformed"]:
+            self.server.count("malformed")
+            body = body[: len(body) // 2]
+        else:
+            self.server.count("ok")
+        self.send_body(200, body)
+
+    def send_body(self, status: int, body: bytes, content_type: str = "application/json", headers: Dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers if headers else {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.debug("%s %s", self.address_string(), format % args)
+
+
+def load_replay_dir(replay_dir: str) -> Dict[str, bytes]:
+    chains = {}
+    for file_name in sorted(os.listdir(replay_dir)):
+        if file_name.endswith("_data.pkl"):
+            with open(os.path.join(replay_dir, file_name), "rb") as p_data:
+                chains[file_name.rsplit("_", 2)[0]] = json.dumps(pickle.load(p_data)).encode()
+        elif file_name.endswith(".json"):
+            with open(os.path.join(replay_dir, file_name), "rb") as json_file:
+                chains[file_name[: -len(".json")]] = json_file.read()
+    logging.info("Loaded %s recorded chains from %s", len(chains), replay_dir)
+    return chains
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every chain response")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="+/- seconds of uniform jitter")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--malformed", type=float, default=0.0, help="fraction of responses with truncated JSON")
+    parser.add_argument("--reset", type=float, default=0.0, help="fraction of connections reset without a reply")
+    parser.add_argument("--server-rpm", type=int, default=0, help="requests per minute before the server 429s")
+    parser.add_argument("--replay-dir", help="serve the *_data.pkl / SYMBOL.json chains in this folder")
+
+
+def faults_from_args(args: argparse.Namespace) -> Dict:
+    return {
+        "latency": args.latency,
+        "latency_jitter": args.latency_jitter,
+        "rate_limited": args.rate_limited,
+        "malformed": args.malformed,
+        "reset": args.reset,
+        "requests_per_minute": args.server_rpm,
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8080)
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO)
+    server = MockBrokerServer(args.port, faults_from_args(args), args.replay_dir)
+    logging.info("Serving chains on %s%s and symbols on %s%s", server.url, CHAINS_PATH, server.url, SYMBOLS_PATH)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
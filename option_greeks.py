@@ -0,0 +1,236 @@
+"""Vectorized Black-Scholes implied volatility and Greeks, used to fill the values the broker or CSVs left out."""
+
+# Standard libraries
+from datetime import datetime
+import logging
+import math
+from typing import Dict, Tuple
+
+# External dependencies
+import numpy as np
+from pymongo import UpdateOne
+
+try:
+    from scipy.special import ndtr
+except ImportError:
+    ndtr = None
+
+# Application-specific imports
+from hod_chain import HOD_SCHEMA_VERSION, ROUNDED_HOD_COLUMNS, ChainColumns
+from run_metrics import METRICS
+
+# Constants
+RISK_FREE_RATE = 0.02
+DAYS_PER_YEAR = 365.0
+# tos_to_columns stores ToS' per-day theta times 100, i.e. the yearly theta times 100/365, and vega as dP/dvol
+THETA_SCALE = 100 / DAYS_PER_YEAR
+IV_LOWER_BOUND = 1e-4
+IV_UPPER_BOUND = 5.0
+IV_INITIAL_GUESS = 0.3
+IV_MAX_ITERATIONS = 64
+IV_PRICE_TOLERANCE = 1e-8
+IV_SIGMA_TOLERANCE = 1e-8
+IV_RESIDUAL_TOLERANCE = 1e-6
+GREEK_COLUMNS = ["IV", "Delta", "Gamma", "Theta", "Vega"]
+PRICE_COLUMNS = ["UnderlyingPrice", "Strike", "Bid", "Ask", "Last"]
+GREEKS_BATCH_SIZE = 100
+ERFC_COEFFICIENTS = [
+    0.17087277,
+    -0.82215223,
+    1.48851587,
+    -1.13520398,
+    0.27886807,
+    -0.18628806,
+    0.09678418,
+    0.37409196,
+    1.00002368,
+    -1.26551223,
+]
+
+
+class GreeksModel:
+    """European Black-Scholes with a flat risk-free rate and continuous dividend yields, per symbol if given."""
+
+    def __init__(self, rate: float = RISK_FREE_RATE, dividend_yields: Dict[str, float] = None):
+        self.rate = rate
+        self.dividend_yields = dividend_yields if dividend_yields else {}
+
+    def fill_columns(self, symbol: str, data_date: np.datetime64, columns: Dict[str, np.ndarray]) -> int:
+        missing = np.zeros(len(columns["Strike"]), dtype=bool)
+        for name in GREEK_COLUMNS:
+            missing |= np.isnan(columns[name])
+        if not missing.any():
+            return 0
+        rates = (self.rate, self.dividend_yields.get(symbol, 0.0))
+        with METRICS.timer("greeks_seconds"):
+            contracts = {
+                "spot": columns["UnderlyingPrice"][missing],
+                "strike": columns["Strike"][missing],
+                "years": (columns["Expiration"][missing] - data_date).astype(np.float64) / DAYS_PER_YEAR,
+                "is_call": columns["IsCall"][missing],
+            }
+            sigma = columns["IV"][missing]
+            unknown = np.isnan(sigma)
+            unknown_contracts = {name: values[unknown] for name, values in contracts.items()}
+            sigma[unknown] = implied_volatility(unknown_contracts, option_price(columns)[missing][unknown], rates)
+            computed = black_scholes_greeks(contracts, sigma, rates)
+            computed["IV"] = sigma
+            filled = np.zeros(len(sigma), dtype=bool)
+            for name in GREEK_COLUMNS:
+                column = columns[name][missing]
+                gaps = np.isnan(column) & ~np.isnan(computed[name])
+                column[gaps] = computed[name][gaps]
+                columns[name][missing] = column
+                filled |= gaps
+        METRICS.increment("greeks_rows_filled", int(filled.sum()))
+        return int(filled.sum())
+
+    def fill_chain(self, chain_columns: ChainColumns) -> int:
+        columns = {name: chain_columns.columns[name] for name in ["Expiration"] + PRICE_COLUMNS[1:] + GREEK_COLUMNS}
+        columns["UnderlyingPrice"] = np.full(len(chain_columns), chain_columns.underlying_price, dtype=np.float64)
+        columns["IsCall"] = np.array([i == "call" for i in chain_columns.columns["Type"]], dtype=bool)
+        data_date = datetime.strptime(chain_columns.data_date, "%Y%m%d")
+        return self.fill_columns(chain_columns.symbol, np.datetime64(data_date, "D"), columns)
+
+    def fill_document(self, document: Dict) -> int:
+        rows = document["chain"]
+        if not rows:
+            return 0
+        columns = {
+            name: np.array([row.get(name) for row in rows], dtype=np.float64)
+            for name in PRICE_COLUMNS + GREEK_COLUMNS
+        }
+        columns["Expiration"] = np.array([row.get("Expiration") for row in rows], dtype="datetime64[D]")
+        columns["IsCall"] = np.array([row.get("Type") == "call" for row in rows], dtype=bool)
+        filled = self.fill_columns(document["symbol"], np.datetime64(rows[0]["DataDate"], "D"), columns)
+        for name in GREEK_COLUMNS:
+            for row, value in zip(rows, columns[name].tolist()):
+                if row.get(name) is None and not math.isnan(value):
+                    row[name] = round(value, 2) if name in ROUNDED_HOD_COLUMNS else value
+        return filled
+
+    def backfill(self, collection, batch_size: int = GREEKS_BATCH_SIZE) -> int:
+        match = {"schemaVersion": HOD_SCHEMA_VERSION, "$or": [{"chain." + name: None} for name in GREEK_COLUMNS]}
+        updates = []
+        updated = 0
+        for document in collection.find(match, {"symbol": 1, "chain": 1}):
+            if self.fill_document(document):
+                updates.append(UpdateOne({"_id": document["_id"]}, {"$set": {"chain": document["chain"]}}))
+            if len(updates) >= batch_size:
+                updated = updated + collection.bulk_write(updates, ordered=False).modified_count
+                logging.info("Filled in the Greeks of %s documents so far", updated)
+                updates = []
+        if updates:
+            updated = updated + collection.bulk_write(updates, ordered=False).modified_count
+        logging.info("Filled in the Greeks of %s documents", updated)
+        return updated
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    if ndtr is not None:
+        return ndtr(x)
+    # Without scipy, the Chebyshev fit of erfc (fractional error below 1.2e-7), which stays accurate in the tails
+    z = np.abs(x) / math.sqrt(2)
+    t = 1 / (1 + 0.5 * z)
+    polynomial = np.zeros_like(t)
+    for coefficient in ERFC_COEFFICIENTS:
+        polynomial = polynomial * t + coefficient
+    tail = 0.5 * t * np.exp(-z * z + polynomial)
+    return np.where(x >= 0, 1 - tail, tail)
+
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * x * x) / math.sqrt(2 * math.pi)
+
+
+def option_price(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    bid, ask, last = columns["Bid"], columns["Ask"], columns["Last"]
+    with np.errstate(invalid="ignore"):
+        return np.where((bid >= 0) & (ask > 0) & (ask >= bid), (bid + ask) / 2, np.where(last > 0, last, np.nan))
+
+
+def d1_d2(contracts: Dict[str, np.ndarray], sigma: np.ndarray, rates: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+    rate, dividend_yield = rates
+    spot, strike, years = contracts["spot"], contracts["strike"], contracts["years"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        deviation = sigma * np.sqrt(years)
+        d1 = (np.log(spot / strike) + (rate - dividend_yield + 0.5 * sigma * sigma) * years) / deviation
+    return d1, d1 - deviation
+
+
+def discounted(contracts: Dict[str, np.ndarray], rates: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+    rate, dividend_yield = rates
+    years = contracts["years"]
+    return contracts["spot"] * np.exp(-dividend_yield * years), contracts["strike"] * np.exp(-rate * years)
+
+
+def black_scholes_price(contracts: Dict[str, np.ndarray], sigma: np.ndarray, rates: Tuple) -> np.ndarray:
+    d1, d2 = d1_d2(contracts, sigma, rates)
+    forward, strike = discounted(contracts, rates)
+    call = forward * norm_cdf(d1) - strike * norm_cdf(d2)
+    return np.where(contracts["is_call"], call, call - forward + strike)
+
+
+def implied_volatility(contracts: Dict[str, np.ndarray], price: np.ndarray, rates: Tuple) -> np.ndarray:
+    """Newton steps on all contracts at once, falling back to bisection of each contract's bracket."""
+    forward, strike = discounted(contracts, rates)
+    is_call = contracts["is_call"]
+    intrinsic = np.maximum(np.where(is_call, forward - strike, strike - forward), 0)
+    with np.errstate(invalid="ignore"):
+        valid = (contracts["years"] > 0) & (price > intrinsic) & (price < np.where(is_call, forward, strike))
+    low = np.full(price.shape, IV_LOWER_BOUND)
+    high = np.full(price.shape, IV_UPPER_BOUND)
+    sigma = np.full(price.shape, IV_INITIAL_GUESS)
+    active = valid.copy()
+    for _ in range(IV_MAX_ITERATIONS):
+        index = np.flatnonzero(active)
+        if index.size == 0:
+            break
+        subset = {name: values[index] for name, values in contracts.items()}
+        sigma[index], low[index], high[index], active[index] = newton_step(
+            subset, price[index], sigma[index], (low[index], high[index]), rates
+        )
+    # A price the model cannot reach inside [IV_LOWER_BOUND, IV_UPPER_BOUND] leaves sigma pinned to the bound
+    residual = np.abs(black_scholes_price(contracts, sigma, rates) - price)
+    with np.errstate(invalid="ignore"):
+        sigma[~valid | (residual > IV_RESIDUAL_TOLERANCE * np.maximum(1, price))] = np.nan
+    return sigma
+
+
+def newton_step(
+    contracts: Dict[str, np.ndarray], price: np.ndarray, sigma: np.ndarray, bracket: Tuple, rates: Tuple
+):
+    error = black_scholes_price(contracts, sigma, rates) - price
+    forward = discounted(contracts, rates)[0]
+    vega = forward * norm_pdf(d1_d2(contracts, sigma, rates)[0]) * np.sqrt(contracts["years"])
+    low = np.where(error < 0, sigma, bracket[0])
+    high = np.where(error > 0, sigma, bracket[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step = sigma - error / vega
+    step = np.where((step > low) & (step < high), step, (low + high) / 2)
+    # Deep in- or out-of-the-money prices barely move with sigma, so a settled sigma also ends the search
+    converged = np.abs(error) <= IV_PRICE_TOLERANCE * np.maximum(1, price)
+    return np.where(converged, sigma, step), low, high, ~converged & (np.abs(step - sigma) > IV_SIGMA_TOLERANCE)
+
+
+def black_scholes_greeks(
+    contracts: Dict[str, np.ndarray], sigma: np.ndarray, rates: Tuple
+) -> Dict[str, np.ndarray]:
+    rate, dividend_yield = rates
+    d1, d2 = d1_d2(contracts, sigma, rates)
+    forward, strike = discounted(contracts, rates)
+    sqrt_years = np.sqrt(contracts["years"])
+    density = norm_pdf(d1)
+    sign = np.where(contracts["is_call"], 1, -1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        theta = (
+            -forward * density * sigma / (2 * sqrt_years)
+            + sign * dividend_yield * forward * norm_cdf(sign * d1)
+            - sign * rate * strike * norm_cdf(sign * d2)
+        )
+        return {
+            "Delta": sign * forward / contracts["spot"] * norm_cdf(sign * d1),
+            "Gamma": forward * density / (contracts["spot"] ** 2 * sigma * sqrt_years),
+            "Theta": theta * THETA_SCALE,
+            "Vega": forward * density * sqrt_years,
+        }
@@ -1,28 +1,74 @@
 """Script to download options data from Think or Swim (ToS) API."""
+# pylint: disable=too-many-lines
 
 # Standard libraries
+import argparse
+import json
 import pickle
-from datetime import datetime
+import queue
+from datetime import datetime, timezone
 import logging
+import multiprocessing
 import os
+import random
+import threading
 import time
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
 from json.decoder import JSONDecodeError
+from email.utils import parsedate_to_datetime
 import csv
+import heapq
+import itertools
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ReadTimeout
 from urllib3.exceptions import ProtocolError
 
 # External dependencies
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import DuplicateKeyError
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 
 # Application-specific imports
+from chain_analytics import ANALYTICS_COLLECTION, ChainAnalytics
+from chain_archive import ARCHIVE_SUFFIX, ChainArchive, ChainArchiveWriter
+from chain_json import JSON_DECODER, JSON_DECODERS
+from chain_pipeline import ChainPipeline
+from chain_query import ChainQuery
+from contract_series import CONTRACTS_COLLECTION, ContractSeries
+from fetch_profiles import NARROW_FETCH, plan_fetches, query_symbol_activity, rank_by_activity
+from history_store import (
+    SCAN_WINDOW,
+    SCANS,
+    HistoryStore,
+    archives_to_history_store,
+    summaries_to_history_store,
+)
+from intraday_capture import INTRADAY_COLLECTION, INTRADAY_INTERVAL, IntradayCapture, is_market_open
+from option_greeks import RISK_FREE_RATE, GreeksModel
+from raw_archive import pickles_to_raw_archive
+from symbol_scheduler import SymbolScheduler
+from symbol_universe import SymbolUniverse, as_symbol_set
+from run_metrics import METRICS
+from hod_chain import HOD_SCHEMA_VERSION, HodCsvWriter, hod_document, tos_to_columns, typed_hod_row
 
 # Constants
 TOS_OPTION_CHAIN_API_URL = "https://api.tdameritrade.com/v1/marketdata/chains"
 TOS_DOWNLOAD_DIR = "/Users/edsonfox/Documents/Trading/Historical_Options_Data/ToS/"
-CBOE_SYMBOLS_URL = "http://markets.cboe.com/us/options/symboldir/equity_index_options/?download=csv"
+TOS_REQUESTS_PER_MINUTE = 120
+TOS_FETCH_WORKERS = 8
+TOS_MAX_RETRIES = 8
+TOS_RETRY_BUDGET = 2000
+TOS_BACKOFF_BASE = 0.5
+TOS_BACKOFF_CAP = 32
+DB_BATCH_SIZE = 100
+DUPLICATE_KEY_ERROR_CODE = 11000
+CSV_SPILL_ROWS = 100000
+BACKFILL_QUEUE_SIZE = 1000
+BACKFILL_QUEUE_TIMEOUT = 10
+MANDATORY_ATTEMPTS = 8
+DB_SYMBOL_ATTEMPTS = 2
 MANDATORY_SYMBOLS = [
     "A",
     "AAPL",
@@ -265,129 +311,380 @@ MANDATORY_SYMBOLS = [
     "XRT",
     "XSP",
 ]
+SYMBOL_CACHE_FOLDER = "symbols"
+RAW_ARCHIVE_FOLDER = "raw"
+HISTORY_FOLDER = "history"
+# Collections derived from options_data, rebuilt by the subcommand of the same name
+DERIVED_COLLECTIONS = {
+    "contracts": (ContractSeries, CONTRACTS_COLLECTION),
+    "analytics": (ChainAnalytics, ANALYTICS_COLLECTION),
+}
 
 
-class OptionsDataDownloader:
+class TokenBucket:
+    """Thread-safe token bucket used to keep broker calls under the per-minute quota."""
+
+    def __init__(self, requests_per_minute: int = TOS_REQUESTS_PER_MINUTE, capacity: int = 1):
+        self.rate = requests_per_minute / 60
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.last_refill:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                    self.last_refill = now
+                    if self.tokens >= 1:
+                        self.tokens = self.tokens - 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.last_refill - now
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.tokens = 0.0
+            self.last_refill = max(self.last_refill, time.monotonic() + seconds)
+
+
+class RetryBudget:
+    """Thread-safe count of retries left for a whole run, shared by every symbol."""
+
+    def __init__(self, retries: int = TOS_RETRY_BUDGET):
+        self.retries = retries
+        self.remaining = retries
+        self.lock = threading.Lock()
+
+    def spend(self) -> bool:
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining = self.remaining - 1
+            return True
+
+    def reset(self):
+        with self.lock:
+            self.remaining = self.retries
+
+
+class BatchInserter:
+    """Buffers documents and writes them to a collection with unordered insert_many calls."""
+
+    def __init__(
+        self,
+        collection,
+        batch_size: int = DB_BATCH_SIZE,
+        contract_series: ContractSeries = None,
+        chain_analytics: ChainAnalytics = None,
+    ):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.contract_series = contract_series
+        self.chain_analytics = chain_analytics
+        self.documents = []
+        self.inserted = 0
+        self.duplicates = 0
+
+    def add(self, document: Dict):
+        self.documents.append(document)
+        if len(self.documents) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.documents:
+            return
+        documents, self.documents = self.documents, []
+        inserted_before, duplicates_before = self.inserted, self.duplicates
+        duplicate_indexes = set()
+        try:
+            with METRICS.timer("db_insert_seconds"):
+                insert_result = self.collection.insert_many(documents, ordered=False)
+            self.inserted = self.inserted + len(insert_result.inserted_ids)
+        except BulkWriteError as error:
+            METRICS.increment("db_bulk_write_errors")
+            self.inserted = self.inserted + error.details["nInserted"]
+            other_errors = []
+            for write_error in error.details["writeErrors"]:
+                document = documents[write_error["index"]]
+                if write_error["code"] == DUPLICATE_KEY_ERROR_CODE:
+                    self.duplicates = self.duplicates + 1
+                    duplicate_indexes.add(write_error["index"])
+                    logging.info("Document for %s from %s already in DB", document["symbol"], document["dataDate"])
+                else:
+                    other_errors.append(write_error)
+            if other_errors:
+                logging.error("Failed to insert %s documents: %s", len(other_errors), other_errors)
+                raise
+        finally:
+            METRICS.increment("documents_inserted", self.inserted - inserted_before)
+            METRICS.increment("documents_duplicate", self.duplicates - duplicates_before)
+        logging.debug("Inserted %s documents so far", self.inserted)
+        inserted = [i for n, i in enumerate(documents) if n not in duplicate_indexes]
+        if self.contract_series:
+            self.contract_series.add_documents(inserted)
+        if self.chain_analytics:
+            self.chain_analytics.add_documents(inserted)
+
+
+class OptionsDataDownloader:  # pylint: disable=too-many-instance-attributes
     """OptionsDataDownloader downloads data from ToS API and stores it in a DB."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        workers: int = 1,
+        requests_per_minute: int = TOS_REQUESTS_PER_MINUTE,
+        retry_budget: int = TOS_RETRY_BUDGET,
+    ):
         self.session = requests.session()
+        # The default pool keeps 10 connections per host, fewer than a large worker pool needs to reuse them all
+        adapter = HTTPAdapter(pool_connections=max(1, workers), pool_maxsize=max(1, workers))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.api_url = TOS_OPTION_CHAIN_API_URL
+        self.symbol_universe = SymbolUniverse()
         self.db_handle = None
+        # Whether writes to options_data also update the collections derived from it
+        self.derived_writes = True
+        self.workers = workers
+        self.rate_limiter = TokenBucket(requests_per_minute, capacity=max(1, workers))
+        self.retry_budget = RetryBudget(retry_budget)
 
     def connect_and_initialize_db(self):
         if not self.db_handle:
             client = MongoClient()
             self.db_handle = client.options
             self.db_handle.options_data.create_index([("dataDate", ASCENDING), ("symbol", ASCENDING)], unique=True)
+            ContractSeries(self.db_handle[CONTRACTS_COLLECTION]).create_indexes()
+            ChainAnalytics(self.db_handle[ANALYTICS_COLLECTION]).create_indexes()
 
     def get_and_pickle_data(self, symbols: List, path: str = "") -> List[str]:
-        failed_symbols = []
+        path = make_day_folder(path)
+        downloaded = get_downloaded_symbols(path)
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(
+                    executor.map(lambda symbol: self.get_and_pickle_symbol(symbol, path, downloaded), symbols)
+                )
+        else:
+            results = [self.get_and_pickle_symbol(symbol, path, downloaded) for symbol in symbols]
+        return [symbol for symbol, succeeded in zip(symbols, results) if not succeeded]
+
+    def get_and_pickle_symbol(self, symbol: str, path: str, downloaded: Set[str], params: Dict = None) -> bool:
+        today_str = os.path.basename(path)
+        if symbol in downloaded:
+            logging.info("%s already present, skipping", symbol)
+            return True
+        data = self.get_option_chain_with_fallback(symbol, params)
+        if not data:
+            return False
+        with open(path + "/" + symbol + "_" + today_str + "_data.pkl", "wb") as p_data:
+            pickle.dump(data, p_data)
+        downloaded.add(symbol)
+        return True
+
+    def get_option_chain_with_fallback(self, symbol: str, params: Dict = None) -> Dict:
+        data = self.get_option_chain_from_broker(symbol, params=params)
+        if data.get("status", "FAILED") == "FAILED":
+            logging.debug("Trying $%s.X", symbol)
+            data = self.get_option_chain_from_broker("$" + symbol + ".X", params=params)
+        if data.get("status", "FAILED") == "FAILED":
+            METRICS.increment("symbols_failed")
+            logging.info("%s FAILED!", symbol)
+            return {}
+        METRICS.increment("symbols_fetched")
+        if params:
+            # Only narrowed queries pass params; the tag follows the chain into its documents and summaries
+            data["fetchProfile"] = NARROW_FETCH
+        return data
+
+    def start_pipeline(self, path: str = "", archive: bool = False, fetch_params: Dict = None) -> ChainPipeline:
+        self.connect_and_initialize_db()
         today_str = datetime.now().strftime("%Y%m%d")
-        path += today_str
-        try:
-            os.mkdir(path)
-        except FileExistsError:
-            logging.info("%s directory already exists", today_str)
-        for symbol in symbols:
-            if [i for i in os.listdir(path) if i.startswith(symbol + "_")]:
-                logging.info("%s already present, skipping", symbol)
-                continue
-            data = self.get_option_chain_from_broker(symbol)
-            if data["status"] == "FAILED":
-                logging.debug("Trying $%s.X", symbol)
-                data = self.get_option_chain_from_broker("$" + symbol + ".X")
-            if data["status"] == "FAILED":
-                logging.info("%s FAILED!", symbol)
-                failed_symbols.append(symbol)
-                continue
-            with open(path + "/" + symbol + "_" + today_str + "_data.pkl", "wb") as p_data:
-                pickle.dump(data, p_data)
-        return failed_symbols
+        stored_symbols = set(self.db_handle.options_data.distinct("symbol", {"dataDate": today_str}))
+        archive_writer = ChainArchiveWriter(path + today_str + ARCHIVE_SUFFIX, today_str) if archive else None
+        fetch_params = fetch_params if fetch_params else {}
+        return ChainPipeline(
+            lambda symbol: self.get_option_chain_with_fallback(symbol, fetch_params.get(symbol)),
+            options_data_inserter(self.db_handle, derived=self.derived_writes),
+            stored_symbols,
+            today_str,
+            archive_writer,
+        )
 
-    def pickle_to_db(self, folder=None):
+    def start_intraday_capture(self) -> IntradayCapture:
+        self.connect_and_initialize_db()
+        collection = self.db_handle[INTRADAY_COLLECTION]
+        collection.create_index([("symbol", ASCENDING), ("timestamp", ASCENDING)], unique=True)
+        collection.create_index([("dataDate", ASCENDING), ("symbol", ASCENDING)])
+        return IntradayCapture(self.get_option_chain_with_fallback, BatchInserter(collection))
+
+    def start_query(self) -> ChainQuery:
+        self.connect_and_initialize_db()
+        query = ChainQuery(self.db_handle.options_data)
+        query.create_indexes()
+        return query
+
+    def pickle_to_db(self, folder=None, batch_size: int = DB_BATCH_SIZE, csv_path: str = None):
         self.connect_and_initialize_db()
         folder = datetime.now().strftime("%Y%m%d") if folder is None else folder
+        csv_path = csv_path if csv_path else "options_" + os.path.basename(folder.rstrip("/")) + ".csv"
         number_of_docs_before = self.db_handle.options_data.estimated_document_count()
         pkls = [i for i in os.listdir(folder) if i.endswith(".pkl")]
         pkls.sort()
         total_contracts = 0
-        hod_data_list = []
-        for pkl_file in pkls:
-            with open(folder + "/" + pkl_file, "rb") as p_data:
-                tos_data = pickle.load(p_data)
-            total_contracts = total_contracts + tos_data["numberOfContracts"]
-            date_str = pkl_file.split("_")[1]
-            hod_data = tos_to_hod(tos_data, date_str)
-            hod_data_list.append(hod_data)
-            try:
-                insert_result = self.db_handle.options_data.insert_one(hod_data)
-                logging.debug("Inserted %s with id %s", hod_data["symbol"], insert_result.inserted_id)
-            except DuplicateKeyError:
-                logging.info("Document for %s from %s already in DB", hod_data["symbol"], hod_data["dataDate"])
-                continue
-        hod_data_to_csv(hod_data_list, folder)
+        inserter = options_data_inserter(self.db_handle, batch_size, self.derived_writes)
+        with HodCsvWriter(csv_path) as csv_writer:
+            for pkl_file in pkls:
+                with open(folder + "/" + pkl_file, "rb") as p_data:
+                    tos_data = pickle.load(p_data)
+                total_contracts = total_contracts + tos_data["numberOfContracts"]
+                date_str = pkl_file.split("_")[1]
+                chain_columns = tos_to_columns(tos_data, date_str)
+                csv_writer.write(hod_document(chain_columns, typed=False))
+                inserter.add(hod_document(chain_columns))
+        inserter.flush()
+        logging.info("Skipped %s documents already in DB", inserter.duplicates)
         logging.info("Converted %s contracts from ToS to HoD format", total_contracts)
         number_of_docs_after = self.db_handle.options_data.estimated_document_count()
         logging.info("Inserted %s new documents to DB", number_of_docs_after - number_of_docs_before)
 
-    def csv_folder_to_db(self, folder_prefix, symbols=None, starting_path: str = ""):
-        folders = [x for x in os.listdir(starting_path) if x.startswith(folder_prefix)]
-        for folder in folders:
-            path = starting_path + "/" + folder if starting_path else folder
-            files = [x for x in os.listdir(path) if x.startswith("L2_options_")]
-            for file in files:
-                path = "/".join([starting_path if starting_path else os.getcwd(), folder, file])
-                self.csv_to_db(path, symbols)
+    def pickles_to_archive(self, folder=None, compress: bool = False) -> str:
+        folder = datetime.now().strftime("%Y%m%d") if folder is None else folder
+        archive_path = folder.rstrip("/") + ARCHIVE_SUFFIX
+        pkls = sorted(i for i in os.listdir(folder) if i.endswith(".pkl"))
+        with ChainArchiveWriter(archive_path, os.path.basename(folder.rstrip("/")), compress) as writer:
+            for pkl_file in pkls:
+                with open(folder + "/" + pkl_file, "rb") as p_data:
+                    tos_data = pickle.load(p_data)
+                writer.add(tos_to_columns(tos_data, pkl_file.split("_")[1]))
+        logging.info("Archived %s chains from %s to %s", len(pkls), folder, archive_path)
+        return archive_path
+
+    def archive_to_db(self, archive_path: str, batch_size: int = DB_BATCH_SIZE):
+        self.connect_and_initialize_db()
+        inserter = options_data_inserter(self.db_handle, batch_size, self.derived_writes)
+        for chain_columns in ChainArchive(archive_path).iterate_chains():
+            inserter.add(hod_document(chain_columns))
+        inserter.flush()
+        logging.info("Inserted %s new documents, %s already in DB", inserter.inserted, inserter.duplicates)
+
+    def csv_folder_to_db(
+        self, folder_prefix, symbols=None, starting_path: str = "", batch_size: int = DB_BATCH_SIZE,
+    ):
+        symbols = as_symbol_set(symbols)
+        for path in list_csv_files(folder_prefix, starting_path):
+            self.csv_to_db(path, symbols, batch_size)
 
-    def csv_to_db(self, csv_path, symbols=None):
+    def backfill_csv_folders(self, folder_prefix, symbols=None, starting_path: str = "", processes: int = None):
         self.connect_and_initialize_db()
-        number_of_docs_before = self.db_handle.options_data.estimated_document_count()
-        with open(csv_path) as csv_file:
-            logging.info("Now processing %s", csv_path)
-            reader = csv.DictReader(csv_file)
-            inserted_symbols = {}
-            num_rows = 0
-            for row in reader:
-                current_symbol = row["UnderlyingSymbol"]
-                if symbols is None or current_symbol in symbols:
-                    num_rows = num_rows + 1
-                    try:
-                        inserted_symbols[current_symbol].append(row)
-                    except KeyError:
-                        inserted_symbols[current_symbol] = [row]
-            for symbol in inserted_symbols:
-                data = {}
-                data["symbol"] = symbol
-                data_date = datetime.strptime(inserted_symbols[symbol][0]["DataDate"], "%m/%d/%Y")
-                data["dataDate"] = data_date.strftime("%Y%m%d")
-                data["chain"] = inserted_symbols[symbol]
+        processes = processes if processes else os.cpu_count()
+        symbols = as_symbol_set(symbols)
+        checkpoint_path = (starting_path if starting_path else os.getcwd()) + "/" + folder_prefix + ".checkpoint"
+        completed_files = read_checkpoint(checkpoint_path)
+        pending_files = [i for i in list_csv_files(folder_prefix, starting_path) if i not in completed_files]
+        logging.info("Backfilling %s files, %s already completed", len(pending_files), len(completed_files))
+        file_queue = multiprocessing.Queue()
+        for csv_path in pending_files + [None] * processes:
+            file_queue.put(csv_path)
+        document_queue = multiprocessing.Queue(BACKFILL_QUEUE_SIZE)
+        workers = [
+            multiprocessing.Process(target=parse_csv_files, args=(file_queue, document_queue, symbols))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        inserter = self.write_backfill_documents(document_queue, checkpoint_path, workers)
+        for worker in workers:
+            worker.join()
+        logging.info("Inserted %s new documents, %s already in DB", inserter.inserted, inserter.duplicates)
+
+    def write_backfill_documents(
+        self, document_queue, checkpoint_path: str, workers: List[multiprocessing.Process]
+    ) -> BatchInserter:
+        inserter = options_data_inserter(self.db_handle, derived=self.derived_writes)
+        running_workers = len(workers)
+        with open(checkpoint_path, "a") as checkpoint:
+            while running_workers:
                 try:
-                    insert_result = self.db_handle.options_data.insert_one(data)
-                    logging.info(
-                        "Inserted %s with id %s", data["symbol"], insert_result.inserted_id,
-                    )
-                except DuplicateKeyError:
-                    logging.info(
-                        "Document for %s from %s already exists in DB", data["symbol"], data["dataDate"],
-                    )
+                    csv_path, document = document_queue.get(timeout=BACKFILL_QUEUE_TIMEOUT)
+                except queue.Empty:
+                    check_backfill_workers(workers)
+                    continue
+                if document is not None:
+                    inserter.add(document)
+                elif csv_path is not None:
+                    inserter.flush()
+                    checkpoint.write(csv_path + "\n")
+                    checkpoint.flush()
+                else:
+                    running_workers = running_workers - 1
+            inserter.flush()
+        return inserter
+
+    def csv_to_db(self, csv_path, symbols=None, batch_size: int = DB_BATCH_SIZE):
+        self.connect_and_initialize_db()
+        number_of_docs_before = self.db_handle.options_data.estimated_document_count()
+        logging.info("Now processing %s", csv_path)
+        inserter = options_data_inserter(self.db_handle, batch_size, self.derived_writes)
+        num_rows = 0
+        for symbol, chain in iterate_csv_chains(csv_path, symbols):
+            num_rows = num_rows + len(chain)
+            inserter.add(csv_chain_to_document(symbol, chain))
+        inserter.flush()
+        logging.info("Skipped %s documents already in DB", inserter.duplicates)
         number_of_docs_after = self.db_handle.options_data.estimated_document_count()
         logging.info(
             "Inserted %s new dowcuments from %s CSV rows", number_of_docs_after - number_of_docs_before, num_rows,
         )
 
-    def get_option_chain_from_broker(self, symbol: str, retries: int = 60) -> Dict:
-        while retries:
+    def migrate_to_typed_schema(self, batch_size: int = DB_BATCH_SIZE):
+        self.connect_and_initialize_db()
+        documents = self.db_handle.options_data.find({"schemaVersion": {"$exists": False}}, {"chain": 1})
+        updates = []
+        migrated = 0
+        for document in documents:
+            typed_data = {"schemaVersion": HOD_SCHEMA_VERSION}
+            typed_data["chain"] = [typed_hod_row(row) for row in document["chain"]]
+            updates.append(UpdateOne({"_id": document["_id"]}, {"$set": typed_data}))
+            if len(updates) >= batch_size:
+                migrated = migrated + self.db_handle.options_data.bulk_write(updates, ordered=False).modified_count
+                logging.info("Migrated %s documents to the typed schema so far", migrated)
+                updates = []
+        if updates:
+            migrated = migrated + self.db_handle.options_data.bulk_write(updates, ordered=False).modified_count
+        logging.info("Migrated %s documents to the typed schema", migrated)
+
+    def get_option_chain_from_broker(
+        self, symbol: str, retries: int = TOS_MAX_RETRIES, params: Dict = None
+    ) -> Dict:
+        query = dict({"includeQuotes": "TRUE"}, **(params if params else {}))
+        query_str = "".join("&" + name + "=" + str(value) for name, value in query.items())
+        retry_after = None
+        for attempt in range(retries):
+            if attempt and not self.back_off(symbol, attempt, retry_after):
+                break
+            retry_after = None
+            self.rate_limiter.acquire()
+            METRICS.increment("fetch_requests")
+            METRICS.add_symbol_values(symbol, requests=1)
+            request_start = time.perf_counter()
             try:
                 response = self.session.get(
-                    TOS_OPTION_CHAIN_API_URL
+                    self.api_url
                     + "?apikey="
                     + os.environ.get("TOS_API_KEY")
                     + "&symbol="
                     + symbol
-                    + "&includeQuotes=TRUE",
+                    + query_str,
                     timeout=32,
                 )
             except (ConnectionError, ReadTimeout, requests.exceptions.ConnectionError) as error:
+                METRICS.increment("fetch_connection_errors")
                 try:
                     logging.error("Failed getting option chain for %s: %s", symbol, error)
                 except ProtocolError as p_error:
@@ -395,122 +692,271 @@ class OptionsDataDownloader:
                         logging.error("Failed getting option chain for %s: %s", symbol, p_error)
                     except (requests.exceptions.RequestException, requests.exceptions.ConnectionError,) as r_error:
                         logging.error("Failed getting option chain for %s: %s", symbol, r_error)
-                retries = retries - 1
-                time.sleep(2)
                 continue
+            request_seconds = time.perf_counter() - request_start
+            METRICS.observe("fetch_seconds", request_seconds)
+            METRICS.increment("fetch_bytes", len(response.content))
+            METRICS.add_symbol_values(symbol, seconds=request_seconds, bytes=len(response.content))
+            if response.status_code == 429:
+                METRICS.increment("fetch_rate_limited")
+                retry_after = get_retry_after(response)
+                logging.warning("Rate limited while getting %s, retrying in %s seconds", symbol, retry_after)
+                continue
+            if 400 <= response.status_code < 500:
+                METRICS.increment("fetch_client_errors")
+                logging.info("[%s]: HTTP %s, not retrying", symbol, response.status_code)
+                return {}
             try:
-                data = response.json()
+                data = JSON_DECODER.decode(response.content)
             except JSONDecodeError as error:
+                METRICS.increment("fetch_invalid_json")
                 logging.error("Failed to get JSON from %s response: %s", symbol, error)
-                retries = retries - 1
-                time.sleep(2)
                 continue
             if "status" in data.keys():
                 return data
+            METRICS.increment("fetch_unexpected_responses")
             if "error" in data.keys():
                 logging.info("[%s]: %s", symbol, data["error"])
             else:
                 logging.warning("Data has no status or error: %s", data)
-            retries = retries - 1
-            time.sleep(2)
         return {}
 
+    def back_off(self, symbol: str, attempt: int, retry_after: float = None) -> bool:
+        if not self.retry_budget.spend():
+            METRICS.increment("retry_budget_exhausted")
+            logging.error("Retry budget exhausted, giving up on %s", symbol)
+            return False
+        METRICS.increment("fetch_retries")
+        if retry_after is not None:
+            self.rate_limiter.pause(retry_after)
+        else:
+            time.sleep(random.uniform(0, min(TOS_BACKOFF_CAP, TOS_BACKOFF_BASE * 2 ** attempt)))
+        return True
+
+    def plan_todays_symbols(self, conditional: bool = False) -> Tuple[List[Tuple[List[str], int]], Dict]:
+        db_symbols = self.get_symbols_in_db()
+        activity = query_symbol_activity(self.db_handle.options_data)
+        db_symbols = rank_by_activity(activity) + db_symbols
+        cboe_symbols = list(self.symbol_universe.load())
+        fetch_params, skipped = {}, set()
+        if conditional:
+            mandatory = set(MANDATORY_SYMBOLS)
+            candidates = [symbol for symbol in db_symbols + cboe_symbols if symbol not in mandatory]
+            fetch_params, skipped = plan_fetches(candidates, activity, datetime.now())
+        symbol_groups = [
+            (MANDATORY_SYMBOLS, MANDATORY_ATTEMPTS),
+            ([symbol for symbol in db_symbols if symbol not in skipped], DB_SYMBOL_ATTEMPTS),
+            ([symbol for symbol in cboe_symbols if symbol not in skipped], 1),
+        ]
+        return symbol_groups, fetch_params
+
     def get_symbols_in_db(self) -> List[str]:
         self.connect_and_initialize_db()
         symbols_in_db = self.db_handle.options_data.distinct("symbol")
         logging.debug("Found %s symbols in DB: %s", len(symbols_in_db), symbols_in_db)
         return symbols_in_db
 
-    def get_todays_data(self, path: str = ""):
-        symbols = self.get_symbols_in_db()
-        for try_num in range(2):
-            logging.info("Trial number %s", try_num)
-            symbols = self.get_and_pickle_data(symbols, path)
-            logging.info("Got %s failing symbols: %s", len(symbols), symbols)
-        self.get_and_pickle_data(get_cboe_symbols(), path)
-        symbols = MANDATORY_SYMBOLS
-        for try_num in range(8):
-            logging.info("Mandatory symbols: Trial number %s", try_num)
-            symbols = self.get_and_pickle_data(symbols, path)
-            logging.info("Got %s failing symbols: %s", len(symbols), symbols)
+    def get_todays_data(  # pylint: disable=too-many-arguments
+        self,
+        path: str = "",
+        pipelined: bool = False,
+        archive: bool = True,
+        prometheus_path: str = None,
+        *,
+        deadline: datetime = None,
+        conditional: bool = False,
+    ):
+        self.retry_budget.reset()
+        METRICS.reset()
+        symbol_groups, fetch_params = self.plan_todays_symbols(conditional)
+        pipeline = self.start_pipeline(path, archive, fetch_params) if pipelined else None
+        scheduler = SymbolScheduler(pipeline.fetch_symbol if pipeline else pickle_fetcher(self, path, fetch_params))
+        for symbols, attempts in symbol_groups:
+            scheduler.add(symbols, attempts)
+        with METRICS.timer("fetch_pass_seconds"):
+            failed_symbols = scheduler.run(self.workers, deadline)
+        if pipeline:
+            pipeline.close()
+            failed_symbols = failed_symbols + [i for i in pipeline.failed_symbols() if i not in failed_symbols]
+        logging.info("Got %s failing symbols: %s", len(failed_symbols), failed_symbols)
+        symbols = [symbol for symbol in failed_symbols if symbol in MANDATORY_SYMBOLS]
+        METRICS.increment("mandatory_symbols_missing", len(symbols))
+        METRICS.write_report(path + datetime.now().strftime("%Y%m%d") + ".report.json")
+        if prometheus_path:
+            METRICS.write_prometheus(prometheus_path)
         if symbols:
             logging.error("**************************************************")
             logging.error("COULD NOT GET THESE MANDATORY SYMBOLS: %s", symbols)
             logging.error("**************************************************")
 
 
-def tos_to_hod(tos_data: dict, date_str: str) -> dict:
-    hod_data = {}
-    if tos_data["symbol"].startswith("$") and tos_data["symbol"].endswith(".X"):
-        symbol = tos_data["symbol"][1:-2]
-    else:
-        symbol = tos_data["symbol"]
-    hod_data["symbol"] = symbol
-    hod_data["dataDate"] = date_str
-    logging.debug("Found %s contracts in ToS for %s", tos_data["numberOfContracts"], symbol)
-    hod_data["chain"] = []
-    underlying_price = tos_data["underlying"]["last"] if tos_data["underlying"] else tos_data["underlyingPrice"]
-    for option_type in ["callExpDateMap", "putExpDateMap"]:
-        for expiration_str, expiration_row in tos_data[option_type].items():
-            expiration = expiration_str.split(":")[0].replace("-", "")
-            for strike, strike_list in expiration_row.items():
-                hod_chain_row = {}
-                hod_chain_row["UnderlyingSymbol"] = symbol
-                hod_chain_row["UnderlyingPrice"] = str(underlying_price)
-                for entry in strike_list:
-                    hod_chain_row["Exchange"] = entry["exchangeName"]
-                    hod_chain_row["OptionSymbol"] = entry["symbol"]
-                    hod_chain_row["OptionExt"] = ""
-                    hod_chain_row["Type"] = "call" if option_type == "callExpDateMap" else "put"
-                    hod_chain_row["Expiration"] = ("/").join([expiration[4:6], expiration[6:8], expiration[0:4]])
-                    hod_chain_row["DataDate"] = ("/").join([date_str[4:6], date_str[6:8], date_str[0:4]])
-                    hod_chain_row["Strike"] = strike
-                    hod_chain_row["Last"] = str(entry["last"])
-                    hod_chain_row["Bid"] = str(entry["bid"])
-                    hod_chain_row["Ask"] = str(entry["ask"])
-                    hod_chain_row["Volume"] = str(entry["totalVolume"])
-                    hod_chain_row["OpenInterest"] = str(entry["openInterest"])
-                    try:
-                        hod_chain_row["IV"] = str(round(entry["volatility"] / 100, 2))
-                    except TypeError:
-                        hod_chain_row["IV"] = "NaN"
-                    hod_chain_row["Delta"] = str(entry["delta"])
-                    hod_chain_row["Gamma"] = str(entry["gamma"])
-                    try:
-                        hod_chain_row["Theta"] = str(round(entry["theta"] * 100, 2))
-                    except TypeError:
-                        hod_chain_row["Theta"] = "NaN"
-                    hod_chain_row["Vega"] = str(round(entry["vega"] * 100, 2))
-                    hod_chain_row["AKA"] = entry["symbol"]
-                    hod_data["chain"].append(hod_chain_row)
-    return hod_data
-
-
-def hod_data_to_csv(hod_data: list, date_str: str):
-    with open("options_" + date_str + ".csv", "w") as csv_file:
-        csv_writer = csv.writer(csv_file)
+def options_data_inserter(db_handle, batch_size: int = DB_BATCH_SIZE, derived: bool = True) -> BatchInserter:
+    return BatchInserter(
+        db_handle.options_data,
+        batch_size,
+        ContractSeries(db_handle[CONTRACTS_COLLECTION]) if derived else None,
+        ChainAnalytics(db_handle[ANALYTICS_COLLECTION]) if derived else None,
+    )
+
+
+def hod_data_to_csv(hod_data: list, date_str: str, csv_path: str = None):
+    with HodCsvWriter(csv_path if csv_path else "options_" + date_str + ".csv") as csv_writer:
         for symbol_data in hod_data:
-            for row in symbol_data["chain"]:
-                csv_writer.writerow(row.values())
+            csv_writer.write(symbol_data)
 
 
-def get_cboe_symbols() -> List[str]:
-    rows = requests.get(CBOE_SYMBOLS_URL).text.splitlines()
-    symbols = []
-    for row in rows:
-        try:
-            symbol_candidate = row.split('","')[1]
-        except IndexError:
-            logging.info("Row is not parsable: %s", row)
+def make_day_folder(path: str) -> str:
+    today_str = datetime.now().strftime("%Y%m%d")
+    try:
+        os.mkdir(path + today_str)
+    except FileExistsError:
+        logging.info("%s directory already exists", today_str)
+    return path + today_str
+
+
+def pickle_fetcher(downloader: OptionsDataDownloader, path: str, fetch_params: Dict) -> Callable[[str], bool]:
+    folder = make_day_folder(path)
+    downloaded = get_downloaded_symbols(folder)
+    return lambda symbol: downloader.get_and_pickle_symbol(symbol, folder, downloaded, fetch_params.get(symbol))
+
+
+def todays_time(time_str: str = None) -> datetime:
+    if not time_str:
+        return None
+    return datetime.combine(datetime.now().date(), datetime.strptime(time_str, "%H:%M").time())
+
+
+def get_downloaded_symbols(path: str) -> Set[str]:
+    return {i.rsplit("_", 2)[0] for i in os.listdir(path) if i.endswith("_data.pkl")}
+
+
+def get_retry_after(response) -> float:
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return TOS_BACKOFF_CAP
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return TOS_BACKOFF_CAP
+
+
+def list_csv_files(folder_prefix: str, starting_path: str = "") -> List[str]:
+    csv_files = []
+    folders = [x for x in os.listdir(starting_path if starting_path else None) if x.startswith(folder_prefix)]
+    for folder in folders:
+        path = starting_path + "/" + folder if starting_path else folder
+        if not os.path.isdir(path):
             continue
-        if "#" not in symbol_candidate:
-            symbols.append(symbol_candidate)
-    symbols = list(set(symbols))
-    symbols.sort()
-    logging.info("Got %s symbols from CBOE", len(symbols))
-    if len(symbols) < 9000:
-        raise "Too few symbols. You should check what's going on"
-    return symbols
+        files = [x for x in os.listdir(path) if x.startswith("L2_options_")]
+        for file in files:
+            csv_files.append("/".join([starting_path if starting_path else os.getcwd(), folder, file]))
+    return csv_files
+
+
+def read_checkpoint(checkpoint_path: str) -> Set[str]:
+    try:
+        with open(checkpoint_path) as checkpoint:
+            return {line.rstrip("\n") for line in checkpoint if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def check_backfill_workers(workers: List[multiprocessing.Process]):
+    # A killed worker never sends its end marker, so waiting for it would block the backfill for good
+    killed = [worker for worker in workers if not worker.is_alive() and worker.exitcode != 0]
+    if killed:
+        for worker in workers:
+            worker.terminate()
+        raise RuntimeError("Backfill worker exited with code " + str(killed[0].exitcode))
+
+
+def parse_csv_files(file_queue, document_queue, symbols=None):
+    csv_path = file_queue.get()
+    try:
+        while csv_path is not None:
+            logging.info("Now processing %s", csv_path)
+            for symbol, chain in iterate_csv_chains(csv_path, symbols):
+                document_queue.put((csv_path, csv_chain_to_document(symbol, chain)))
+            document_queue.put((csv_path, None))
+            csv_path = file_queue.get()
+    except (OSError, ValueError, KeyError) as error:
+        logging.error("Failed to parse %s: %s", csv_path, error)
+    finally:
+        document_queue.put((None, None))
+
+
+def csv_chain_to_document(symbol: str, chain: List[Dict]) -> Dict:
+    data = {}
+    data["symbol"] = symbol
+    data["dataDate"] = datetime.strptime(chain[0]["DataDate"], "%m/%d/%Y").strftime("%Y%m%d")
+    data["schemaVersion"] = HOD_SCHEMA_VERSION
+    data["chain"] = [typed_hod_row(row) for row in chain]
+    return data
+
+
+def iterate_csv_chains(
+    csv_path: str, symbols=None, chunk_rows: int = CSV_SPILL_ROWS
+) -> Iterator[Tuple[str, List[Dict]]]:
+    if is_grouped_by_symbol(csv_path):
+        rows = read_csv_rows(csv_path, symbols)
+    else:
+        logging.info("%s is not grouped by symbol, sorting it on disk", csv_path)
+        rows = sort_csv_rows_on_disk(csv_path, symbols, chunk_rows)
+    for symbol, chain in itertools.groupby(rows, key=lambda row: row["UnderlyingSymbol"]):
+        yield symbol, list(chain)
+
+
+def is_grouped_by_symbol(csv_path: str) -> bool:
+    with open(csv_path) as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        if header is None:
+            return True
+        symbol_index = header.index("UnderlyingSymbol")
+        seen_symbols = set()
+        previous_symbol = None
+        for row in reader:
+            if row[symbol_index] != previous_symbol:
+                if row[symbol_index] in seen_symbols:
+                    return False
+                previous_symbol = row[symbol_index]
+                seen_symbols.add(previous_symbol)
+    return True
+
+
+def read_csv_rows(csv_path: str, symbols=None) -> Iterator[Dict]:
+    symbols = as_symbol_set(symbols)
+    with open(csv_path) as csv_file:
+        for row in csv.DictReader(csv_file):
+            if symbols is None or row["UnderlyingSymbol"] in symbols:
+                yield row
+
+
+def sort_csv_rows_on_disk(csv_path: str, symbols=None, chunk_rows: int = CSV_SPILL_ROWS) -> Iterator[Dict]:
+    with open(csv_path) as csv_file:
+        fieldnames = csv.DictReader(csv_file).fieldnames
+    with tempfile.TemporaryDirectory() as spill_dir:
+        chunk_paths = []
+        rows = read_csv_rows(csv_path, symbols)
+        chunk = list(itertools.islice(rows, chunk_rows))
+        while chunk:
+            chunk.sort(key=lambda row: row["UnderlyingSymbol"])
+            chunk_paths.append(os.path.join(spill_dir, str(len(chunk_paths)) + ".csv"))
+            with open(chunk_paths[-1], "w") as chunk_file:
+                csv_writer = csv.DictWriter(chunk_file, fieldnames)
+                csv_writer.writerows(chunk)
+            chunk = list(itertools.islice(rows, chunk_rows))
+        chunk_files = [open(chunk_path) for chunk_path in chunk_paths]  # pylint: disable=consider-using-with
+        try:
+            readers = [csv.DictReader(chunk_file, fieldnames) for chunk_file in chunk_files]
+            yield from heapq.merge(*readers, key=lambda row: row["UnderlyingSymbol"])
+        finally:
+            for chunk_file in chunk_files:
+                chunk_file.close()
 
 
 def replace_dots_in_keys(dictionary: Dict) -> Dict:
@@ -522,23 +968,179 @@ def replace_dots_in_keys(dictionary: Dict) -> Dict:
     return new_dict
 
 
-def main():
+def main(argv: List[str] = None):
+    args = make_argument_parser().parse_args(argv)
     logging.getLogger().setLevel(logging.INFO)
-    options_data_downloader = OptionsDataDownloader()
+    JSON_DECODER.use(args.json_decoder)
+    options_data_downloader = OptionsDataDownloader(workers=TOS_FETCH_WORKERS)
+    options_data_downloader.symbol_universe = SymbolUniverse(cache_dir=TOS_DOWNLOAD_DIR + SYMBOL_CACHE_FOLDER)
+    if args.command == "migrate":
+        options_data_downloader.migrate_to_typed_schema()
+    elif args.command == "archive":
+        options_data_downloader.pickles_to_archive(args.folder, args.compress)
+    elif args.command == "raw-archive":
+        for folder in args.folders:
+            pickles_to_raw_archive(folder, args.root, args.remove_pickles)
+    elif args.command == "load-archive":
+        options_data_downloader.archive_to_db(args.archive_path)
+    elif args.command == "query":
+        query = options_data_downloader.start_query()
+        print_json_lines(query.contract_history(args.option_symbol, (args.start_date, args.end_date), args.fields))
+    elif args.command in DERIVED_COLLECTIONS:
+        rebuild_derived_collection(options_data_downloader, args.command, (args.start_date, args.end_date))
+    elif args.command == "greeks":
+        options_data_downloader.connect_and_initialize_db()
+        dividend_yields = {i.split("=")[0]: float(i.split("=")[1]) for i in args.dividend_yields}
+        GreeksModel(args.rate, dividend_yields).backfill(options_data_downloader.db_handle.options_data)
+    elif args.command == "history":
+        run_history_command(options_data_downloader, args)
+    elif args.command == "symbols":
+        logging.info("%s symbols in the universe", len(options_data_downloader.symbol_universe.load(args.refresh)))
+    elif args.command == "intraday":
+        run_intraday_job(options_data_downloader, MANDATORY_SYMBOLS, args.interval)
+    else:
+        run_daily_job(
+            options_data_downloader, args.pipelined, args.prometheus_file, args.deadline, args.conditional
+        )
+
+
+def make_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Download options data from ToS and store it in MongoDB.")
+    parser.add_argument("--pipelined", action="store_true", help="fetch, convert and store chains in a single pass")
+    parser.add_argument("--prometheus-file", help="also write the run metrics in Prometheus text format here")
+    parser.add_argument(
+        "--json-decoder", choices=sorted(JSON_DECODERS), default=JSON_DECODER.name, help="chain response parser"
+    )
+    parser.add_argument("--deadline", help="HH:MM after which the daily job stops fetching, e.g. 16:00")
+    parser.add_argument(
+        "--conditional", action="store_true", help="narrow or skip the fetches of symbols with quiet DB history"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("migrate", help="convert stringified options_data documents to the typed schema")
+    archive_parser = subparsers.add_parser("archive", help="pack a day folder of pickles into one chain archive")
+    archive_parser.add_argument("folder")
+    archive_parser.add_argument("--compress", action="store_true", help="zlib-compress columns (disables mmap)")
+    raw_archive_parser = subparsers.add_parser("raw-archive", help="pack day folders into the raw archive")
+    raw_archive_parser.add_argument("folders", nargs="+")
+    raw_archive_parser.add_argument("--root", default=TOS_DOWNLOAD_DIR + RAW_ARCHIVE_FOLDER)
+    raw_archive_parser.add_argument("--remove-pickles", action="store_true", help="delete the verified pickles")
+    query_parser = subparsers.add_parser("query", help="print the daily history of one contract as JSON lines")
+    query_parser.add_argument("option_symbol")
+    query_parser.add_argument("--from", dest="start_date", help="first dataDate, YYYYMMDD")
+    query_parser.add_argument("--to", dest="end_date", help="last dataDate, YYYYMMDD")
+    query_parser.add_argument("--fields", nargs="+", help="chain columns to return, all of them by default")
+    contracts_parser = subparsers.add_parser("contracts", help="rebuild the per-contract series from options_data")
+    contracts_parser.add_argument("--from", dest="start_date", help="first dataDate, rebuilds everything if unset")
+    contracts_parser.add_argument("--to", dest="end_date", help="last dataDate, YYYYMMDD")
+    analytics_parser = subparsers.add_parser("analytics", help="recompute the daily chain summaries")
+    analytics_parser.add_argument("--from", dest="start_date", help="first dataDate, rebuilds everything if unset")
+    analytics_parser.add_argument("--to", dest="end_date", help="last dataDate, YYYYMMDD")
+    greeks_parser = subparsers.add_parser("greeks", help="fill in missing IV and Greeks of the stored documents")
+    greeks_parser.add_argument("--rate", type=float, default=RISK_FREE_RATE, help="continuous risk-free rate")
+    greeks_parser.add_argument(
+        "--dividend-yields", nargs="+", default=[], metavar="SYMBOL=YIELD", help="continuous dividend yields"
+    )
+    history_parser = subparsers.add_parser("history", help="build or scan the memory-mapped history of all symbols")
+    history_parser.add_argument("action", choices=["build", "scan"])
+    history_parser.add_argument("--path", default=TOS_DOWNLOAD_DIR + HISTORY_FOLDER, help="history store folder")
+    history_parser.add_argument("--archives", nargs="+", help="day archives to build from, not the DB")
+    history_parser.add_argument("--scan", choices=sorted(SCANS), default="unusual_volume")
+    history_parser.add_argument("--window", type=int, default=SCAN_WINDOW, help="days of the rolling window")
+    history_parser.add_argument("--from", dest="start_date", help="first dataDate, the last stored day if unset")
+    history_parser.add_argument("--to", dest="end_date", help="last dataDate, YYYYMMDD")
+    history_parser.add_argument(
+        "--filters", nargs="+", default=[], metavar="METRIC=LOW:HIGH", help="bounds on metrics or the score"
+    )
+    history_parser.add_argument("--processes", type=int, default=os.cpu_count(), help="worker processes")
+    load_archive_parser = subparsers.add_parser("load-archive", help="insert a chain archive into the DB")
+    load_archive_parser.add_argument("archive_path")
+    intraday_parser = subparsers.add_parser("intraday", help="snapshot the mandatory symbols during market hours")
+    intraday_parser.add_argument("--interval", type=int, default=INTRADAY_INTERVAL, help="seconds between runs")
+    symbols_parser = subparsers.add_parser("symbols", help="refresh the cached CBOE symbol universe")
+    symbols_parser.add_argument("--refresh", action="store_true", help="download even if the cache is fresh")
+    return parser
+
+
+def run_daily_job(
+    options_data_downloader: OptionsDataDownloader,
+    pipelined: bool = False,
+    prometheus_path: str = None,
+    deadline: str = None,
+    conditional: bool = False,
+):
     while True:
         if datetime.now().weekday() < 5:
             today_str = datetime.now().strftime("%Y%m%d")
-            if today_str not in os.listdir(TOS_DOWNLOAD_DIR):
+            day_marker = today_str + ARCHIVE_SUFFIX if pipelined else today_str
+            if day_marker not in os.listdir(TOS_DOWNLOAD_DIR):
                 if datetime.now().hour > 14:
-                    options_data_downloader.get_todays_data(TOS_DOWNLOAD_DIR)
+                    options_data_downloader.get_todays_data(
+                        TOS_DOWNLOAD_DIR,
+                        pipelined,
+                        prometheus_path=prometheus_path,
+                        deadline=todays_time(deadline),
+                        conditional=conditional,
+                    )
                 else:
                     logging.info("Waiting until 3pm")
             else:
-                logging.info("%s directory already present", today_str)
+                logging.info("%s already present", day_marker)
         else:
             logging.info("No trading today")
         time.sleep(300)
 
 
+def rebuild_derived_collection(
+    options_data_downloader: OptionsDataDownloader, command: str, dates: Tuple = (None, None)
+):
+    derived_class, name = DERIVED_COLLECTIONS[command]
+    options_data_downloader.connect_and_initialize_db()
+    collection = options_data_downloader.db_handle[name]
+    if not dates[0]:
+        collection.drop()
+        derived_class(collection).create_indexes()
+    derived_class(collection).rebuild(options_data_downloader.db_handle.options_data, dates)
+
+
+def run_history_command(options_data_downloader: OptionsDataDownloader, args):
+    dates = (args.start_date, args.end_date)
+    if args.action == "build":
+        if args.archives:
+            added = archives_to_history_store(args.path, args.archives, args.processes)
+        else:
+            options_data_downloader.connect_and_initialize_db()
+            collection = options_data_downloader.db_handle[ANALYTICS_COLLECTION]
+            added = summaries_to_history_store(args.path, collection, dates)
+        logging.info("Stored %s daily summaries in %s", added, args.path)
+        return
+    filters = {}
+    for metric_filter in args.filters:
+        metric, bounds = metric_filter.split("=")
+        low, high = bounds.split(":")
+        filters[metric] = (float(low) if low else None, float(high) if high else None)
+    print_json_lines(HistoryStore(args.path, args.processes).scan(args.scan, args.window, dates, filters))
+
+
+def print_json_lines(rows: Iterable[Dict]):
+    for row in rows:
+        print(json.dumps(row, default=str))
+
+
+def run_intraday_job(options_data_downloader: OptionsDataDownloader, symbols: List[str], interval: int):
+    intraday_capture = options_data_downloader.start_intraday_capture()
+    while True:
+        started = time.monotonic()
+        if is_market_open(datetime.now()):
+            # Each snapshot gets its own retries and counters, like a daily run
+            options_data_downloader.retry_budget.reset()
+            METRICS.reset()
+            failed_symbols = intraday_capture.snapshot(symbols, options_data_downloader.workers)
+            seconds = time.monotonic() - started
+            logging.info("Snapshot took %.1f seconds, %s symbols failed", seconds, len(failed_symbols))
+        else:
+            logging.info("Market closed")
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
 if __name__ == "__main__":
     main()
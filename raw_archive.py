@@ -0,0 +1,187 @@
+"""Archive of raw chain responses, zstd-compressed with a shared trained dictionary and deduplicated by hash."""
+
+# Standard libraries
+import hashlib
+import json
+import logging
+import os
+import pickle
+from typing import Dict, List
+
+# External dependencies
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Application-specific imports
+from chain_json import JSON_DECODER
+
+# Constants
+RAW_ARCHIVE_DICTIONARY = "dictionary.zdict"
+RAW_ARCHIVE_INDEX_SUFFIX = ".index.json"
+RAW_ARCHIVE_PACK_SUFFIX = ".pack"
+RAW_ARCHIVE_VERSION = 1
+RAW_COMPRESSION_LEVEL = 12
+RAW_DICTIONARY_SIZE = 112640
+RAW_DICTIONARY_MIN_SAMPLES = 32
+# zstd suggests about a hundred times the dictionary size of samples; more only slows the training down
+RAW_DICTIONARY_SAMPLE_BYTES = 100 * RAW_DICTIONARY_SIZE
+
+
+class RawArchive:
+    """Read side of the archive: one pack and one index per day, so a (date, symbol) lookup is a single seek."""
+
+    def __init__(self, root: str):
+        if zstandard is None:
+            raise ValueError("The zstandard package is needed to use the raw archive in " + root)
+        self.root = root
+        self.indexes = {}
+        self.compression_dict = None
+        os.makedirs(root, exist_ok=True)
+
+    def dictionary(self):
+        path = os.path.join(self.root, RAW_ARCHIVE_DICTIONARY)
+        if self.compression_dict is None and os.path.exists(path):
+            with open(path, "rb") as dictionary_file:
+                self.compression_dict = zstandard.ZstdCompressionDict(dictionary_file.read())
+        return self.compression_dict
+
+    def train_dictionary(self, samples: List[bytes]) -> bool:
+        # Frames written with a dictionary can only be read with that same dictionary, so it is never retrained
+        if self.dictionary() is not None or len(samples) < RAW_DICTIONARY_MIN_SAMPLES:
+            return False
+        try:
+            trained = zstandard.train_dictionary(RAW_DICTIONARY_SIZE, samples)
+        except zstandard.ZstdError as error:
+            logging.warning("Could not train a raw archive dictionary: %s", error)
+            return False
+        path = os.path.join(self.root, RAW_ARCHIVE_DICTIONARY)
+        with open(path + ".tmp", "wb") as dictionary_file:
+            dictionary_file.write(trained.as_bytes())
+        os.replace(path + ".tmp", path)
+        logging.info("Trained a %s byte dictionary on %s responses", len(trained.as_bytes()), len(samples))
+        return True
+
+    def dates(self) -> List[str]:
+        suffix = RAW_ARCHIVE_INDEX_SUFFIX
+        return sorted(i[: -len(suffix)] for i in os.listdir(self.root) if i.endswith(suffix))
+
+    def day_index(self, data_date: str) -> Dict:
+        if data_date not in self.indexes:
+            with open(os.path.join(self.root, data_date + RAW_ARCHIVE_INDEX_SUFFIX)) as index_file:
+                self.indexes[data_date] = json.load(index_file)
+        return self.indexes[data_date]
+
+    def symbols(self, data_date: str) -> List[str]:
+        return list(self.day_index(data_date)["symbols"])
+
+    def read(self, data_date: str, symbol: str) -> bytes:
+        pack_date, offset, size, _ = self.day_index(data_date)["symbols"][symbol]
+        with open(os.path.join(self.root, pack_date + RAW_ARCHIVE_PACK_SUFFIX), "rb") as pack_file:
+            pack_file.seek(offset)
+            frame = pack_file.read(size)
+        dictionary = self.dictionary() if self.day_index(pack_date)["dictionary"] else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(frame)
+
+    def load(self, data_date: str, symbol: str) -> Dict:
+        return JSON_DECODER.decode(self.read(data_date, symbol))
+
+    def blob_locations(self) -> Dict[str, List]:
+        return {
+            location[3]: location for i in self.dates() for location in self.day_index(i)["symbols"].values()
+        }
+
+
+class RawArchiveWriter:
+    """Writes one day of responses; bodies already stored on any earlier day only get an index entry."""
+
+    def __init__(self, archive: RawArchive, data_date: str):
+        index_path = os.path.join(archive.root, data_date + RAW_ARCHIVE_INDEX_SUFFIX)
+        if os.path.exists(index_path):
+            raise ValueError(data_date + " is already in " + archive.root)
+        self.archive = archive
+        self.data_date = data_date
+        dictionary = archive.dictionary()
+        self.index = {"version": RAW_ARCHIVE_VERSION, "dictionary": dictionary is not None, "symbols": {}}
+        self.compressor = zstandard.ZstdCompressor(level=RAW_COMPRESSION_LEVEL, dict_data=dictionary)
+        self.blobs = archive.blob_locations()
+        self.pack_path = os.path.join(archive.root, data_date + RAW_ARCHIVE_PACK_SUFFIX)
+        self.pack_file = open(self.pack_path + ".tmp", "wb")  # pylint: disable=consider-using-with
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pack_file.close()
+            os.remove(self.pack_path + ".tmp")
+
+    def add(self, symbol: str, body: bytes) -> bool:
+        if symbol in self.index["symbols"]:
+            raise ValueError(symbol + " is already in the " + self.data_date + " raw archive")
+        digest = hashlib.sha256(body).hexdigest()
+        duplicate = digest in self.blobs
+        if not duplicate:
+            frame = self.compressor.compress(body)
+            self.blobs[digest] = [self.data_date, self.pack_file.tell(), len(frame), digest]
+            self.pack_file.write(frame)
+        self.index["symbols"][symbol] = self.blobs[digest]
+        return duplicate
+
+    def close(self):
+        size = self.pack_file.tell()
+        self.pack_file.close()
+        os.replace(self.pack_path + ".tmp", self.pack_path)
+        # The index goes last, so an interrupted write never points at a pack that is not there
+        index_path = os.path.join(self.archive.root, self.data_date + RAW_ARCHIVE_INDEX_SUFFIX)
+        with open(index_path + ".tmp", "w") as index_file:
+            json.dump(self.index, index_file)
+        os.replace(index_path + ".tmp", index_path)
+        logging.info("Stored %s responses for %s in %s bytes", len(self.index["symbols"]), self.data_date, size)
+
+
+def encode_chain(tos_data: Dict) -> bytes:
+    # Always the stdlib encoder with fixed separators, so equal chains hash the same whichever decoder read them
+    return json.dumps(tos_data, separators=(",", ":")).encode()
+
+
+def pickles_to_raw_archive(folder: str, root: str, remove_pickles: bool = False) -> int:
+    folder = folder.rstrip("/")
+    pkls = sorted(i for i in os.listdir(folder) if i.endswith("_data.pkl"))
+    archive = RawArchive(root)
+    if archive.dictionary() is None:
+        archive.train_dictionary(dictionary_samples(folder, pkls))
+    data_date = os.path.basename(folder)
+    # Only the hashes are kept, so a day of responses streams through without being held in memory
+    digests = {}
+    duplicates = 0
+    with RawArchiveWriter(archive, data_date) as writer:
+        for pkl_file in pkls:
+            body = pickle_body(os.path.join(folder, pkl_file))
+            digests[pkl_file] = hashlib.sha256(body).hexdigest()
+            duplicates = duplicates + writer.add(pkl_file.rsplit("_", 2)[0], body)
+    logging.info("Archived %s responses from %s, %s already stored", len(digests), folder, duplicates)
+    if remove_pickles:
+        for pkl_file, digest in digests.items():
+            if hashlib.sha256(archive.read(data_date, pkl_file.rsplit("_", 2)[0])).hexdigest() == digest:
+                os.remove(os.path.join(folder, pkl_file))
+    return len(digests)
+
+
+def dictionary_samples(folder: str, pkls: List[str], max_bytes: int = RAW_DICTIONARY_SAMPLE_BYTES) -> List[bytes]:
+    samples = []
+    size = 0
+    for pkl_file in pkls:
+        if size >= max_bytes:
+            break
+        samples.append(pickle_body(os.path.join(folder, pkl_file)))
+        size = size + len(samples[-1])
+    return samples
+
+
+def pickle_body(path: str) -> bytes:
+    with open(path, "rb") as p_data:
+        return encode_chain(pickle.load(p_data))
@@ -0,0 +1,137 @@
+"""Counters, latency histograms and per-symbol timings for a run of the daily job."""
+
+# Standard libraries
+import bisect
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+import threading
+import time
+from typing import Dict
+
+# External dependencies
+
+# Application-specific imports
+
+# Constants
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+PROMETHEUS_PREFIX = "options_data_"
+
+
+class Histogram:
+    """Latency histogram with fixed bucket upper bounds, in the Prometheus style."""
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets if buckets else LATENCY_BUCKETS
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count = self.count + 1
+        self.total = self.total + value
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, fraction: float) -> float:
+        rank = fraction * self.count
+        seen = 0
+        for upper_bound, count in zip(self.buckets, self.counts):
+            seen = seen + count
+            if seen >= rank:
+                return min(upper_bound, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(i) for i in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class RunMetrics:
+    """Thread-safe registry of the counters, histograms and per-symbol values of one run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+        self.counters = {}
+        self.histograms = {}
+        self.symbols = {}
+
+    def reset(self):
+        with self.lock:
+            self.started = datetime.now()
+            self.counters = {}
+            self.histograms = {}
+            self.symbols = {}
+
+    def increment(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def add_symbol_values(self, symbol: str, **values):
+        with self.lock:
+            symbol_values = self.symbols.setdefault(symbol, {})
+            for name, value in values.items():
+                symbol_values[name] = symbol_values.get(name, 0) + value
+
+    def report(self) -> Dict:
+        with self.lock:
+            return {
+                "started": self.started.isoformat(),
+                "durationSeconds": (datetime.now() - self.started).total_seconds(),
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                "symbols": {symbol: dict(values) for symbol, values in self.symbols.items()},
+            }
+
+    def write_report(self, path: str):
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append("# TYPE " + PROMETHEUS_PREFIX + name + "_total counter")
+                lines.append(PROMETHEUS_PREFIX + name + "_total " + repr(value))
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append("# TYPE " + PROMETHEUS_PREFIX + name + " histogram")
+                cumulative = 0
+                for upper_bound, count in zip([str(i) for i in histogram.buckets] + ["+Inf"], histogram.counts):
+                    cumulative = cumulative + count
+                    lines.append(PROMETHEUS_PREFIX + name + '_bucket{le="' + upper_bound + '"} ' + str(cumulative))
+                lines.append(PROMETHEUS_PREFIX + name + "_sum " + repr(histogram.total))
+                lines.append(PROMETHEUS_PREFIX + name + "_count " + str(histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        with open(path + ".tmp", "w") as prometheus_file:
+            prometheus_file.write(self.to_prometheus())
+        os.replace(path + ".tmp", path)
+
+
+METRICS = RunMetrics()
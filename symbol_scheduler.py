@@ -0,0 +1,99 @@
+"""Priority work queue for fetching symbols, with in-queue retries and a deadline."""
+
+# Standard libraries
+from datetime import datetime
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, List
+
+# External dependencies
+
+# Application-specific imports
+from run_metrics import METRICS
+
+# Constants
+SCHEDULER_RETRY_DELAY = 30
+SCHEDULER_RETRY_CAP = 600
+
+
+class SymbolScheduler:
+    """Fetches symbols in the order they were added; failures are re-queued with backoff at their priority."""
+
+    def __init__(self, fetch_symbol: Callable[[str], bool]):
+        self.fetch_symbol = fetch_symbol
+        self.condition = threading.Condition()
+        self.ready = []
+        self.waiting = []
+        self.attempts = {}
+        self.failures = {}
+        self.in_flight = 0
+
+    def add(self, symbols: List[str], attempts: int = 1):
+        with self.condition:
+            for symbol in symbols:
+                if symbol not in self.attempts:
+                    self.attempts[symbol] = attempts
+                    heapq.heappush(self.ready, (len(self.attempts), symbol))
+
+    def run(self, workers: int = 1, deadline: datetime = None) -> List[str]:
+        deadline_at = None
+        if deadline:
+            deadline_at = time.monotonic() + (deadline - datetime.now()).total_seconds()
+        threads = [threading.Thread(target=self.work, args=(deadline_at,)) for _ in range(max(1, workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queued = len(self.ready) + len(self.waiting)
+        if queued and deadline_at is not None and time.monotonic() >= deadline_at:
+            logging.error("Deadline reached with %s symbols still queued", queued)
+        return [symbol for symbol, attempts in self.attempts.items() if attempts >= 0]
+
+    def work(self, deadline_at: float = None):
+        task = self.next_task(deadline_at)
+        while task is not None:
+            priority, symbol = task
+            succeeded = False
+            try:
+                succeeded = self.fetch_symbol(symbol)
+            except Exception:  # pylint: disable=broad-except
+                # One bad symbol must not take the worker and the rest of its queue down with it
+                logging.exception("Failed to fetch %s", symbol)
+            finally:
+                self.finish_task(priority, symbol, succeeded)
+            task = self.next_task(deadline_at)
+
+    def next_task(self, deadline_at: float = None):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if deadline_at is not None and now >= deadline_at:
+                    return None
+                while self.waiting and self.waiting[0][0] <= now:
+                    _, priority, symbol = heapq.heappop(self.waiting)
+                    heapq.heappush(self.ready, (priority, symbol))
+                if self.ready:
+                    self.in_flight = self.in_flight + 1
+                    return heapq.heappop(self.ready)
+                if not self.waiting and not self.in_flight:
+                    return None
+                timeouts = [self.waiting[0][0] - now] if self.waiting else []
+                if deadline_at is not None:
+                    timeouts.append(deadline_at - now)
+                self.condition.wait(min(timeouts) if timeouts else None)
+
+    def finish_task(self, priority: int, symbol: str, succeeded: bool):
+        with self.condition:
+            self.in_flight = self.in_flight - 1
+            if succeeded:
+                self.attempts[symbol] = -1
+            else:
+                self.attempts[symbol] = self.attempts[symbol] - 1
+                self.failures[symbol] = self.failures.get(symbol, 0) + 1
+                if self.attempts[symbol] > 0:
+                    METRICS.increment("scheduler_requeued")
+                    delay = min(SCHEDULER_RETRY_CAP, SCHEDULER_RETRY_DELAY * 2 ** (self.failures[symbol] - 1))
+                    heapq.heappush(self.waiting, (time.monotonic() + delay, priority, symbol))
+            self.condition.notify_all()
@@ -0,0 +1,133 @@
+"""CBOE optionable symbol universe, cached on disk in sorted versions with a diff report between them."""
+
+# Standard libraries
+import bisect
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List
+
+# External dependencies
+import requests
+
+# Application-specific imports
+
+# Constants
+CBOE_SYMBOLS_URL = "http://markets.cboe.com/us/options/symboldir/equity_index_options/?download=csv"
+CBOE_MINIMUM_SYMBOLS = 9000
+SYMBOL_UNIVERSE_TTL_HOURS = 24
+SYMBOL_VERSION_PREFIX = "symbols_"
+SYMBOL_VERSION_SUFFIX = ".txt"
+DIFF_REPORT_SUFFIX = ".diff.json"
+
+
+class SymbolSet:
+    """Sorted, de-duplicated symbols with binary-search membership, cheaper to hold and ship than a hash set."""
+
+    def __init__(self, symbols: Iterable[str] = ()):
+        self.symbols = sorted(set(symbols))
+
+    def __contains__(self, symbol: str) -> bool:
+        index = bisect.bisect_left(self.symbols, symbol)
+        return index < len(self.symbols) and self.symbols[index] == symbol
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.symbols)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SymbolSet) and self.symbols == other.symbols
+
+    def diff(self, previous: "SymbolSet") -> Dict[str, List[str]]:
+        return {
+            "added": [symbol for symbol in self.symbols if symbol not in previous],
+            "removed": [symbol for symbol in previous.symbols if symbol not in self],
+        }
+
+
+class SymbolUniverse:
+    """Serves the CBOE symbol list from the newest cached version until it is older than the TTL."""
+
+    def __init__(
+        self, url: str = CBOE_SYMBOLS_URL, cache_dir: str = None, ttl_hours: float = SYMBOL_UNIVERSE_TTL_HOURS
+    ):
+        self.url = url
+        self.cache_dir = cache_dir
+        self.ttl = timedelta(hours=ttl_hours)
+
+    def versions(self) -> List[str]:
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return []
+        return sorted(
+            os.path.join(self.cache_dir, i)
+            for i in os.listdir(self.cache_dir)
+            if i.startswith(SYMBOL_VERSION_PREFIX) and i.endswith(SYMBOL_VERSION_SUFFIX)
+        )
+
+    def load(self, refresh: bool = False) -> SymbolSet:
+        versions = self.versions()
+        if versions and not refresh:
+            age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(versions[-1]))
+            if age < self.ttl:
+                logging.info("Using the symbol universe cached in %s", versions[-1])
+                return read_symbol_version(versions[-1])
+        try:
+            symbols = SymbolSet(get_cboe_symbols(self.url))
+        except (requests.exceptions.RequestException, ValueError) as error:
+            if not versions:
+                raise
+            logging.error("Failed to refresh the symbol universe, using %s: %s", versions[-1], error)
+            return read_symbol_version(versions[-1])
+        if self.cache_dir:
+            self.store(symbols, versions[-1] if versions else None)
+        return symbols
+
+    def store(self, symbols: SymbolSet, latest_version: str = None):
+        previous = read_symbol_version(latest_version) if latest_version else SymbolSet()
+        if latest_version and symbols == previous:
+            os.utime(latest_version)
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        version = os.path.join(
+            self.cache_dir, SYMBOL_VERSION_PREFIX + datetime.now().strftime("%Y%m%d%H%M%S") + SYMBOL_VERSION_SUFFIX
+        )
+        with open(version + ".tmp", "w") as version_file:
+            version_file.write("\n".join(symbols) + "\n")
+        os.replace(version + ".tmp", version)
+        diff = symbols.diff(previous)
+        with open(version[: -len(SYMBOL_VERSION_SUFFIX)] + DIFF_REPORT_SUFFIX, "w") as diff_file:
+            json.dump(dict(diff, previous=latest_version, symbols=len(symbols)), diff_file, indent=2)
+        logging.info("Symbol universe changed: %s added, %s removed", len(diff["added"]), len(diff["removed"]))
+
+
+def read_symbol_version(path: str) -> SymbolSet:
+    with open(path) as version_file:
+        return SymbolSet(line for line in version_file.read().splitlines() if line)
+
+
+def get_cboe_symbols(url: str = CBOE_SYMBOLS_URL) -> List[str]:
+    rows = requests.get(url, timeout=32).text.splitlines()
+    symbols = []
+    for row in rows:
+        try:
+            symbol_candidate = row.split('","')[1]
+        except IndexError:
+            logging.info("Row is not parsable: %s", row)
+            continue
+        if "#" not in symbol_candidate:
+            symbols.append(symbol_candidate)
+    symbols = list(set(symbols))
+    symbols.sort()
+    logging.info("Got %s symbols from CBOE", len(symbols))
+    if len(symbols) < CBOE_MINIMUM_SYMBOLS:
+        raise ValueError("Too few symbols (" + str(len(symbols)) + "). You should check what's going on")
+    return symbols
+
+
+def as_symbol_set(symbols: Iterable[str] = None) -> SymbolSet:
+    if symbols is None or isinstance(symbols, SymbolSet):
+        return symbols
+    return SymbolSet(symbols)
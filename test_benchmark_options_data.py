@@ -0,0 +1,54 @@
+"""Tests for benchmark_options_data module."""
+
+# Standard libraries
+import unittest
+from unittest import mock
+
+# External dependencies
+
+# Application-specific imports
+from benchmark_options_data import (
+    BENCHMARK_DATE,
+    compare_to_baseline,
+    make_synthetic_tos_chain,
+    mongomock,
+    run_stage,
+)
+from chain_analytics import ANALYTICS_COLLECTION
+from contract_series import CONTRACTS_COLLECTION
+from hod_chain import tos_to_hod
+
+
+class TestBenchmarkOptionsData(unittest.TestCase):
+    def test_synthetic_chain_converts(self):
+        tos_data = make_synthetic_tos_chain("SPX", 3, 5)
+        self.assertEqual(tos_data, make_synthetic_tos_chain("SPX", 3, 5))
+        hod_data = tos_to_hod(tos_data, BENCHMARK_DATE)
+        self.assertEqual(len(hod_data["chain"]), tos_data["numberOfContracts"])
+        self.assertEqual(len(hod_data["chain"]), 30)
+
+    def test_compare_to_baseline(self):
+        baseline = {"tos_to_hod/spx": {"contractsPerSecond": 1000}, "csv_to_db/spx": {"contractsPerSecond": 1000}}
+        results = {
+            "tos_to_hod/spx": {"contractsPerSecond": 950},
+            "csv_to_db/spx": {"contractsPerSecond": 800},
+            "pickle_to_db/spx": {"contractsPerSecond": 1},
+        }
+        self.assertEqual(compare_to_baseline(results, baseline), ["csv_to_db/spx: 800 contracts/s, baseline 1000"])
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    @mock.patch.dict("benchmark_options_data.CHAIN_SIZES", {"tiny": (3, 2, 4)})
+    def test_csv_to_db_stage_on_mongomock(self):
+        db_handle = mongomock.MongoClient().options
+        with mock.patch("benchmark_options_data.get_benchmark_db", return_value=db_handle):
+            result = run_stage("csv_to_db", "tiny")
+        self.assertEqual(result["contracts"], 3 * 2 * 4 * 2)
+        self.assertEqual(db_handle.options_data.count_documents({}), 3)
+        self.assertTrue(0 <= result["measureRssMb"] <= result["peakRssMb"])
+        # The contract series and analytics upserts are skipped on mongomock instead of failing the stage
+        self.assertEqual(db_handle[CONTRACTS_COLLECTION].count_documents({}), 0)
+        self.assertEqual(db_handle[ANALYTICS_COLLECTION].count_documents({}), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
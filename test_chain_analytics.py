@@ -0,0 +1,89 @@
+"""Tests for chain_analytics module."""
+
+# Standard libraries
+from datetime import datetime
+import math
+import unittest
+from unittest import mock
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# Application-specific imports
+from chain_analytics import SURFACE_DAYS, SURFACE_MONEYNESS, ChainAnalytics, chain_summary
+from hod_chain import HOD_SCHEMA_VERSION
+from options_data_downloader import BatchInserter
+from test_contract_series import make_bulk_collection
+
+# Strike: (put IV, put delta, call IV, call delta) of the nearer expiration
+SMILE = {
+    90.0: (0.30, -0.10, 0.29, 0.90),
+    95.0: (0.25, -0.20, 0.24, 0.80),
+    100.0: (0.20, -0.45, 0.19, 0.55),
+    105.0: (0.19, -0.70, 0.18, 0.30),
+    110.0: (0.18, -0.85, 0.17, 0.15),
+}
+
+
+def make_document(data_date: str = "20200102") -> dict:
+    rows = []
+    for expiration, iv_shift in [(datetime(2020, 1, 31), 0.0), (datetime(2020, 4, 1), 0.05)]:
+        for strike, (put_iv, put_delta, call_iv, call_delta) in SMILE.items():
+            sides = [("put", put_iv, put_delta, 20), ("call", call_iv, call_delta, 10)]
+            for option_type, iv, delta, volume in sides:
+                row = {"UnderlyingPrice": 101.0, "Type": option_type, "Expiration": expiration, "Strike": strike}
+                rows.append(dict(row, IV=iv + iv_shift, Delta=delta, Volume=volume, OpenInterest=volume * 3))
+    rows[-1]["Volume"] = None
+    return {"symbol": "XYZ", "dataDate": data_date, "schemaVersion": HOD_SCHEMA_VERSION, "chain": rows}
+
+
+class TestChainAnalytics(unittest.TestCase):
+    def test_chain_summary(self):
+        summary = chain_summary(make_document())
+        self.assertEqual(summary["volume"], {"call": 90.0, "put": 200.0, "total": 290.0})
+        self.assertEqual(summary["putCallVolumeRatio"], round(200 / 90, 4))
+        self.assertEqual(summary["putCallOpenInterestRatio"], 2.0)
+        near, far = summary["expirations"]
+        self.assertEqual((near["days"], far["days"]), (29, 90))
+        # Between the 100 put (0.20) and the 105 call (0.18)
+        self.assertEqual(near["atmIV"], 0.196)
+        self.assertEqual((near["putIV25"], near["callIV25"]), (0.24, 0.1767))
+        self.assertEqual(near["skew25"], 0.0633)
+        self.assertEqual(far["atmIV"], 0.246)
+
+        surface = summary["surface"]
+        atm = surface["iv"][SURFACE_DAYS.index(30)][SURFACE_MONEYNESS.index(1.0)]
+        variance = 0.196**2 * 29 + (0.246**2 * 90 - 0.196**2 * 29) / 61
+        self.assertAlmostEqual(atm, math.sqrt(variance / 30), 4)
+        self.assertIsNone(surface["iv"][SURFACE_DAYS.index(7)][SURFACE_MONEYNESS.index(1.0)])
+        self.assertIsNone(surface["iv"][SURFACE_DAYS.index(30)][SURFACE_MONEYNESS.index(0.8)])
+        self.assertNotIn("fetchProfile", summary)
+        self.assertEqual(chain_summary(dict(make_document(), fetchProfile="narrow"))["fetchProfile"], "narrow")
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    @mock.patch("chain_analytics.UpdateOne", lambda update_filter, update, upsert: (update_filter, update))
+    def test_inserted_chains_feed_the_analytics(self):
+        analytics = ChainAnalytics(make_bulk_collection(), batch_size=1)
+        options_data = mock.MagicMock()
+        options_data.insert_many.side_effect = lambda documents, ordered: mock.MagicMock(inserted_ids=documents)
+        inserter = BatchInserter(options_data, 2, chain_analytics=analytics)
+        for data_date in ["20200102", "20200103", "20200102"]:
+            inserter.add(make_document(data_date))
+        inserter.add({"symbol": "XYZ", "dataDate": "20200106", "chain": []})
+        inserter.flush()
+
+        summaries = list(analytics.summaries("XYZ", ("20200102", None), ["putCallVolumeRatio"]))
+        self.assertEqual(
+            summaries,
+            [
+                {"symbol": "XYZ", "dataDate": "20200102", "putCallVolumeRatio": 2.2222},
+                {"symbol": "XYZ", "dataDate": "20200103", "putCallVolumeRatio": 2.2222},
+            ],
+        )
+        self.assertEqual(len(list(analytics.summaries(["ABC"]))), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
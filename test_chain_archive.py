@@ -0,0 +1,67 @@
+"""Tests for chain_archive module."""
+
+# Standard libraries
+import os
+import tempfile
+import unittest
+
+# External dependencies
+import numpy as np
+
+# Application-specific imports
+from chain_archive import ChainArchive, ChainArchiveWriter
+from hod_chain import tos_to_columns
+from test_hod_chain import make_tos_chain
+
+
+class TestChainArchive(unittest.TestCase):
+    def write_archive(self, tmp_dir: str, compress: bool) -> str:
+        chain = make_tos_chain()
+        other_chain = dict(make_tos_chain(), symbol="BF.B", underlyingPrice=40.5, fetchProfile="narrow")
+        archive_path = os.path.join(tmp_dir, "20191217.chains")
+        with ChainArchiveWriter(archive_path, "20191217", compress) as writer:
+            writer.add(tos_to_columns(chain, "20191217"))
+            writer.add(tos_to_columns(other_chain, "20191217"))
+        self.assertEqual(os.listdir(tmp_dir), ["20191217.chains"])
+        return archive_path
+
+    def test_round_trip(self):
+        expected = tos_to_columns(make_tos_chain(), "20191217")
+        for compress in [False, True]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                archive = ChainArchive(self.write_archive(tmp_dir, compress))
+                self.assertEqual(archive.symbols(), ["BAK", "BF.B"])
+                self.assertEqual(archive.row_counts(), {"BAK": 3, "BF.B": 3})
+                chain_columns = archive.read_chain("BAK")
+                self.assertEqual(chain_columns.to_rows(), expected.to_rows())
+                self.assertEqual(chain_columns.to_typed_rows(), expected.to_typed_rows())
+                self.assertEqual(archive.read_chain("BF.B").underlying_price, 40.5)
+                self.assertEqual([archive.read_chain(i).fetch_profile for i in ["BAK", "BF.B"]], [None, "narrow"])
+                del archive, chain_columns
+
+    def test_uncompressed_columns_are_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = ChainArchive(self.write_archive(tmp_dir, False))
+            bid = archive.read_column("BAK", "Bid")
+            self.assertIsInstance(bid, np.memmap)
+            self.assertEqual(bid.tolist(), [0.0, 0.0, 18.5])
+            self.assertEqual(archive.read_column("BAK", "OptionSymbol")[2], "BAK_122019P35")
+            self.assertEqual(list(archive.read_chain("BAK", ["Volume"]).columns), ["Volume"])
+            del archive, bid
+
+    def test_rejects_duplicate_symbols_and_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = os.path.join(tmp_dir, "20191217.chains")
+            with self.assertRaises(ValueError):
+                with ChainArchiveWriter(archive_path, "20191217") as writer:
+                    writer.add(tos_to_columns(make_tos_chain(), "20191217"))
+                    writer.add(tos_to_columns(make_tos_chain(), "20191217"))
+            self.assertEqual(os.listdir(tmp_dir), [])
+            with open(archive_path, "wb") as archive_file:
+                archive_file.write(b"not an archive at all")
+            with self.assertRaises(ValueError):
+                ChainArchive(archive_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
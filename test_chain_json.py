@@ -0,0 +1,32 @@
+"""Tests for chain_json module."""
+
+# Standard libraries
+import json
+import math
+import unittest
+
+# External dependencies
+
+# Application-specific imports
+from chain_json import JSON_DECODERS, JsonDecoder
+from test_hod_chain import make_tos_chain
+
+
+class TestJsonDecoder(unittest.TestCase):
+    def test_decoders_agree(self):
+        body = json.dumps(make_tos_chain()).encode()
+        for name in JSON_DECODERS:
+            self.assertEqual(JsonDecoder(name).decode(body), make_tos_chain())
+
+    def test_nan_literals_and_errors(self):
+        for name in JSON_DECODERS:
+            decoder = JsonDecoder(name)
+            self.assertTrue(math.isnan(decoder.decode(b'{"volatility": NaN}')["volatility"]))
+            with self.assertRaises(json.JSONDecodeError):
+                decoder.decode(b'{"status": "SUCC')
+        with self.assertRaises(ValueError):
+            JsonDecoder("simdjson")
+
+
+if __name__ == "__main__":
+    unittest.main()
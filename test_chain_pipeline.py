@@ -0,0 +1,72 @@
+"""Tests for chain_pipeline module."""
+
+# Standard libraries
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# External dependencies
+from pymongo.errors import AutoReconnect
+
+# Application-specific imports
+from chain_archive import ChainArchive, ChainArchiveWriter
+from chain_pipeline import ChainPipeline
+from options_data_downloader import BatchInserter
+from test_hod_chain import make_tos_chain
+
+
+def fetch_chain(symbol: str) -> dict:
+    if symbol == "FAILING":
+        return {}
+    if symbol == "MALFORMED":
+        return {"symbol": symbol, "status": "SUCCESS"}
+    return dict(make_tos_chain(), symbol=symbol)
+
+
+class TestChainPipeline(unittest.TestCase):
+    def test_fetch_convert_and_store(self):
+        collection = mock.MagicMock()
+        collection.insert_many.side_effect = lambda documents, ordered: mock.MagicMock(inserted_ids=documents)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = os.path.join(tmp_dir, "20191217.chains")
+            stored_symbols = {"MSFT"}
+            with self.assertLogs(level="ERROR") as logs:
+                with ChainPipeline(
+                    fetch_chain,
+                    BatchInserter(collection, batch_size=2),
+                    stored_symbols,
+                    "20191217",
+                    ChainArchiveWriter(archive_path, "20191217"),
+                ) as pipeline:
+                    failed_symbols = pipeline.fetch(["AAPL", "FAILING", "MSFT", "MALFORMED", "$SPX.X"], workers=3)
+                    self.assertEqual(pipeline.fetch(["AAPL", "FAILING"]), ["FAILING"])
+            self.assertEqual(sorted(ChainArchive(archive_path).symbols()), ["AAPL", "SPX"])
+        self.assertEqual(failed_symbols, ["FAILING", "MALFORMED"])
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(stored_symbols, {"MSFT", "AAPL", "$SPX.X"})
+        documents = [document for call in collection.insert_many.call_args_list for document in call[0][0]]
+        self.assertEqual(
+            sorted((i["symbol"], i["dataDate"]) for i in documents), [("AAPL", "20191217"), ("SPX", "20191217")]
+        )
+        self.assertEqual(pipeline.inserter.inserted, 2)
+
+    def test_failed_writes_are_reported(self):
+        collection = mock.MagicMock()
+        collection.insert_many.side_effect = [
+            AutoReconnect("connection reset"),
+            mock.MagicMock(inserted_ids=[1]),
+        ]
+        stored_symbols = set()
+        with self.assertLogs(level="ERROR") as logs:
+            inserter = BatchInserter(collection, batch_size=1)
+            with ChainPipeline(fetch_chain, inserter, stored_symbols, "20191217") as pipeline:
+                self.assertEqual(pipeline.fetch(["AAPL", "IBM"]), [])
+        self.assertEqual(pipeline.failed_symbols(), ["AAPL"])
+        self.assertEqual(stored_symbols, {"IBM"})
+        self.assertIn("AutoReconnect", logs.output[0])
+        self.assertIn("Could not store 1 symbols", logs.output[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Tests for chain_query module."""
+
+# Standard libraries
+from datetime import datetime
+import unittest
+
+# External dependencies
+from pymongo import ASCENDING
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# Application-specific imports
+from chain_query import ChainQuery, query_pipeline
+from hod_chain import hod_document, tos_to_columns
+from test_hod_chain import make_tos_chain
+
+
+def make_collection():
+    collection = mongomock.MongoClient().options.options_data
+    for data_date in ["20191216", "20191217", "20191218"]:
+        collection.insert_one(hod_document(tos_to_columns(make_tos_chain(), data_date)))
+    other_chain = tos_to_columns(dict(make_tos_chain(), symbol="BF.B"), "20191217")
+    other_chain.columns["OptionSymbol"] = [i.replace("BAK", "BF.B") for i in other_chain.columns["OptionSymbol"]]
+    collection.insert_one(hod_document(other_chain))
+    collection.insert_one(hod_document(tos_to_columns(make_tos_chain(), "20191219"), typed=False))
+    return collection
+
+
+class TestChainQuery(unittest.TestCase):
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def test_contract_history(self):
+        query = ChainQuery(make_collection())
+        query.create_indexes()
+        index_keys = [i["key"] for i in query.collection.index_information().values()]
+        self.assertIn([("chain.OptionSymbol", ASCENDING), ("dataDate", ASCENDING)], index_keys)
+        history = query.contract_history("BAK_011720C40", ("20191217", None), ["Strike", "Bid", "Expiration"])
+        self.assertEqual(
+            history,
+            [
+                {"Strike": 40.0, "Bid": 0.0, "Expiration": datetime(2020, 1, 17), "dataDate": "20191217"},
+                {"Strike": 40.0, "Bid": 0.0, "Expiration": datetime(2020, 1, 17), "dataDate": "20191218"},
+            ],
+        )
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def test_chains_with_row_filter(self):
+        query = ChainQuery(make_collection())
+        documents = list(
+            query.chains(["BAK", "BF.B"], ("20191217", "20191217"), {"Type": "call", "Strike": (30, 36)}, ["AKA"])
+        )
+        self.assertEqual(
+            [(i["symbol"], i["dataDate"], i["chain"]) for i in documents],
+            [("BAK", "20191217", [{"AKA": "BAK_122019C35"}]), ("BF.B", "20191217", [{"AKA": "BF.B_122019C35"}])],
+        )
+        self.assertEqual(list(query.chains("BAK", row_filter={"Expiration": datetime(2021, 1, 15)})), [])
+        self.assertEqual(len(list(query.chains("BAK", row_filter={"Type": ["call", "put"]}))), 3)
+
+    def test_query_pipeline(self):
+        pipeline = query_pipeline("SPX", ("20200101", None), {"Strike": (3000, None)}, ["Bid"])
+        self.assertEqual(pipeline[0]["$match"]["dataDate"], {"$gte": "20200101"})
+        self.assertEqual(pipeline[0]["$match"]["chain"], {"$elemMatch": {"Strike": {"$gte": 3000}}})
+        self.assertEqual(
+            pipeline[2]["$project"]["chain"]["$map"]["input"]["$filter"]["cond"],
+            {"$and": [{"$gte": ["$$row.Strike", 3000]}]},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests for contract_series module."""
+
+# Standard libraries
+from datetime import datetime
+import unittest
+from unittest import mock
+
+# External dependencies
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# Application-specific imports
+from contract_series import ContractSeries
+from hod_chain import hod_document, tos_to_columns
+from options_data_downloader import BatchInserter
+from test_hod_chain import make_tos_chain
+
+
+def make_bulk_collection():
+    """mongomock does not take the UpdateOne of current pymongo versions, so bulk writes are replayed one by one."""
+    collection = mongomock.MongoClient().options.options_contracts
+    bulk_collection = mock.MagicMock(wraps=collection)
+
+    def bulk_write(updates, ordered):  # pylint: disable=unused-argument
+        errors = []
+        for index, (update_filter, update) in enumerate(updates):
+            try:
+                collection.update_one(update_filter, update, upsert=True)
+            except DuplicateKeyError as error:
+                errors.append({"index": index, "code": error.code})
+        if errors:
+            details = {"nUpserted": 0, "nModified": len(updates) - len(errors), "writeErrors": errors}
+            raise BulkWriteError(details)
+        return mock.MagicMock(upserted_count=0, modified_count=len(updates))
+
+    bulk_collection.bulk_write.side_effect = bulk_write
+    return bulk_collection
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+@mock.patch("contract_series.UpdateOne", lambda update_filter, update, upsert: (update_filter, update))
+class TestContractSeries(unittest.TestCase):
+    def test_inserted_chains_feed_the_contract_series(self):
+        series = ContractSeries(make_bulk_collection(), batch_size=2)
+        options_data = mock.MagicMock()
+        options_data.insert_many.side_effect = lambda documents, ordered: mock.MagicMock(inserted_ids=documents)
+        inserter = BatchInserter(options_data, 2, series)
+        for data_date in ["20191218", "20191217"]:
+            inserter.add(hod_document(tos_to_columns(make_tos_chain(), data_date)))
+        inserter.add(hod_document(tos_to_columns(make_tos_chain(), "20191217")))
+        inserter.add(hod_document(tos_to_columns(make_tos_chain(), "20191219"), typed=False))
+        inserter.add(hod_document(tos_to_columns(dict(make_tos_chain(), fetchProfile="narrow"), "20191220")))
+        inserter.flush()
+
+        history = series.history("BAK_011720C40")
+        self.assertEqual(
+            (history["symbol"], history["Type"], history["Strike"], history["Expiration"]),
+            ("BAK", "call", 40.0, datetime(2020, 1, 17)),
+        )
+        self.assertEqual(
+            [(i["dataDate"], i.get("fetchProfile")) for i in history["days"]],
+            [("20191217", None), ("20191218", None), ("20191220", "narrow")],
+        )
+        self.assertEqual(series.duplicates, 3)
+
+    def test_rebuild(self):
+        source = mongomock.MongoClient().options.options_data
+        for data_date in ["20191216", "20191217", "20191218"]:
+            source.insert_one(hod_document(tos_to_columns(make_tos_chain(), data_date)))
+        series = ContractSeries(make_bulk_collection())
+        self.assertEqual(series.rebuild(source, ("20191217", None)), 2)
+        self.assertEqual([i["dataDate"] for i in series.history("BAK_122019P35")["days"]], ["20191217", "20191218"])
+
+
+if __name__ == "__main__":
+    unittest.main()
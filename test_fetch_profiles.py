@@ -0,0 +1,89 @@
+"""Tests for fetch_profiles module."""
+
+# Standard libraries
+from datetime import datetime, timedelta
+import unittest
+
+# External dependencies
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# Application-specific imports
+from fetch_profiles import (
+    FULL_FETCH,
+    NARROW_FETCH,
+    SKIP_FETCH,
+    classify_symbol,
+    plan_fetches,
+    query_symbol_activity,
+    rank_by_activity,
+)
+from hod_chain import HOD_SCHEMA_VERSION
+
+
+def make_document(symbol: str, days_ago: int, volumes: list, open_interest: int = 10) -> dict:
+    return {
+        "symbol": symbol,
+        "dataDate": (datetime.now() - timedelta(days=days_ago)).strftime("%Y%m%d"),
+        "schemaVersion": HOD_SCHEMA_VERSION,
+        "chain": [{"Volume": volume, "OpenInterest": open_interest} for volume in volumes],
+    }
+
+
+class TestFetchProfiles(unittest.TestCase):
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def test_query_and_rank_symbol_activity(self):
+        collection = mongomock.MongoClient().options.options_data
+        collection.insert_many(
+            [
+                make_document("SPY", 1, [500, 20]),
+                make_document("SPY", 2, [900]),
+                dict(make_document("SPY", 3, [5]), fetchProfile=NARROW_FETCH),
+                dict(make_document("THIN", 1, [5]), fetchProfile=NARROW_FETCH),
+                make_document("DEAD", 1, []),
+                make_document("STALE", 1, [0, 0]),
+                make_document("STALE", 2, [0, 0]),
+                make_document("OLD", 30, [100]),
+                dict(make_document("UNTYPED", 1, ["5"]), schemaVersion=None),
+            ]
+        )
+        activity = query_symbol_activity(collection)
+        self.assertEqual(rank_by_activity(activity), ["SPY", "STALE", "DEAD"])
+        self.assertEqual(
+            {i: activity["SPY"][i] for i in ["days", "contracts", "volume", "maxContracts", "maxVolume"]},
+            {"days": 2, "contracts": 2, "volume": 520, "maxContracts": 2, "maxVolume": 900},
+        )
+        self.assertEqual(activity["STALE"]["openInterest"], [20])
+
+    def test_classify_symbol(self):
+        static = {"days": 2, "maxContracts": 4, "maxVolume": 0, "openInterest": [20]}
+        thin = {"days": 2, "maxContracts": 4, "maxVolume": 3, "openInterest": [20, 21]}
+        liquid = dict(thin, maxVolume=5000)
+        days = [datetime(2020, 1, 6) + timedelta(days=i) for i in range(5)]
+        self.assertEqual(classify_symbol("NEW", None, days[0]), FULL_FETCH)
+        self.assertEqual(classify_symbol("THIN", thin, days[0]), NARROW_FETCH)
+        self.assertEqual(classify_symbol("SPY", liquid, days[0]), FULL_FETCH)
+        empty = dict(static, maxContracts=0, days=1)
+        for symbol, stats in [("STALE", static), ("DEAD", empty)]:
+            profiles = sorted(classify_symbol(symbol, stats, day) for day in days)
+            self.assertEqual(profiles, [FULL_FETCH] + [SKIP_FETCH] * 4)
+
+    def test_plan_fetches(self):
+        activity = {
+            "THIN": {"days": 2, "maxContracts": 4, "maxVolume": 3, "openInterest": [20, 21]},
+            "DEAD": {"days": 1, "maxContracts": 0, "maxVolume": 0, "openInterest": [0]},
+        }
+        today = datetime(2020, 1, 6)
+        days = [today + timedelta(days=i) for i in range(5)]
+        skipped_days = sum("DEAD" in plan_fetches(["DEAD"], activity, day)[1] for day in days)
+        fetch_params, skipped = plan_fetches(["THIN", "NEW"], activity, today)
+        self.assertEqual(skipped_days, 4)
+        self.assertEqual(list(fetch_params), ["THIN"])
+        self.assertEqual(fetch_params["THIN"]["toDate"], "2020-05-05")
+        self.assertEqual(skipped, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
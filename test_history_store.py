@@ -0,0 +1,100 @@
+"""Tests for history_store module."""
+
+# Standard libraries
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# External dependencies
+import numpy as np
+
+# Application-specific imports
+from chain_analytics import SURFACE_DAYS, SURFACE_MONEYNESS
+from chain_archive import ChainArchiveWriter
+from history_store import HistoryStore, HistoryStoreWriter, archives_to_history_store, rolling_extreme, rolling_mean
+from hod_chain import tos_to_columns
+from test_hod_chain import make_tos_chain
+
+DATES = ["2020010" + str(i) for i in range(1, 8)]
+
+
+def make_summary(symbol: str, data_date: str, volume: float, open_interest: float, atm_iv: float) -> dict:
+    surface = [[None] * len(SURFACE_MONEYNESS) for _ in SURFACE_DAYS]
+    surface[SURFACE_DAYS.index(30)][SURFACE_MONEYNESS.index(1.0)] = atm_iv
+    return {
+        "symbol": symbol,
+        "dataDate": data_date,
+        "underlyingPrice": 100.0,
+        "volume": {"call": volume / 2, "put": volume / 2, "total": volume},
+        "openInterest": {"call": open_interest, "put": 0.0, "total": open_interest},
+        "surface": {"moneyness": SURFACE_MONEYNESS, "days": SURFACE_DAYS, "iv": surface},
+    }
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.temp_dir.name, "history")
+        with HistoryStoreWriter(self.path, ["AAA", "BBB", "CCC", "DDD"], DATES) as writer:
+            for day, data_date in enumerate(DATES):
+                writer.add(make_summary("AAA", data_date, 100, 1000 + day, 0.2 + day / 100))
+                if day == 3:
+                    writer.add(dict(make_summary("DDD", data_date, 1, 1, 0.5), fetchProfile="narrow"))
+                writer.add(make_summary("BBB", data_date, 500 if day == 6 else 100, 1000, 0.3 - day / 100))
+                if day != 2:
+                    writer.add(make_summary("CCC", data_date, 300 if day == 6 else 100, 2000 * (day + 1), None))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_unusual_volume(self):
+        store = HistoryStore(self.path)
+        self.assertEqual(store.panel("callVolume")[1, 6], 250.0)
+        self.assertTrue(np.isnan(store.panel("volume")[2, 2]))
+        self.assertTrue(np.isnan(store.panel("volume")[3]).all())
+        with mock.patch("history_store.SCAN_ROWS_PER_WORKER", 2):
+            hits = store.scan("unusual_volume", 3, filters={"score": (2, None)})
+        self.assertEqual(
+            hits,
+            [
+                {"symbol": "BBB", "dataDate": "20200107", "score": 5.0},
+                {"symbol": "CCC", "dataDate": "20200107", "score": 3.0},
+            ],
+        )
+        self.assertEqual(len(store.scan("unusual_volume", 3, ("20200101", None))), 12)
+        self.assertEqual(store.scan("unusual_volume", 3, ("20200108", None)), [])
+
+    def test_iv_rank_and_filters(self):
+        store = HistoryStore(self.path, processes=2)
+        with mock.patch("history_store.SCAN_ROWS_PER_WORKER", 1):
+            hits = store.scan("iv_rank", 5, ("20200106", "20200107"), {"openInterest": (None, 1005)})
+        self.assertEqual(
+            [(i["symbol"], i["dataDate"], round(i["score"], 6)) for i in hits],
+            [("AAA", "20200106", 100.0), ("BBB", "20200106", 0.0), ("BBB", "20200107", 0.0)],
+        )
+        hits = store.scan("oi_change", 2, ("20200104", "20200105"))
+        self.assertEqual(
+            [(i["symbol"], round(i["score"], 3)) for i in hits[:3]], [("CCC", 1.0), ("AAA", 0.002), ("BBB", 0.0)]
+        )
+
+    def test_rolling_windows(self):
+        values = np.array([[1.0, 2.0, np.nan, 4.0, 6.0]])
+        np.testing.assert_allclose(rolling_mean(values, 2), [[np.nan, 1.5, 2.0, 4.0, 5.0]])
+        np.testing.assert_allclose(rolling_extreme(values, 3, np.fmax), [[np.nan, np.nan, 2.0, 4.0, 6.0]])
+        self.assertTrue(np.isnan(rolling_extreme(values, 6, np.fmin)).all())
+
+    def test_archives_to_history_store(self):
+        archive_paths = []
+        for data_date in ["20191217", "20191218"]:
+            archive_paths.append(os.path.join(self.temp_dir.name, data_date + ".chains"))
+            with ChainArchiveWriter(archive_paths[-1], data_date) as writer:
+                writer.add(tos_to_columns(make_tos_chain(), data_date))
+        self.assertEqual(archives_to_history_store(self.path, archive_paths, processes=2), 2)
+        store = HistoryStore(self.path)
+        self.assertEqual((store.symbols, store.dates), (["BAK"], ["20191217", "20191218"]))
+        self.assertEqual(store.panel("underlyingPrice").tolist(), [[7.145, 7.145]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+"""Tests for hod_chain module."""
+
+# Standard libraries
+import csv
+from datetime import datetime
+import gzip
+import os
+import tempfile
+import unittest
+
+# External dependencies
+import numpy as np
+
+# Application-specific imports
+from hod_chain import (
+    HOD_COLUMNS,
+    HOD_SCHEMA_VERSION,
+    HodCsvWriter,
+    hod_document,
+    tos_to_columns,
+    tos_to_hod,
+    typed_hod_row,
+    zstandard,
+)
+
+
+def make_tos_contract(symbol: str, exchange: str = "OPR", **values) -> dict:
+    contract = {
+        "symbol": symbol,
+        "exchangeName": exchange,
+        "bid": 0.0,
+        "ask": 5.0,
+        "last": 0.0,
+        "totalVolume": 0,
+        "openInterest": 0,
+        "delta": 0.16,
+        "gamma": 0.032,
+        "volatility": 1000.0,
+        "theta": -0.227,
+        "vega": 0.002,
+    }
+    contract.update(values)
+    return contract
+
+
+def make_tos_chain() -> dict:
+    return {
+        "symbol": "$BAK.X",
+        "numberOfContracts": 3,
+        "underlying": None,
+        "underlyingPrice": 7.145,
+        "callExpDateMap": {
+            "2019-12-20:3": {"35.0": [make_tos_contract("BAK_122019C35")]},
+            "2020-01-17:31": {"40.0": [make_tos_contract("BAK_011720C40", volatility=None, theta=None)]},
+        },
+        "putExpDateMap": {
+            "2019-12-20:3": {
+                "35.0": [make_tos_contract("BAK_122019P35", bid=18.5, ask=23.5, delta=-1.0, volatility=5.0)]
+            }
+        },
+    }
+
+
+class TestHodChain(unittest.TestCase):
+    def test_tos_to_columns_keeps_typed_arrays(self):
+        chain_columns = tos_to_columns(make_tos_chain(), "20191217")
+        self.assertEqual(len(chain_columns), 3)
+        self.assertEqual((chain_columns.symbol, chain_columns.underlying_price), ("BAK", 7.145))
+        self.assertEqual(chain_columns.columns["Type"], ["call", "call", "put"])
+        self.assertEqual(chain_columns.columns["Expiration"].dtype, np.dtype("datetime64[D]"))
+        self.assertEqual(chain_columns.columns["Volume"].dtype, np.int64)
+        self.assertTrue(np.isnan(chain_columns.columns["IV"][1]))
+        self.assertEqual(chain_columns.columns["Bid"].tolist(), [0.0, 0.0, 18.5])
+
+    def test_tos_to_hod(self):
+        hod_data = tos_to_hod(make_tos_chain(), "20191217")
+        self.assertEqual((hod_data["symbol"], hod_data["dataDate"], len(hod_data["chain"])), ("BAK", "20191217", 3))
+        self.assertEqual(
+            hod_data["chain"][0],
+            {
+                "UnderlyingSymbol": "BAK",
+                "UnderlyingPrice": "7.145",
+                "Exchange": "OPR",
+                "OptionSymbol": "BAK_122019C35",
+                "OptionExt": "",
+                "Type": "call",
+                "Expiration": "12/20/2019",
+                "DataDate": "12/17/2019",
+                "Strike": "35.0",
+                "Last": "0.0",
+                "Bid": "0.0",
+                "Ask": "5.0",
+                "Volume": "0",
+                "OpenInterest": "0",
+                "IV": "10.0",
+                "Delta": "0.16",
+                "Gamma": "0.032",
+                "Theta": "-22.7",
+                "Vega": "0.2",
+                "AKA": "BAK_122019C35",
+            },
+        )
+        self.assertEqual(
+            [(i["Expiration"], i["IV"], i["Theta"]) for i in hod_data["chain"][1:]],
+            [("01/17/2020", "NaN", "NaN"), ("12/20/2019", "0.05", "-22.7")],
+        )
+        self.assertEqual(list(hod_data["chain"][2].keys())[-1], "AKA")
+
+    def test_hod_document_uses_typed_rows(self):
+        hod_data = hod_document(tos_to_columns(make_tos_chain(), "20191217"))
+        self.assertEqual(hod_data["schemaVersion"], HOD_SCHEMA_VERSION)
+        self.assertEqual(
+            hod_data["chain"][1],
+            {
+                "UnderlyingSymbol": "BAK",
+                "UnderlyingPrice": 7.145,
+                "Exchange": "OPR",
+                "OptionSymbol": "BAK_011720C40",
+                "OptionExt": "",
+                "Type": "call",
+                "Expiration": datetime(2020, 1, 17),
+                "DataDate": datetime(2019, 12, 17),
+                "Strike": 40.0,
+                "Last": 0.0,
+                "Bid": 0.0,
+                "Ask": 5.0,
+                "Volume": 0,
+                "OpenInterest": 0,
+                "IV": None,
+                "Delta": 0.16,
+                "Gamma": 0.032,
+                "Theta": None,
+                "Vega": 0.2,
+                "AKA": "BAK_011720C40",
+            },
+        )
+        self.assertEqual([type(i["Volume"]) for i in hod_data["chain"]], [int, int, int])
+
+    def test_typed_hod_row_matches_converted_string_row(self):
+        chain_columns = tos_to_columns(make_tos_chain(), "20191217")
+        self.assertEqual([typed_hod_row(i) for i in chain_columns.to_rows()], chain_columns.to_typed_rows())
+        self.assertEqual(
+            typed_hod_row({"Volume": "12", "IV": "", "Type": "put"}), {"Volume": 12, "IV": None, "Type": "put"}
+        )
+
+    def test_hod_csv_writer_writes_header_and_rows(self):
+        hod_data = tos_to_hod(make_tos_chain(), "20191217")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name, open_csv in [("options.csv", open), ("options.csv.gz", gzip.open)]:
+                csv_path = os.path.join(tmp_dir, name)
+                with HodCsvWriter(csv_path) as writer:
+                    writer.write(hod_data)
+                    writer.write(hod_data)
+                self.assertEqual(writer.rows, 6)
+                with open_csv(csv_path, "rt", newline="") as csv_file:
+                    reader = csv.DictReader(csv_file)
+                    self.assertEqual(reader.fieldnames, HOD_COLUMNS)
+                    self.assertEqual(list(reader), hod_data["chain"] * 2)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_hod_csv_writer_compresses_with_zstd(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "options.csv.zst")
+            with HodCsvWriter(csv_path, ["OptionSymbol"]) as writer:
+                writer.write(tos_to_hod(make_tos_chain(), "20191217"))
+            with open(csv_path, "rb") as csv_file:
+                text = zstandard.ZstdDecompressor().stream_reader(csv_file).read().decode()
+        self.assertEqual(text.split(), ["OptionSymbol", "BAK_122019C35", "BAK_011720C40", "BAK_122019P35"])
+
+
+if __name__ == "__main__":
+    unittest.main()
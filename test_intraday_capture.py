@@ -0,0 +1,71 @@
+"""Tests for intraday_capture module."""
+
+# Standard libraries
+import copy
+from datetime import datetime
+import unittest
+from unittest import mock
+
+# External dependencies
+from pymongo.errors import AutoReconnect
+
+# Application-specific imports
+from intraday_capture import IntradayCapture, is_market_open
+from options_data_downloader import BatchInserter
+from test_hod_chain import make_tos_chain
+
+
+class TestIntradayCapture(unittest.TestCase):
+    def test_only_changed_contracts_are_stored(self):
+        collection = mock.MagicMock()
+        collection.insert_many.side_effect = lambda documents, ordered: mock.MagicMock(inserted_ids=documents)
+        chains = {"BAK": make_tos_chain(), "FAILING": {}}
+        capture = IntradayCapture(lambda symbol: copy.deepcopy(chains[symbol]), BatchInserter(collection))
+
+        self.assertEqual(capture.snapshot(["BAK", "FAILING"], 2, datetime(2019, 12, 17, 10, 0, 0, 5)), ["FAILING"])
+        capture.snapshot(["BAK"], timestamp=datetime(2019, 12, 17, 10, 5))
+        chains["BAK"]["callExpDateMap"]["2019-12-20:3"]["35.0"][0]["bid"] = 0.05
+        del chains["BAK"]["putExpDateMap"]["2019-12-20:3"]
+        capture.snapshot(["BAK"], timestamp=datetime(2019, 12, 17, 10, 10))
+        capture.snapshot(["BAK"], timestamp=datetime(2019, 12, 18, 10, 0))
+
+        documents = [document for call in collection.insert_many.call_args_list for document in call[0][0]]
+        self.assertEqual(
+            [(i["timestamp"].hour, i["timestamp"].minute, i["dataDate"], i["full"]) for i in documents],
+            [(10, 0, "20191217", True), (10, 10, "20191217", False), (10, 0, "20191218", True)],
+        )
+        self.assertEqual(
+            [[j["OptionSymbol"] for j in i["chain"]] for i in documents],
+            [
+                ["BAK_122019C35", "BAK_011720C40", "BAK_122019P35"],
+                ["BAK_122019C35"],
+                ["BAK_122019C35", "BAK_011720C40"],
+            ],
+        )
+        self.assertEqual(documents[1]["chain"][0]["Bid"], 0.05)
+        self.assertEqual(documents[1]["removed"], ["BAK_122019P35"])
+
+    def test_failed_write_is_stored_again(self):
+        collection = mock.MagicMock()
+        collection.insert_many.side_effect = [AutoReconnect("connection reset"), mock.MagicMock(inserted_ids=[1])]
+        capture = IntradayCapture(lambda symbol: make_tos_chain(), BatchInserter(collection))
+
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(capture.snapshot(["BAK"], timestamp=datetime(2019, 12, 17, 10, 0)), ["BAK"])
+        self.assertEqual(capture.snapshot(["BAK"], timestamp=datetime(2019, 12, 17, 10, 5)), [])
+
+        documents = [call[0][0][0] for call in collection.insert_many.call_args_list]
+        self.assertEqual(
+            [(i["timestamp"].minute, i["full"], len(i["chain"])) for i in documents], [(0, True, 3), (5, True, 3)]
+        )
+        self.assertIn("BAK", capture.quotes)
+
+    def test_is_market_open(self):
+        self.assertFalse(is_market_open(datetime(2019, 12, 17, 9, 29)))
+        self.assertTrue(is_market_open(datetime(2019, 12, 17, 9, 30)))
+        self.assertFalse(is_market_open(datetime(2019, 12, 17, 16, 0)))
+        self.assertFalse(is_market_open(datetime(2019, 12, 21, 12, 0)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for mock_broker_server module."""
+
+# Standard libraries
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+# External dependencies
+
+# Application-specific imports
+from mock_broker_server import CHAINS_PATH, SYMBOLS_PATH, MockBrokerServer
+from options_data_downloader import OptionsDataDownloader
+from symbol_universe import get_cboe_symbols
+from run_metrics import METRICS
+from test_hod_chain import make_tos_chain
+
+
+class TestMockBrokerServer(unittest.TestCase):
+    def start_server(self, faults=None, replay_dir=None) -> OptionsDataDownloader:
+        server = MockBrokerServer(faults=faults, replay_dir=replay_dir, chain_size=(2, 3))
+        server.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server  # pylint: disable=attribute-defined-outside-init
+        downloader = OptionsDataDownloader(requests_per_minute=60000)
+        downloader.api_url = server.url + CHAINS_PATH
+        return downloader
+
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_serves_synthetic_chains_and_symbols(self):
+        downloader = self.start_server()
+        data = downloader.get_option_chain_from_broker("AAPL")
+        self.assertEqual((data["symbol"], data["status"], data["numberOfContracts"]), ("AAPL", "SUCCESS", 12))
+        self.assertEqual(data, downloader.get_option_chain_from_broker("AAPL"))
+        self.assertEqual(downloader.get_option_chain_from_broker("$AAPL.X")["status"], "FAILED")
+        symbols = get_cboe_symbols(self.server.url + SYMBOLS_PATH)
+        self.assertEqual(symbols[:2], ["SYM0", "SYM1"])
+        self.assertIn("SYM" + str(self.server.universe_size - 1), symbols)
+
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_replays_recorded_chains(self):
+        with tempfile.TemporaryDirectory() as replay_dir:
+            with open(os.path.join(replay_dir, "$BAK.X_20200102_data.pkl"), "wb") as p_data:
+                pickle.dump(dict(make_tos_chain(), status="SUCCESS"), p_data)
+            downloader = self.start_server(replay_dir=replay_dir)
+        data = downloader.get_option_chain_from_broker("$BAK.X")
+        self.assertEqual(data, dict(make_tos_chain(), status="SUCCESS"))
+
+    @mock.patch.object(OptionsDataDownloader, "back_off", return_value=True)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_injected_faults_are_retried(self, mock_back_off):  # pylint: disable=W0613
+        for fault, counter in [
+            ("rate_limited", "fetch_rate_limited"),
+            ("malformed", "fetch_invalid_json"),
+            ("reset", "fetch_connection_errors"),
+        ]:
+            METRICS.reset()
+            downloader = self.start_server({fault: 1.0})
+            self.assertEqual(downloader.get_option_chain_from_broker("AAPL", retries=3), {})
+            self.assertEqual(METRICS.report()["counters"][counter], 3)
+            self.assertEqual(self.server.stats, {fault: 3})
+
+    @mock.patch.object(OptionsDataDownloader, "back_off", return_value=True)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_server_side_rate_limit(self, mock_back_off):
+        downloader = self.start_server({"requests_per_minute": 2})
+        self.assertEqual(downloader.get_option_chain_from_broker("AAPL")["status"], "SUCCESS")
+        self.assertEqual(downloader.get_option_chain_from_broker("MSFT")["status"], "SUCCESS")
+        self.assertEqual(downloader.get_option_chain_from_broker("IBM", retries=2), {})
+        self.assertEqual(self.server.stats, {"ok": 2, "rate_limited": 2})
+        self.assertGreater(mock_back_off.call_args[0][2], 59)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for option_greeks module."""
+
+# Standard libraries
+from datetime import datetime
+import unittest
+from unittest import mock
+
+# External dependencies
+import numpy as np
+
+# Application-specific imports
+from hod_chain import hod_document, tos_to_columns
+from option_greeks import GreeksModel, black_scholes_greeks, black_scholes_price, implied_volatility
+from test_hod_chain import make_tos_chain
+
+
+def make_contracts(strikes: list, is_call: list) -> dict:
+    return {
+        "spot": np.full(len(strikes), 100.0),
+        "strike": np.array(strikes, dtype=np.float64),
+        "years": np.ones(len(strikes)),
+        "is_call": np.array(is_call),
+    }
+
+
+class TestOptionGreeks(unittest.TestCase):
+    def test_black_scholes_reference_values(self):
+        contracts = make_contracts([100, 100], [True, False])
+        sigma = np.array([0.2, 0.2])
+        np.testing.assert_allclose(black_scholes_price(contracts, sigma, (0.05, 0.0)), [10.4506, 5.5735], atol=1e-4)
+        greeks = black_scholes_greeks(contracts, sigma, (0.05, 0.0))
+        np.testing.assert_allclose(greeks["Delta"], [0.6368, -0.3632], atol=1e-4)
+        np.testing.assert_allclose(greeks["Gamma"], [0.01876, 0.01876], atol=1e-5)
+        np.testing.assert_allclose(greeks["Vega"], [37.524, 37.524], atol=1e-3)
+        np.testing.assert_allclose(greeks["Theta"] * 365 / 100, [-6.414, -1.658], atol=1e-3)
+
+    def test_implied_volatility_round_trip(self):
+        contracts = make_contracts([60, 90, 100, 120, 150, 100, 100], [True, False, True, False, True, True, True])
+        sigma = np.array([0.15, 0.3, 0.45, 0.8, 1.2, 0.2, 0.2])
+        rates = (0.02, 0.015)
+        prices = black_scholes_price(contracts, sigma, rates)
+        prices[-2:] = [0.01, 98.4]
+        solved = implied_volatility(contracts, prices, rates)
+        np.testing.assert_allclose(solved[:-2], sigma[:-2], atol=1e-6)
+        self.assertTrue(np.isnan(solved[-2:]).all())
+
+    def test_fill_chain_only_fills_missing_values(self):
+        tos_data = make_tos_chain()
+        tos_data["callExpDateMap"]["2020-01-17:31"]["40.0"][0].update(bid=0.1, ask=0.3)
+        chain_columns = tos_to_columns(tos_data, "20191217")
+        iv_before = chain_columns.columns["IV"].copy()
+        self.assertEqual(GreeksModel(0.0).fill_chain(chain_columns), 1)
+        self.assertEqual(chain_columns.columns["IV"][[0, 2]].tolist(), iv_before[[0, 2]].tolist())
+        self.assertFalse(np.isnan(chain_columns.columns["Theta"]).any())
+        contracts = make_contracts([40], [True])
+        contracts["spot"][0], contracts["years"][0] = 7.145, 31 / 365
+        price = black_scholes_price(contracts, chain_columns.columns["IV"][[1]], (0.0, 0.0))
+        self.assertAlmostEqual(price[0], 0.2, 6)
+
+    def test_backfill(self):
+        tos_data = make_tos_chain()
+        tos_data["callExpDateMap"]["2020-01-17:31"]["40.0"][0].update(bid=0.1, ask=0.3)
+        document = hod_document(tos_to_columns(tos_data, "20191217"))
+        document["_id"] = 1
+        self.assertIsNone(document["chain"][1]["IV"])
+        collection = mock.MagicMock()
+        collection.find.return_value = [document]
+        collection.bulk_write.return_value = mock.MagicMock(modified_count=1)
+        self.assertEqual(GreeksModel().backfill(collection), 1)
+        chain = collection.bulk_write.call_args[0][0][0]._doc["$set"]["chain"]  # pylint: disable=protected-access
+        self.assertIsInstance(chain[1]["IV"], float)
+        self.assertEqual(chain[1]["IV"], round(chain[1]["IV"], 2))
+        self.assertEqual((chain[1]["Expiration"], chain[0]["IV"]), (datetime(2020, 1, 17), 10.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,26 +1,40 @@
 """Tests for OptionsDataDownloader module."""
 
 # Standard libraries
+import json
+import pickle
+import queue
 import unittest
 from unittest import mock
 import os
+import tempfile
 from requests import Session
 
 # External dependencies
+from pymongo.errors import BulkWriteError
 
 # Application-specific imports
+from run_metrics import METRICS
+from test_hod_chain import make_tos_chain
 from options_data_downloader import (
+    BatchInserter,
     OptionsDataDownloader,
+    TokenBucket,
+    get_downloaded_symbols,
+    iterate_csv_chains,
     TOS_OPTION_CHAIN_API_URL,
     replace_dots_in_keys,
 )
+from symbol_universe import SymbolSet, SymbolUniverse
 
 
 def mocked_session_get(*args, **kwargs):  # pylint: disable=W0613
     class MockResponse:
-        def __init__(self, json_data, status_code):
+        def __init__(self, json_data, status_code, headers=None):
             self.json_data = json_data
+            self.content = json.dumps(json_data).encode()
             self.status_code = status_code
+            self.headers = headers if headers else {}
 
         def json(self):
             return self.json_data
@@ -30,6 +44,12 @@ def mocked_session_get(*args, **kwargs):  # pylint: disable=W0613
 
     if "NO_STATUS_NO_ERROR" in args[0]:
         return MockResponse({"weird": "dict"}, 200)
+    if "RATE_LIMITED" in args[0]:
+        return MockResponse({"error": "transactions per seconds restriction reached"}, 429, {"Retry-After": "3"})
+    if "BAD_REQUEST" in args[0]:
+        return MockResponse({"error": "Bad request"}, 400)
+    if "FAILING" in args[0]:
+        return MockResponse({"status": "FAILED"}, 200)
     if args[0].startswith(TOS_OPTION_CHAIN_API_URL):
         return MockResponse({"status": "PASSED"}, 200)
     return MockResponse(None, 404)
@@ -43,6 +63,8 @@ class TestOptionsDataDownloader(unittest.TestCase):
         json_data = downloader.get_option_chain_from_broker("TSLA")
         self.assertEqual(json_data, {"status": "PASSED"})
         self.assertEqual(len(mock_get.call_args_list), 1)
+        adapter = OptionsDataDownloader(workers=32).session.get_adapter(TOS_OPTION_CHAIN_API_URL)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw["maxsize"], 32)
 
     @mock.patch.object(Session, "get", side_effect=mocked_session_get)
     @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
@@ -54,6 +76,263 @@ class TestOptionsDataDownloader(unittest.TestCase):
         self.assertEqual(json_data, {})
         self.assertEqual(len(mock_get.call_args_list), 1)
 
+    @mock.patch("options_data_downloader.TokenBucket.pause")
+    @mock.patch.object(Session, "get", side_effect=mocked_session_get)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_get_option_chain_from_broker_records_metrics(self, mock_get, mock_pause):  # pylint: disable=W0613
+        METRICS.reset()
+        downloader = OptionsDataDownloader(requests_per_minute=60000)
+        downloader.get_option_chain_from_broker("TSLA")
+        downloader.get_option_chain_from_broker("RATE_LIMITED", retries=2)
+        report = METRICS.report()
+        self.assertEqual(report["counters"]["fetch_requests"], 3)
+        self.assertEqual(report["counters"]["fetch_rate_limited"], 2)
+        self.assertEqual(report["counters"]["fetch_retries"], 1)
+        self.assertEqual(report["histograms"]["fetch_seconds"]["count"], 3)
+        self.assertEqual(report["symbols"]["TSLA"]["requests"], 1)
+        self.assertEqual(report["symbols"]["TSLA"]["bytes"], len(b'{"status": "PASSED"}'))
+
+    @mock.patch("options_data_downloader.TokenBucket.pause")
+    @mock.patch.object(Session, "get", side_effect=mocked_session_get)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_get_option_chain_from_broker_honors_retry_after(self, mock_get, mock_pause):
+        downloader = OptionsDataDownloader()
+        json_data = downloader.get_option_chain_from_broker("RATE_LIMITED", retries=3)
+        self.assertEqual(json_data, {})
+        self.assertEqual(len(mock_get.call_args_list), 3)
+        self.assertEqual(mock_pause.call_args_list, [mock.call(3.0), mock.call(3.0)])
+
+    @mock.patch.object(Session, "get", side_effect=mocked_session_get)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_get_option_chain_from_broker_does_not_retry_bad_symbol(self, mock_get):
+        downloader = OptionsDataDownloader()
+        json_data = downloader.get_option_chain_from_broker("BAD_REQUEST")
+        self.assertEqual(json_data, {})
+        self.assertEqual(len(mock_get.call_args_list), 1)
+
+    @mock.patch("options_data_downloader.TokenBucket.acquire")
+    @mock.patch("options_data_downloader.time.sleep")
+    @mock.patch.object(Session, "get", side_effect=mocked_session_get)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_get_option_chain_from_broker_stops_when_retry_budget_is_spent(
+        self, mock_get, mock_sleep, mock_acquire
+    ):  # pylint: disable=W0613
+        downloader = OptionsDataDownloader(retry_budget=2)
+        with self.assertLogs(level="ERROR"):
+            json_data = downloader.get_option_chain_from_broker("NO_STATUS_NO_ERROR", retries=10)
+        self.assertEqual(json_data, {})
+        self.assertEqual(len(mock_get.call_args_list), 3)
+        self.assertEqual(len(mock_sleep.call_args_list), 2)
+        downloader.retry_budget.reset()
+        self.assertEqual(downloader.retry_budget.remaining, 2)
+
+    @mock.patch.object(Session, "get", side_effect=mocked_session_get)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_get_and_pickle_data_concurrently(self, mock_get):
+        symbols = ["AAPL", "FAILING", "MSFT", "SPX"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            downloader = OptionsDataDownloader(workers=4, requests_per_minute=60000)
+            failed_symbols = downloader.get_and_pickle_data(symbols, tmp_dir + "/")
+            day_dir = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+            pickled = sorted(i.split("_")[0] for i in os.listdir(day_dir))
+        self.assertEqual(failed_symbols, ["FAILING"])
+        self.assertEqual(pickled, ["AAPL", "MSFT", "SPX"])
+        self.assertEqual(len(mock_get.call_args_list), 5)
+        self.assertTrue(any("symbol=$FAILING.X" in call[0][0] for call in mock_get.call_args_list))
+
+    @mock.patch.object(Session, "get", side_effect=mocked_session_get)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_get_and_pickle_data_skips_exact_symbols_only(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            downloader = OptionsDataDownloader()
+            downloader.get_and_pickle_data(["BF.B"], tmp_dir + "/")
+            self.assertEqual(len(mock_get.call_args_list), 1)
+            downloader.get_and_pickle_data(["BF", "BF.B"], tmp_dir + "/")
+            self.assertEqual(len(mock_get.call_args_list), 2)
+            self.assertTrue(mock_get.call_args[0][0].endswith("symbol=BF&includeQuotes=TRUE"))
+            day_dir = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+            self.assertEqual(get_downloaded_symbols(day_dir), {"BF", "BF.B"})
+
+    @mock.patch("symbol_scheduler.SCHEDULER_RETRY_DELAY", 0)
+    @mock.patch("options_data_downloader.MANDATORY_SYMBOLS", ["AAPL", "MSFT"])
+    @mock.patch.object(SymbolUniverse, "load", return_value=SymbolSet(["ZZZ", "AAPL"]))
+    @mock.patch.object(OptionsDataDownloader, "get_symbols_in_db", return_value=["OLD", "SPY"])
+    @mock.patch(
+        "options_data_downloader.query_symbol_activity", return_value={"SPY": {"volume": 1, "contracts": 1}}
+    )
+    @mock.patch.object(OptionsDataDownloader, "get_option_chain_with_fallback")
+    def test_get_todays_data_fetches_mandatory_symbols_first(self, mock_fetch, *mocks):  # pylint: disable=W0613
+        mock_fetch.side_effect = lambda symbol, params: {} if symbol in ["OLD", "MSFT"] else {"symbol": symbol}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            downloader = OptionsDataDownloader()
+            downloader.db_handle = mock.MagicMock()
+            with self.assertLogs(level="ERROR") as logs:
+                downloader.get_todays_data(tmp_dir + "/")
+            day_dir = [os.path.join(tmp_dir, i) for i in os.listdir(tmp_dir) if not i.endswith(".json")][0]
+            self.assertEqual(get_downloaded_symbols(day_dir), {"AAPL", "SPY", "ZZZ"})
+        fetched = [call[0][0] for call in mock_fetch.call_args_list]
+        self.assertEqual(fetched, ["AAPL", "MSFT"] + ["MSFT"] * 7 + ["SPY", "OLD", "OLD", "ZZZ"])
+        self.assertIn("COULD NOT GET THESE MANDATORY SYMBOLS: ['MSFT']", logs.output[1])
+        self.assertEqual(METRICS.report()["counters"]["mandatory_symbols_missing"], 1)
+
+    @mock.patch.object(Session, "get", side_effect=mocked_session_get)
+    @mock.patch.dict(os.environ, {"TOS_API_KEY": "dUmmYkEy"})
+    def test_get_option_chain_from_broker_with_narrowed_query(self, mock_get):
+        downloader = OptionsDataDownloader()
+        downloader.get_option_chain_with_fallback("TSLA", {"includeQuotes": "FALSE", "strikeCount": 20})
+        self.assertTrue(mock_get.call_args[0][0].endswith("symbol=TSLA&includeQuotes=FALSE&strikeCount=20"))
+
+    @mock.patch("options_data_downloader.time.sleep")
+    def test_token_bucket_waits_when_empty(self, mock_sleep):
+        bucket = TokenBucket(requests_per_minute=60, capacity=1)
+        bucket.acquire()
+        mock_sleep.side_effect = lambda seconds: setattr(bucket, "tokens", 1.0)
+        bucket.acquire()
+        self.assertEqual(len(mock_sleep.call_args_list), 1)
+        self.assertGreater(mock_sleep.call_args[0][0], 0)
+
+    def test_batch_inserter_reports_duplicates(self):
+        collection = mock.MagicMock()
+        collection.insert_many.side_effect = [
+            mock.MagicMock(inserted_ids=[1, 2]),
+            BulkWriteError(
+                {"nInserted": 0, "writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000 duplicate key"}]}
+            ),
+        ]
+        inserter = BatchInserter(collection, batch_size=2)
+        for symbol in ["A", "B", "C"]:
+            inserter.add({"symbol": symbol, "dataDate": "20200102"})
+        with self.assertLogs() as logs:
+            inserter.flush()
+        self.assertEqual(logs.output, ["INFO:root:Document for C from 20200102 already in DB"])
+        self.assertEqual(inserter.inserted, 2)
+        self.assertEqual(inserter.duplicates, 1)
+        self.assertEqual(len(collection.insert_many.call_args_list), 2)
+        self.assertEqual(collection.insert_many.call_args[1], {"ordered": False})
+
+    def test_batch_inserter_raises_other_write_errors(self):
+        collection = mock.MagicMock()
+        collection.insert_many.side_effect = BulkWriteError(
+            {"nInserted": 0, "writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]}
+        )
+        inserter = BatchInserter(collection)
+        inserter.add({"symbol": "A", "dataDate": "20200102"})
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(BulkWriteError):
+                inserter.flush()
+
+    def test_csv_to_db_inserts_one_document_per_symbol(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "L2_options_20200102.csv")
+            with open(csv_path, "w") as csv_file:
+                csv_file.write("UnderlyingSymbol,DataDate,Strike\n")
+                csv_file.write("AAPL,01/02/2020,300\nAAPL,01/02/2020,305\nMSFT,01/02/2020,160\n")
+            downloader = OptionsDataDownloader()
+            downloader.db_handle = mock.MagicMock()
+            downloader.csv_to_db(csv_path, batch_size=1)
+        insert_many = downloader.db_handle.options_data.insert_many
+        documents = [call[0][0][0] for call in insert_many.call_args_list]
+        self.assertEqual(
+            [(i["symbol"], i["dataDate"], len(i["chain"])) for i in documents],
+            [("AAPL", "20200102", 2), ("MSFT", "20200102", 1)],
+        )
+
+    def test_backfill_csv_folders_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for folder, date in [("L2_2020_01", "01/02/2020"), ("L2_2020_02", "02/03/2020")]:
+                os.mkdir(os.path.join(tmp_dir, folder))
+                with open(os.path.join(tmp_dir, folder, "L2_options_" + folder + ".csv"), "w") as csv_file:
+                    csv_file.write("UnderlyingSymbol,DataDate,Strike\n")
+                    csv_file.write("AAPL," + date + ",300\nMSFT," + date + ",160\n")
+            downloader = OptionsDataDownloader()
+            downloader.db_handle = mock.MagicMock()
+            downloader.backfill_csv_folders("L2_2020", starting_path=tmp_dir, processes=2)
+            insert_many = downloader.db_handle.options_data.insert_many
+            documents = [document for call in insert_many.call_args_list for document in call[0][0]]
+            self.assertEqual(
+                sorted((i["symbol"], i["dataDate"]) for i in documents),
+                [("AAPL", "20200102"), ("AAPL", "20200203"), ("MSFT", "20200102"), ("MSFT", "20200203")],
+            )
+            with open(os.path.join(tmp_dir, "L2_2020.checkpoint")) as checkpoint:
+                self.assertEqual(len(checkpoint.readlines()), 2)
+            insert_many.reset_mock()
+            downloader.backfill_csv_folders("L2_2020", starting_path=tmp_dir, processes=2)
+            self.assertEqual(insert_many.call_args_list, [])
+
+            # A killed worker fails the run instead of leaving it waiting for documents that never come
+            killed = mock.MagicMock(exitcode=-9, **{"is_alive.return_value": False})
+            with mock.patch("options_data_downloader.BACKFILL_QUEUE_TIMEOUT", 0.01):
+                with self.assertRaises(RuntimeError):
+                    downloader.write_backfill_documents(queue.Queue(), os.path.join(tmp_dir, "killed"), [killed])
+            killed.terminate.assert_called_once()
+
+    def test_migrate_to_typed_schema(self):
+        downloader = OptionsDataDownloader()
+        downloader.db_handle = mock.MagicMock()
+        options_data = downloader.db_handle.options_data
+        options_data.find.return_value = [
+            {"_id": i, "chain": [{"UnderlyingSymbol": "A", "Strike": "35.0", "Volume": "3", "Theta": "NaN"}]}
+            for i in range(3)
+        ]
+        options_data.bulk_write.return_value = mock.MagicMock(modified_count=2)
+        downloader.migrate_to_typed_schema(batch_size=2)
+        self.assertEqual(options_data.find.call_args[0][0], {"schemaVersion": {"$exists": False}})
+        updates = [update for call in options_data.bulk_write.call_args_list for update in call[0][0]]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(
+            updates[0]._doc["$set"]["chain"],  # pylint: disable=protected-access
+            [{"UnderlyingSymbol": "A", "Strike": 35.0, "Volume": 3, "Theta": None}],
+        )
+
+    def test_pickles_to_archive_and_archive_to_db(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            day_dir = os.path.join(tmp_dir, "20191217")
+            os.mkdir(day_dir)
+            for symbol in ["$BAK.X", "BF.B"]:
+                tos_data = dict(make_tos_chain(), symbol=symbol)
+                with open(os.path.join(day_dir, symbol + "_20191217_data.pkl"), "wb") as p_data:
+                    pickle.dump(tos_data, p_data)
+            downloader = OptionsDataDownloader()
+            downloader.db_handle = mock.MagicMock()
+            archive_path = downloader.pickles_to_archive(day_dir + "/")
+            self.assertEqual(archive_path, day_dir + ".chains")
+            downloader.archive_to_db(archive_path)
+        documents = downloader.db_handle.options_data.insert_many.call_args[0][0]
+        self.assertEqual(
+            [(i["symbol"], i["dataDate"], len(i["chain"])) for i in documents],
+            [("BAK", "20191217", 3), ("BF.B", "20191217", 3)],
+        )
+
+    def test_pickle_to_db_streams_csv_export(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            day_dir = os.path.join(tmp_dir, "20191217")
+            os.mkdir(day_dir)
+            with open(os.path.join(day_dir, "BAK_20191217_data.pkl"), "wb") as p_data:
+                pickle.dump(make_tos_chain(), p_data)
+            downloader = OptionsDataDownloader()
+            downloader.db_handle = mock.MagicMock()
+            downloader.pickle_to_db(day_dir, csv_path=os.path.join(tmp_dir, "options.csv"))
+            with open(os.path.join(tmp_dir, "options.csv")) as csv_file:
+                lines = csv_file.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith("UnderlyingSymbol,UnderlyingPrice,"))
+        documents = downloader.db_handle.options_data.insert_many.call_args[0][0]
+        self.assertEqual([(i["symbol"], i["schemaVersion"]) for i in documents], [("BAK", 2)])
+
+    def test_iterate_csv_chains_groups_sorted_and_unsorted_files(self):
+        rows = ["MSFT,160", "AAPL,300", "MSFT,165", "BF.B,40", "AAPL,305"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name, lines in [("sorted.csv", sorted(rows, key=lambda i: i[:4])), ("unsorted.csv", rows)]:
+                csv_path = os.path.join(tmp_dir, name)
+                with open(csv_path, "w") as csv_file:
+                    csv_file.write("\n".join(["UnderlyingSymbol,Strike"] + lines) + "\n")
+                chains = [
+                    (symbol, [row["Strike"] for row in chain])
+                    for symbol, chain in iterate_csv_chains(csv_path, ["AAPL", "MSFT"], chunk_rows=2)
+                ]
+                self.assertEqual(chains, [("AAPL", ["300", "305"]), ("MSFT", ["160", "165"])])
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["sorted.csv", "unsorted.csv"])
+
     def test_replace_dots_in_keys(self):
         dict_1 = {"key.1": "value1"}
         expt_1 = {"key,1": "value1"}
@@ -0,0 +1,73 @@
+"""Tests for raw_archive module."""
+
+# Standard libraries
+import os
+import pickle
+import tempfile
+import unittest
+
+# External dependencies
+
+# Application-specific imports
+from benchmark_options_data import make_synthetic_tos_chain
+from raw_archive import (
+    RAW_DICTIONARY_MIN_SAMPLES,
+    RawArchive,
+    RawArchiveWriter,
+    dictionary_samples,
+    encode_chain,
+    pickles_to_raw_archive,
+)
+from test_hod_chain import make_tos_chain
+
+
+def write_day_folder(folder: str, chains: dict):
+    os.makedirs(folder)
+    for symbol, tos_data in chains.items():
+        with open(os.path.join(folder, symbol + "_" + os.path.basename(folder) + "_data.pkl"), "wb") as p_data:
+            pickle.dump(tos_data, p_data)
+
+
+class TestRawArchive(unittest.TestCase):
+    def test_identical_responses_are_stored_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = RawArchive(os.path.join(tmp_dir, "raw"))
+            chain = make_tos_chain()
+            with RawArchiveWriter(archive, "20191217") as writer:
+                self.assertFalse(writer.add("BAK", encode_chain(chain)))
+                self.assertTrue(writer.add("BAK.X", encode_chain(chain)))
+            with RawArchiveWriter(archive, "20191218") as writer:
+                self.assertTrue(writer.add("BAK", encode_chain(chain)))
+                self.assertFalse(writer.add("BF.B", encode_chain(dict(chain, symbol="BF.B"))))
+            with self.assertRaises(ValueError):
+                RawArchiveWriter(archive, "20191218")
+
+            archive = RawArchive(os.path.join(tmp_dir, "raw"))
+            self.assertEqual(archive.dates(), ["20191217", "20191218"])
+            self.assertEqual(archive.symbols("20191218"), ["BAK", "BF.B"])
+            self.assertEqual(archive.load("20191218", "BAK"), chain)
+            self.assertEqual(archive.load("20191218", "BF.B")["symbol"], "BF.B")
+            self.assertEqual(archive.day_index("20191218")["symbols"]["BAK"][0], "20191217")
+            self.assertEqual(len(archive.blob_locations()), 2)
+
+    def test_pickles_to_raw_archive_with_dictionary(self):
+        chains = {
+            "S" + str(i): make_synthetic_tos_chain("S" + str(i), 2, 4, i) for i in range(RAW_DICTIONARY_MIN_SAMPLES)
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            folder = os.path.join(tmp_dir, "20200102")
+            write_day_folder(folder, chains)
+            pkls = sorted(os.listdir(folder))
+            self.assertEqual(len(dictionary_samples(folder, pkls)), len(chains))
+            self.assertEqual(dictionary_samples(folder, pkls, 1), [encode_chain(chains["S0"])])
+            root = os.path.join(tmp_dir, "raw")
+            self.assertEqual(pickles_to_raw_archive(folder + "/", root, remove_pickles=True), len(chains))
+            self.assertEqual(os.listdir(folder), [])
+            archive = RawArchive(root)
+            self.assertIsNotNone(archive.dictionary())
+            self.assertTrue(archive.day_index("20200102")["dictionary"])
+            self.assertEqual(archive.load("20200102", "S3"), chains["S3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""Tests for run_metrics module."""
+
+# Standard libraries
+import json
+import os
+import tempfile
+import unittest
+
+# External dependencies
+
+# Application-specific imports
+from run_metrics import Histogram, RunMetrics
+
+
+class TestRunMetrics(unittest.TestCase):
+    def test_histogram_quantiles(self):
+        histogram = Histogram([0.1, 1, 10])
+        for value in [0.05, 0.05, 0.5, 5, 50]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual((histogram.quantile(0.4), histogram.quantile(0.6), histogram.quantile(1.0)), (0.1, 1, 50))
+        self.assertEqual(histogram.to_dict()["buckets"], {"0.1": 2, "1": 1, "10": 1, "+Inf": 1})
+
+    def test_report_and_prometheus_output(self):
+        metrics = RunMetrics()
+        metrics.increment("fetch_requests", 2)
+        metrics.observe("fetch_seconds", 0.2)
+        with metrics.timer("convert_seconds"):
+            pass
+        metrics.add_symbol_values("AAPL", seconds=0.5, bytes=100)
+        metrics.add_symbol_values("AAPL", seconds=0.25, bytes=50)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metrics.write_report(os.path.join(tmp_dir, "report.json"))
+            with open(os.path.join(tmp_dir, "report.json")) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(report["counters"], {"fetch_requests": 2})
+        self.assertEqual(report["symbols"], {"AAPL": {"seconds": 0.75, "bytes": 150}})
+        self.assertEqual(report["histograms"]["convert_seconds"]["count"], 1)
+        prometheus_lines = metrics.to_prometheus().splitlines()
+        self.assertIn("options_data_fetch_requests_total 2", prometheus_lines)
+        self.assertIn('options_data_fetch_seconds_bucket{le="0.25"} 1', prometheus_lines)
+        self.assertIn('options_data_fetch_seconds_bucket{le="+Inf"} 1', prometheus_lines)
+        self.assertIn("options_data_fetch_seconds_count 1", prometheus_lines)
+        metrics.reset()
+        self.assertEqual(metrics.report()["counters"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests for symbol_scheduler module."""
+
+# Standard libraries
+from datetime import datetime, timedelta
+import unittest
+from unittest import mock
+
+# External dependencies
+
+# Application-specific imports
+from symbol_scheduler import SymbolScheduler
+
+
+class TestSymbolScheduler(unittest.TestCase):
+    @mock.patch("symbol_scheduler.SCHEDULER_RETRY_DELAY", 0)
+    def test_failures_are_retried_at_their_priority(self):
+        fetched = []
+
+        def fetch_symbol(symbol):
+            fetched.append(symbol)
+            return symbol != "D" and (symbol != "B" or fetched.count("B") > 1)
+
+        scheduler = SymbolScheduler(fetch_symbol)
+        scheduler.add(["A", "B"], attempts=3)
+        scheduler.add(["C", "A", "D"])
+        self.assertEqual(scheduler.run(), ["D"])
+        self.assertEqual(fetched, ["A", "B", "B", "C", "D"])
+
+    def test_retries_wait_for_backoff(self):
+        fetched = []
+        scheduler = SymbolScheduler(lambda symbol: fetched.append(symbol) or symbol != "A")
+        scheduler.add(["A"], attempts=2)
+        scheduler.add(["B", "C"])
+        self.assertEqual(scheduler.run(workers=2, deadline=datetime.now() + timedelta(seconds=0.2)), ["A"])
+        self.assertEqual(fetched, ["A", "B", "C"])
+
+    @mock.patch("symbol_scheduler.SCHEDULER_RETRY_DELAY", 0)
+    def test_exceptions_count_as_failures(self):
+        fetched = []
+
+        def fetch_symbol(symbol):
+            fetched.append(symbol)
+            if symbol == "A":
+                raise ValueError("malformed chain")
+            return True
+
+        scheduler = SymbolScheduler(fetch_symbol)
+        scheduler.add(["A", "B"], attempts=2)
+        with self.assertLogs(level="ERROR") as logs:
+            self.assertEqual(scheduler.run(), ["A"])
+        self.assertEqual(fetched, ["A", "A", "B"])
+        self.assertEqual(len(logs.output), 2)
+        self.assertNotIn("Deadline", "".join(logs.output))
+
+    def test_nothing_is_fetched_after_the_deadline(self):
+        fetch_symbol = mock.MagicMock(return_value=True)
+        scheduler = SymbolScheduler(fetch_symbol)
+        scheduler.add(["A", "B"], attempts=8)
+        self.assertEqual(scheduler.run(workers=4, deadline=datetime.now() - timedelta(seconds=1)), ["A", "B"])
+        fetch_symbol.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Tests for symbol_universe module."""
+
+# Standard libraries
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# External dependencies
+import requests
+
+# Application-specific imports
+from symbol_universe import SymbolSet, SymbolUniverse, get_cboe_symbols
+
+
+def mocked_cboe_get(symbols: list):
+    rows = ["Optionable symbols"]
+    rows.extend('"Company","' + symbol + '","DPM","1/1"' for symbol in symbols)
+    return mock.MagicMock(text="\n".join(rows))
+
+
+class TestSymbolSet(unittest.TestCase):
+    def test_membership_and_diff(self):
+        symbols = SymbolSet(["SPY", "AAPL", "BF.B", "AAPL"])
+        self.assertEqual(list(symbols), ["AAPL", "BF.B", "SPY"])
+        self.assertIn("BF.B", symbols)
+        self.assertNotIn("BF", symbols)
+        self.assertNotIn("ZZZ", symbols)
+        self.assertEqual(symbols.diff(SymbolSet(["AAPL", "QQQ"])), {"added": ["BF.B", "SPY"], "removed": ["QQQ"]})
+
+
+class TestSymbolUniverse(unittest.TestCase):
+    @mock.patch("symbol_universe.CBOE_MINIMUM_SYMBOLS", 2)
+    @mock.patch("requests.get")
+    def test_load_caches_versions_and_reports_diffs(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            universe = SymbolUniverse(cache_dir=tmp_dir)
+            mock_get.return_value = mocked_cboe_get(["SPY", "AAPL"])
+            self.assertEqual(list(universe.load()), ["AAPL", "SPY"])
+            self.assertEqual(list(universe.load()), ["AAPL", "SPY"])
+            self.assertEqual(mock_get.call_count, 1)
+
+            first_version = universe.versions()[0]
+            os.utime(first_version, (0, 0))
+            universe.load()
+            self.assertEqual(universe.versions(), [first_version])
+            self.assertGreater(os.path.getmtime(first_version), time.time() - 60)
+
+            mock_get.return_value = mocked_cboe_get(["SPY", "QQQ"])
+            with mock.patch("symbol_universe.datetime") as mock_datetime:
+                mock_datetime.now.return_value.strftime.return_value = "29991231000000"
+                self.assertEqual(list(universe.load(refresh=True)), ["QQQ", "SPY"])
+            self.assertEqual(len(universe.versions()), 2)
+            with open(os.path.join(tmp_dir, "symbols_29991231000000.diff.json")) as diff_file:
+                diff = json.load(diff_file)
+            self.assertEqual((diff["added"], diff["removed"], diff["previous"]), (["QQQ"], ["AAPL"], first_version))
+
+            mock_get.side_effect = requests.exceptions.ConnectionError()
+            with self.assertLogs(level="ERROR"):
+                self.assertEqual(list(universe.load(refresh=True)), ["QQQ", "SPY"])
+
+    @mock.patch("requests.get", return_value=mocked_cboe_get(["SPY", "AAPL"]))
+    def test_too_few_symbols_is_an_error(self, _):
+        with self.assertRaises(ValueError):
+            get_cboe_symbols()
+        with self.assertRaises(ValueError):
+            SymbolUniverse().load()
+
+
+if __name__ == "__main__":
+    unittest.main()